@@ -3,6 +3,7 @@ package handler
 import (
 	"context"
 	"encoding/json"
+	"errors"
 	"fmt"
 	"net/http"
 	"projekt-splazh/pkg/crawl"
@@ -89,6 +90,10 @@ func Crawl(w http.ResponseWriter, r *http.Request) {
 		}
 
 		if err := service.Create(r.Context(), req.ProjectId); err != nil {
+			if errors.Is(err, crawl.ErrCrawlQueued) {
+				http.Error(w, "A crawl is already queued or running", http.StatusConflict)
+				return
+			}
 			http.Error(w, "Failed to add to crawl queue", http.StatusInternalServerError)
 			fmt.Println(err)
 			return
@@ -97,6 +102,26 @@ func Crawl(w http.ResponseWriter, r *http.Request) {
 		w.Header().Set("Content-Type", "application/json")
 		fmt.Fprintf(w, "{}")
 
+	case "DELETE":
+		// Cancel a queued or running crawl
+		var req struct {
+			ProjectId int `json:"projectId"`
+		}
+		if err := json.NewDecoder(r.Body).Decode(&req); err != nil {
+			http.Error(w, "Invalid request body", http.StatusBadRequest)
+			fmt.Println(err)
+			return
+		}
+
+		if err := service.Cancel(r.Context(), req.ProjectId); err != nil {
+			http.Error(w, "Failed to cancel crawl", http.StatusInternalServerError)
+			fmt.Println(err)
+			return
+		}
+
+		w.Header().Set("Content-Type", "application/json")
+		fmt.Fprintf(w, "{}")
+
 	default:
 		http.Error(w, "Method not allowed", http.StatusMethodNotAllowed)
 	}
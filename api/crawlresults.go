@@ -63,6 +63,23 @@ func CrawlResults(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
+	// Link structure report: inlinks, click depth, PageRank and orphan pages
+	if r.URL.Query().Get("view") == "links" {
+		links, err := service.GetLinks(r.Context(), projectID)
+		if err != nil {
+			http.Error(w, "Failed to get link graph", http.StatusInternalServerError)
+			fmt.Println(err)
+			return
+		}
+
+		w.Header().Set("Content-Type", "application/json")
+		if err := json.NewEncoder(w).Encode(links); err != nil {
+			http.Error(w, "Error encoding response", http.StatusInternalServerError)
+			fmt.Println(err)
+		}
+		return
+	}
+
 	// Get performance metrics
 	metrics, err := service.GetResults(r.Context(), projectID)
 	if err != nil {
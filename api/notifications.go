@@ -60,6 +60,20 @@ func Notifications(w http.ResponseWriter, r *http.Request) {
 			return
 		}
 
+		// Aggregated groups with their affected-page counts and sample URLs
+		if r.URL.Query().Get("grouped") == "true" {
+			groups, err := service.GetGroupsByProjectID(r.Context(), projectID)
+			if err != nil {
+				http.Error(w, "Failed to get notification groups", http.StatusInternalServerError)
+				fmt.Println(err)
+				return
+			}
+
+			w.Header().Set("Content-Type", "application/json")
+			json.NewEncoder(w).Encode(groups)
+			return
+		}
+
 		notificationsList, err := service.GetByProjectID(r.Context(), projectID)
 		if err != nil {
 			http.Error(w, "Failed to get notifications", http.StatusInternalServerError)
@@ -94,8 +94,9 @@ func Project(w http.ResponseWriter, r *http.Request) {
 	case "PUT":
 		// Update an existing project
 		var req struct {
-			ID  int    `json:"id"`
-			URL string `json:"url"`
+			ID            int                    `json:"id"`
+			URL           string                 `json:"url"`
+			CrawlSettings *project.CrawlSettings `json:"crawlsettings"`
 		}
 		if err := json.NewDecoder(r.Body).Decode(&req); err != nil {
 			http.Error(w, "Invalid request body", http.StatusBadRequest)
@@ -109,6 +110,19 @@ func Project(w http.ResponseWriter, r *http.Request) {
 			return
 		}
 
+		// Crawl rules are optional and only replaced when sent
+		if req.CrawlSettings != nil {
+			if scope := req.CrawlSettings.Scope; scope != "" && scope != "domain" && scope != "host" {
+				http.Error(w, "Invalid crawl scope", http.StatusBadRequest)
+				return
+			}
+			if err := service.UpdateCrawlSettings(r.Context(), req.ID, *req.CrawlSettings); err != nil {
+				http.Error(w, "Failed to update crawl settings", http.StatusInternalServerError)
+				fmt.Println(err)
+				return
+			}
+		}
+
 		w.Header().Set("Content-Type", "application/json")
 		fmt.Fprintf(w, "{}")
 
@@ -0,0 +1,32 @@
+// Command migrate applies the database migrations in migrations/ to DATABASE_URL
+package main
+
+import (
+	"context"
+	"fmt"
+	"os"
+
+	"projekt-splazh/migrations"
+	"projekt-splazh/pkg/database"
+)
+
+func main() {
+	conn, err := database.ConnectDB()
+	if err != nil {
+		fmt.Println(err)
+		os.Exit(1)
+	}
+	defer conn.Close(context.Background())
+
+	applied, err := migrations.Apply(context.Background(), conn)
+	for _, version := range applied {
+		fmt.Println("Applied migration", version)
+	}
+	if err != nil {
+		fmt.Println(err)
+		os.Exit(1)
+	}
+	if len(applied) == 0 {
+		fmt.Println("Database schema is up to date")
+	}
+}
@@ -1,20 +1,32 @@
 from socket import CAN_RAW
-from selenium import webdriver 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.relative_locator import locate_with
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 import json
 import queue
 import logging
 import time
 from collections import deque
-from urllib.parse import urlparse
-import re
 import os
 import concurrent.futures
 import threading
-from functools import lru_cache
+from browser import BrowserSession
+import url_normalizer
+from url_filter import UrlFilter
+from crawl_scope import CrawlScope
+from page_load import PageLoadPolicy
+
+_requests = None
+
+def get_requests():
+    """Import requests on first use, keeping it off the module import and the link-check hot path"""
+    global _requests
+    if _requests is None:
+        import requests
+        _requests = requests
+    return _requests
+
+# Bump whenever a content scan changes so cached scan results are invalidated
+SCAN_RULESET_VERSION = 2
 
 class ProjectNotification:
     def __init__(self, category, message):
@@ -22,42 +34,30 @@ class ProjectNotification:
         self.message = message
 
 class crawledPage:
-    def __init__(self, url, html, projectNotifications, ttfb=None, render_time=None):
+    def __init__(self, url, html, projectNotifications, ttfb=None, render_time=None, canonical_url=None):
         self.url = url
         self.html = html
         self.projectNotifications = projectNotifications
         self.ttfb = ttfb  # Time to First Byte in seconds
         self.render_time = render_time  # Time to complete render in seconds
+        self.canonical_url = canonical_url  # rel=canonical target if it differs from url
 
+class PageCrawled:
+    """Crawl event: a page was rendered and scanned"""
+    def __init__(self, page, depth):
+        self.page = page
+        self.depth = depth
 
-class Webcrawler:
-    def __init__(self, url, maxCrawlDepth=1, maxTitleLength=60, max_workers=10):
-        chrome_options = Options()
-        chrome_options.add_argument('--disable-infobars')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('--disable-logging')
-        chrome_options.add_argument('--disable-extensions')
-        chrome_options.add_argument('--disable-notifications')
-        chrome_options.add_argument('--disable-default-apps')
-        chrome_options.add_argument('--window-size=1920,1080')
-        chrome_options.add_argument('--headless=new')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        # Add more performance-enhancing options
-        chrome_options.add_argument('--blink-settings=imagesEnabled=false')  # Disable image loading
-        chrome_options.add_argument('--disable-javascript')  # Disable JavaScript if not needed
-        chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        chromedriver_path = os.getenv("CHROMEDRIVER_PATH", "/usr/bin/chromedriver") 
-        service = Service(executable_path=chromedriver_path)
-
-        logging_prefs = {
-            'performance': 'INFO', 
-            'browser': 'INFO'
-        }
-        chrome_options.set_capability('goog:loggingPrefs', logging_prefs)
+class LinksDiscovered:
+    """Crawl event: new internal links were found on a page and queued"""
+    def __init__(self, source_url, links, depth):
+        self.source_url = source_url
+        self.links = links
+        self.depth = depth  # Depth the links were queued at
 
+
+class Webcrawler:
+    def __init__(self, url, maxCrawlDepth=1, maxTitleLength=60, max_workers=10, browser=None, scan_cache=None, url_filter=None, scope=None, page_load=None):
         self.url = url
         self.base_domain = self.get_base_domain(url)
         self.maxCrawlDepth = maxCrawlDepth
@@ -66,65 +66,97 @@ class Webcrawler:
         self.log_cache = None  # Cache for performance logs
         self.lock = threading.Lock()  # Thread synchronization
         
-        try:
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
-            logging.info("WebDriver initialized successfully.")
-        except Exception as e:
-            logging.error(f"Failed to initialize WebDriver: {e}", exc_info=True)
-            try:
-                browser_logs = service.get_log('browser') if service else []
-                if browser_logs:
-                    logging.error("Browser logs during startup failure:")
-                    for entry in browser_logs:
-                        logging.error(entry)
-            except Exception as log_e:
-                logging.error(f"Could not retrieve browser logs: {log_e}")
-            raise
+        # The browser session is recycled by its watchdog, so always go through self.driver.
+        # A pre-warmed session passed in by the caller is reused and not shut down on close().
+        self.owns_browser = browser is None
+        self.browser = browser if browser is not None else BrowserSession()
+        self.scan_cache = scan_cache  # Optional ScanCache shared across jobs
+        self.link_graph = None  # Optional LinkGraph recording internal links
+        self.url_filter = url_filter if url_filter is not None else UrlFilter()  # Per-project crawl rules
+        self.scope = scope if scope is not None else CrawlScope(url)  # Hosts that belong to the site
+        self.page_load = page_load if page_load is not None else PageLoadPolicy()  # When a rendered page is ready
+        self.page_links = None  # (href, text) pairs of the current page, read once per navigation
+        self.follow_canonical = os.getenv("CRAWLER_FOLLOW_CANONICAL", "1") == "1"
+        self.scan_ruleset = f"{SCAN_RULESET_VERSION}:{maxTitleLength}"
+        self.page_retries = {}  # Retries per URL after a browser crash
+        self.max_page_retries = 1
             
         self.linksVisited = set()
-        self.rawPages = []
         self.callback = None
-        
-        self.ignored_extensions = [
-            '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
-            '.zip', '.rar', '.tar', '.gz', '.7z', '.exe', '.msi', '.apk',
-            '.mp3', '.mp4', '.avi', '.mov', '.wmv', '.flv', '.jpg', '.jpeg',
-            '.png', '.gif', '.bmp', '.svg', '.ico', '.css', '.js'
-        ]
+        # Guards linksVisited/urls_in_queue, which the async engine shares between tabs
+        self.frontier_lock = threading.Lock()
+        
+        # Crawl frontier, kept on the instance so it can be checkpointed and resumed
+        self.current_depth = 0
+        self.to_visit = deque([(url, 0)])
+        self.urls_in_queue = {self.normalize_url(url)}
+        self.persisted_urls = set()
+        self.checkpoint_callback = None
+        self.checkpoint_interval = 25
+        self.stop_check = None  # Optional callable(crawler) returning a reason to stop early
+        self.stop_reason = None
+        self.pages_since_checkpoint = 0
+        self.pages_rendered = 0
+        self.pages_failed = 0
+
+    @property
+    def driver(self):
+        """WebDriver of the current browser session"""
+        return self.browser.driver
 
-    @lru_cache(maxsize=1000)
     def get_base_domain(self, url):
-        """Extract the base domain from a URL (cached for performance)"""
-        parsed = urlparse(url)
-        return parsed.netloc
+        """Extract the normalized host from a URL (cached module-wide)"""
+        return url_normalizer.get_base_domain(url)
 
     def is_same_domain(self, url1, url2):
         """Check if two URLs belong to the same domain"""
         domain1 = self.get_base_domain(url1)
         domain2 = self.get_base_domain(url2)
         return domain1 == domain2
+
+    def is_internal(self, url):
+        """Check if a URL belongs to the crawled site (cached per host)"""
+        return self.scope.contains(url)
     
     def is_valid_url(self, url):
         """Check if URL is a valid website (not a file or other resource to ignore)"""
-        # Check for ignored file extensions
-        parsed_url = urlparse(url)
-        path = parsed_url.path.lower()
-        
-        # Check if the URL ends with any ignored extension
-        for ext in self.ignored_extensions:
-            if path.endswith(ext):
-                return False
-        
-        # Check for common non-website protocols
-        if parsed_url.scheme not in ['http', 'https', '']:
-            return False
-            
-        return True
+        return self.url_filter.is_crawlable(url)
+
+    def get_page_links(self):
+        """Return (href, text) of every link on the current page.
+
+        Read with a single script call and cached until the next navigation, so
+        link extraction and the broken link scan don't query each element.
+        """
+        with self.lock:
+            if self.page_links is None:
+                try:
+                    links = self.driver.execute_script(
+                        "return Array.from(document.querySelectorAll('a[href]'), "
+                        "a => [a.href, (a.innerText || a.textContent || '').trim()]);"
+                    ) or []
+                except Exception as e:
+                    logging.error(f"Error reading links: {e}")
+                    links = []
+                self.page_links = [(href, text) for href, text in links if isinstance(href, str)]
+            return self.page_links
 
     def set_callback(self, callback):
         """Set a callback function to be called after each page is crawled"""
         self.callback = callback
 
+    def set_stop_check(self, stop_check):
+        """Set a callable(crawler) that returns a reason (e.g. "cancelled") when the crawl must stop"""
+        self.stop_check = stop_check
+
+    def should_stop(self):
+        """Check whether the crawl has to end early; once stopped it stays stopped"""
+        if self.stop_reason is None and self.stop_check is not None:
+            reason = self.stop_check(self)
+            if reason:
+                self.stop_reason = reason
+        return self.stop_reason is not None
+
     def get_ttfb(self):
         """Calculate Time to First Byte (TTFB) from performance logs"""
         logs = self.get_performance_logs()
@@ -159,6 +191,9 @@ class Webcrawler:
             # Use Navigation Timing API to get accurate load times
             navigation_start = self.driver.execute_script("return window.performance.timing.navigationStart")
             dom_complete = self.driver.execute_script("return window.performance.timing.domComplete")
+            if dom_complete == 0:
+                # The wait ended before the load event, the DOM was complete when it was parsed
+                dom_complete = self.driver.execute_script("return window.performance.timing.domContentLoadedEventEnd")
             
             if navigation_start and dom_complete:
                 # Convert to milliseconds
@@ -180,16 +215,21 @@ class Webcrawler:
                 "render_time": None
             }
             
-        # Clear the performance log cache when navigating to a new page
+        # Clear the performance log and link caches when navigating to a new page
         self.log_cache = None
+        self.page_links = None
         
         # Set a page load timeout to avoid getting stuck
-        self.driver.set_page_load_timeout(30)
+        self.driver.set_page_load_timeout(self.page_load.timeout)
         
+        previous_origin = self.page_load.document_origin(self.driver)
         navigation_start_time = time.time()
             
         try:
             self.driver.get(url)
+            # The browser doesn't wait for the full load, the page's wait condition decides
+            self.log_cache = []
+            self.page_load.wait_for_page(self.driver, previous_origin, self.log_cache)
         except Exception as e:
             logging.error(f"Error navigating to {url}: {e}")
             return {
@@ -219,8 +259,15 @@ class Webcrawler:
         
         # Check if there was a significant redirect (not just normalization)
         if normalized_current != normalized_original:
-            # Check if the redirect is to the same domain
-            if self.is_same_domain(url, current_url):
+            # A start URL redirecting to another host (e.g. a new brand domain)
+            # moves the whole site there, so that host joins the scope
+            if normalized_original == self.normalize_url(self.url) and not self.is_internal(current_url):
+                target_host = self.get_base_domain(current_url)
+                logging.info(f"Start URL redirects to {target_host}, adding it to the crawl scope")
+                self.scope.allow_host(target_host)
+            
+            # Check if the redirect stays within the site, possibly on another host
+            if self.is_internal(current_url):
                 return {
                     "redirected": True,
                     "internal": True,
@@ -247,30 +294,9 @@ class Webcrawler:
             "render_time": render_time
         }
 
-    @lru_cache(maxsize=1000)
     def normalize_url(self, url):
-        """Normalize URL to reduce false positives in redirect detection (cached for performance)"""
-        parsed = urlparse(url)
-        
-        # Convert to lowercase
-        netloc = parsed.netloc.lower()
-        
-        # Remove default ports
-        if netloc.endswith(':80') and parsed.scheme == 'http':
-            netloc = netloc[:-3]
-        elif netloc.endswith(':443') and parsed.scheme == 'https':
-            netloc = netloc[:-4]
-        
-        # Normalize path (ensure trailing slash for all paths except the root path)
-        path = parsed.path
-        if path == '':
-            path = '/'
-        elif path != '/' and not path.endswith('/'):
-            path = path + '/'
-        
-        # Reconstruct the normalized URL without query parameters or fragments
-        normalized = f"{parsed.scheme}://{netloc}{path}"
-        return normalized
+        """Normalize URL to reduce false positives in redirect detection (cached module-wide)"""
+        return url_normalizer.normalize_url(url)
 
     def get_performance_logs(self):
         """Get performance logs with caching to avoid excessive calls"""
@@ -293,7 +319,7 @@ class Webcrawler:
                 parsedMessage = json.loads(request["message"])["message"]
                 if (parsedMessage["method"] == "Network.requestWillBeSent"):
                     url = parsedMessage["params"]["request"]["url"]
-                    if(not self.is_same_domain(current_url, url) and not url.startswith("data:image") 
+                    if(not self.is_internal(url) and not url.startswith("data:image") 
                             and not url.startswith("blob:") and not url.startswith("data:text")
                             and url not in external_resources):
                         external_resources.add(url)
@@ -305,35 +331,40 @@ class Webcrawler:
         # Create and return a crawledPage object with no performance metrics yet
         return crawledPage(current_url, self.driver.page_source, projectNotifications)
     
-    def getInternalLinks(self):
-        # Use CSS selector which is faster than XPath
-        hrefs = self.driver.find_elements(By.CSS_SELECTOR, "a[href]")
-        
+    def get_canonical_url(self):
+        """Return the absolute rel=canonical URL of the current page, if any"""
+        try:
+            return self.driver.execute_script(
+                "var link = document.querySelector('link[rel=\"canonical\"][href]'); return link ? link.href : null;"
+            )
+        except Exception:
+            return None
+
+    def getInternalLinks(self, source_url=None):
         # Use a set to eliminate duplicates right away
         internal_links = set()
-        
-        for href in hrefs:
-            try:
-                link = href.get_attribute("href")
-                if link:
-                    # Remove fragment identifier
-                    link = link.split("#")[0]
-                    # remove anything trailing ?
-                    link = link.split("?")[0]
-                    # Check if it's an internal link, valid URL type, and not already visited
-                    if (self.is_same_domain(self.url, link) and 
-                        self.is_valid_url(link) and 
-                        self.normalize_url(link) not in self.linksVisited):
-                        internal_links.add(link)
-            except Exception:
-                # Skip links that cause errors
+        # Every internal edge, including links to visited pages, for the link graph
+        linked_urls = set()
+        
+        # The filter parses each link once and drops files, other schemes and
+        # URLs excluded by the project's crawl rules in one pass
+        hrefs = [href for href, _ in self.get_page_links()]
+        for link, host in self.url_filter.filter_links(hrefs):
+            if not self.scope.contains_host(host):
                 continue
+            normalized_link = self.normalize_url(link)
+            linked_urls.add(normalized_link)
+            if normalized_link not in self.linksVisited:
+                internal_links.add(link)
+        
+        if self.link_graph is not None and source_url:
+            self.link_graph.add_edges(self.normalize_url(source_url), linked_urls)
                 
         return list(internal_links)
 
     def close(self):
-        if hasattr(self, 'driver'):
-            self.driver.quit()
+        if hasattr(self, 'browser') and self.owns_browser:
+            self.browser.quit()
 
     def __del__(self):
         try:
@@ -436,38 +467,19 @@ class Webcrawler:
         """Check for broken links (href attributes that don't work)"""
         projectNotifications = []
         
-        # Find all links on the page using CSS selector (faster than XPath)
-        links = self.driver.find_elements(By.CSS_SELECTOR, "a[href]")
-        
-        # Gather all links to check first
+        # Gather all links to check first; empty links, fragments and
+        # non-http protocols (javascript:, mailto:, tel:, ...) are skipped
         links_to_check = []
-        for link in links:
-            try:
-                href = link.get_attribute("href")
-                
-                # Skip empty or javascript links
-                if not href or href.startswith("javascript:") or href == "#":
-                    continue
-                
-                # Skip mailto, tel, ftp, and other non-http protocol links
-                if (href.startswith("mailto:") or 
-                    href.startswith("tel:") or 
-                    href.startswith("ftp:") or 
-                    href.startswith("skype:") or
-                    href.startswith("sms:") or
-                    href.startswith("whatsapp:") or
-                    ":" in href and not href.startswith("http")):
-                    continue
-                
-                # Get link text for better identification
-                link_text = link.text.strip() or "(No text)"
-                if len(link_text) > 30:
-                    link_text = link_text[:27] + "..."
-                
-                links_to_check.append((href, link_text))
-            except Exception:
-                # Skip links that cause errors when checking attributes
+        for href, text in self.get_page_links():
+            if not UrlFilter.is_checkable_link(href):
                 continue
+            
+            # Get link text for better identification
+            link_text = text or "(No text)"
+            if len(link_text) > 30:
+                link_text = link_text[:27] + "..."
+            
+            links_to_check.append((href, link_text))
         
         # Use ThreadPoolExecutor to check links in parallel
         if links_to_check:
@@ -488,23 +500,42 @@ class Webcrawler:
     
     def check_link(self, href, link_text):
         """Check if a link is broken - called by ThreadPoolExecutor"""
+        # Skip the remaining checks once the job is cancelled or out of budget
+        if self.should_stop():
+            return None
         try:
-            import requests
-            from requests.exceptions import RequestException
-            
-            # Make a HEAD request to check if the link is broken
-            # Set a short timeout to avoid waiting too long
-            response = requests.head(href, timeout=3, allow_redirects=True)
-            
-            if response.status_code >= 400:
-                message = f"Broken link: {href} (Text: '{link_text}') - Status: {response.status_code}"
-                return ProjectNotification("broken_link", message)
+            status_code = self.link_status(href)
+        except Exception:
+            # Skip links that cause other errors
             return None
-        except RequestException as e:
+        
+        if status_code is None:
             message = f"Broken link: {href} (Text: '{link_text}') - Error: Connection failed"
             return ProjectNotification("broken_link", message)
-        except Exception:
-            # Skip links that cause other errors
+        if status_code >= 400:
+            message = f"Broken link: {href} (Text: '{link_text}') - Status: {status_code}"
+            return ProjectNotification("broken_link", message)
+        return None
+
+    def link_status(self, href):
+        """Status code of a link, from the scan cache if any page checked it recently"""
+        if self.scan_cache is None:
+            return self.head_request(href)
+        cached = self.scan_cache.get_link(href)
+        if cached is not None:
+            return cached["status"]
+        status_code = self.head_request(href)
+        self.scan_cache.put_link(href, status_code)
+        return status_code
+
+    def head_request(self, href):
+        """HEAD a link and return its status code, or None if the connection failed"""
+        requests = get_requests()
+        try:
+            # Set a short timeout to avoid waiting too long
+            response = requests.head(href, timeout=3, allow_redirects=True)
+            return response.status_code
+        except requests.exceptions.RequestException:
             return None
 
     def scanForLargeImages(self):
@@ -651,22 +682,47 @@ class Webcrawler:
         
         return projectNotifications
 
-    def scan_page_parallel(self, current_url):
-        """Run all page scans in parallel to speed up processing"""
+    def scan_page_parallel(self, current_url, page_source=None):
+        """Run all page scans in parallel to speed up processing.
+
+        Results of the scans that only depend on the page body are cached by
+        content hash, so identical pages skip them entirely.
+        """
         notifications = []
         
-        # Define the scan functions to run in parallel
-        scan_functions = [
-            self.scanForMissingAltText,
+        # Scans whose results are fully determined by the page body
+        content_scans = [
             self.scanForTitleIssues,
-            lambda: self.scanForResponseCodes(current_url),
+            self.scanForH1Issues
+        ]
+        # Scans that depend on the URL or the network responses of this load.
+        # Link and image URLs are resolved against the page URL, so identical
+        # HTML on another host or path yields different results.
+        page_scans = [
+            self.scanForMissingAltText,
             self.scanForBrokenLinks,
+            lambda: self.scanForResponseCodes(current_url),
             self.scanForLargeImages,
             self.scanForNoIndexNoFollow,
-            self.scanForH1Issues,
             self.scanForHttps
         ]
         
+        cache_key = None
+        if self.scan_cache is not None and page_source:
+            cache_key = self.scan_cache.make_key(page_source, self.scan_ruleset)
+            cached = self.scan_cache.get(cache_key)
+            if cached is not None:
+                notifications.extend(ProjectNotification(category, message) for category, message in cached["notifications"])
+                if cached["url"] != current_url and self.is_internal(cached["url"]):
+                    message = f"Page content is identical to {cached['url']}"
+                    notifications.append(ProjectNotification("duplicate_content", message))
+                content_scans = []
+                cache_key = None
+        
+        scan_functions = content_scans + page_scans
+        content_results = []
+        content_failed = False
+        
         # Run scans in parallel with ThreadPoolExecutor
         with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(scan_functions), self.max_workers)) as executor:
             # Submit all scanning tasks
@@ -674,116 +730,244 @@ class Webcrawler:
             
             # Process results as they complete
             for future in concurrent.futures.as_completed(future_to_scan):
+                is_content_scan = future_to_scan[future] in content_scans
                 try:
                     result = future.result()
                     if result:
                         notifications.extend(result)
+                        if is_content_scan:
+                            content_results.extend(result)
                 except Exception as e:
                     logging.error(f"Error in scan function: {e}")
+                    content_failed = content_failed or is_content_scan
+        
+        # Only cache complete results
+        if cache_key is not None and not content_failed:
+            self.scan_cache.put(cache_key, current_url, content_results)
         
         return notifications
 
+    def set_checkpoint_callback(self, callback, interval=25):
+        """Set a callback that receives the crawl state every `interval` pages"""
+        self.checkpoint_callback = callback
+        self.checkpoint_interval = max(1, interval)
+
+    def get_checkpoint(self):
+        """Return a JSON-serializable snapshot of the crawl frontier.
+
+        The visited set is not part of it; it grows with every page and is
+        rebuilt from the saved pages on resume (see restore_checkpoint).
+        """
+        return {
+            "current_depth": self.current_depth,
+            "to_visit": [[url, depth] for url, depth in self.to_visit],
+        }
+
+    def restore_checkpoint(self, state, persisted_urls=(), visited_urls=()):
+        """Resume from a snapshot produced by get_checkpoint().
+
+        `visited_urls` are the normalized URLs saved before the snapshot was
+        taken. `persisted_urls` also include those saved after it; leaf pages
+        among them are not rendered again.
+        """
+        self.current_depth = state.get("current_depth", 0)
+        self.to_visit = deque((url, depth) for url, depth in state.get("to_visit", []))
+        # Checkpoints written before the visited set was rebuilt still carry it
+        self.linksVisited = set(state.get("links_visited", []))
+        self.linksVisited.update(visited_urls)
+        self.linksVisited.difference_update(self.normalize_url(url) for url, _ in self.to_visit)
+        self.urls_in_queue = set(self.linksVisited)
+        self.urls_in_queue.update(self.normalize_url(url) for url, _ in self.to_visit)
+        self.persisted_urls = set(persisted_urls)
+        logging.info(f"Restored crawl checkpoint: {len(self.linksVisited)} visited, {len(self.to_visit)} queued")
+
+    def pages_crawled(self):
+        """Pages of this job rendered so far, including those saved before a resume"""
+        return self.pages_rendered + len(self.persisted_urls)
+
+    def get_stats(self):
+        """Frontier and page counters for progress reporting"""
+        return {
+            "discovered": len(self.urls_in_queue),
+            "rendered": self.pages_rendered,
+            "failed": self.pages_failed,
+            "frontier": len(self.to_visit),
+        }
+
+    def _save_checkpoint(self):
+        """Hand the current crawl state to the checkpoint callback"""
+        self.pages_since_checkpoint = 0
+        if not self.checkpoint_callback:
+            return
+        try:
+            self.checkpoint_callback(self.get_checkpoint())
+        except Exception as e:
+            logging.error(f"Error saving crawl checkpoint: {e}")
+
+    def crawl_page(self, url, depth):
+        """Render a single URL, run all scans and queue its internal links.
+
+        Returns the crawledPage (None if the URL was skipped) and the list of
+        newly queued links.
+        """
+        print(f"Crawling {url} at depth {depth}/{self.maxCrawlDepth}")
+        
+        # Clear performance log buffer before navigation
+        self.log_cache = None
+        self.page_links = None
+        try:
+            self.driver.get_log('performance') 
+        except Exception: 
+            pass 
+
+        # Navigate to URL and handle redirects
+        redirect_info = self.navigate_to_url(url)
+        self.browser.page_loaded(url)
+        
+        # If we should skip this page (external redirect or invalid URL type), continue to next URL
+        if not redirect_info["continue"]:
+            if redirect_info.get("reason") == "navigation_error":
+                self.pages_failed += 1
+            return None, []
+        
+        # Get the current URL (might be different if there was a redirect)
+        current_url = self.driver.current_url
+        
+        # Create notifications list
+        projectNotifications = []
+        
+        # Add redirect notification if needed
+        if redirect_info.get("redirected", False) and redirect_info.get("internal", False):
+            redirect_message = f"Page redirects to {redirect_info['target']}"
+            projectNotifications.append(ProjectNotification("redirect", redirect_message))
+            # The target has been rendered now, possibly under another host,
+            # so links pointing at it directly don't need another visit
+            normalized_target = self.normalize_url(current_url)
+            with self.frontier_lock:
+                self.linksVisited.add(normalized_target)
+                self.urls_in_queue.add(normalized_target)
+        
+        # Scan for external resources
+        page = self.scanPageForExternalResources(current_url)
+        
+        # Pages declaring an internal rel=canonical are duplicates of that URL, so
+        # the canonical target doesn't need to be crawled again
+        canonical_url = self.get_canonical_url()
+        if (canonical_url and self.is_internal(canonical_url) and
+                self.normalize_url(canonical_url) != self.normalize_url(current_url)):
+            page.canonical_url = canonical_url
+            if self.follow_canonical:
+                normalized_canonical = self.normalize_url(canonical_url)
+                with self.frontier_lock:
+                    self.linksVisited.add(normalized_canonical)
+                    self.urls_in_queue.add(normalized_canonical)
+        
+        # Add performance metrics
+        page.ttfb = redirect_info.get("ttfb")
+        page.render_time = redirect_info.get("render_time")
+        
+        # Print performance metrics in the log
+        ttfb_str = f"{page.ttfb} ms" if page.ttfb else "N/A"
+        render_time_str = f"{page.render_time} ms" if page.render_time else "N/A"
+        print(f"Performance metrics for {current_url}:")
+        print(f"  Time to First Byte (TTFB): {ttfb_str}")
+        print(f"  Time to Complete Render: {render_time_str}")
+        
+        # Run all the other scans in parallel
+        parallel_scan_results = self.scan_page_parallel(current_url, page.html)
+        page.projectNotifications.extend(parallel_scan_results)
+        
+        # Add any redirect notifications
+        page.projectNotifications.extend(projectNotifications)
+        
+        self.pages_rendered += 1
+        if self.link_graph is not None:
+            self.link_graph.mark_crawled(self.normalize_url(current_url))
+        
+        # Only collect new links if we haven't reached max depth
+        new_links = []
+        if depth < self.maxCrawlDepth:
+            # Get internal links and add them to the next depth level
+            internal_links = [(link, self.normalize_url(link)) for link in self.getInternalLinks(current_url)]
+            with self.frontier_lock:
+                for link, normalized_link in internal_links:
+                    # Check if the link is already in our visited set or in the queue
+                    if normalized_link not in self.linksVisited and normalized_link not in self.urls_in_queue:
+                        self.to_visit.append((link, depth + 1))
+                        self.urls_in_queue.add(normalized_link)
+                        new_links.append(link)
+        
+        return page, new_links
+
+    def requeue_after_crash(self, url, depth, normalized_url):
+        """Restart a dead browser and put the in-flight URL back at the front of the queue"""
+        try:
+            self.browser.restart("browser session died")
+        except Exception as e:
+            logging.error(f"Failed to restart browser: {e}")
+            raise
+        
+        retries = self.page_retries.get(normalized_url, 0)
+        if retries < self.max_page_retries:
+            self.page_retries[normalized_url] = retries + 1
+            self.linksVisited.discard(normalized_url)
+            self.to_visit.appendleft((url, depth))
+            logging.info(f"Requeued {url} after browser restart")
+
     def crawl(self):
-        """Crawl the website and collect data"""
-        # Start with the initial URL at depth 0
-        current_depth = 0
-        
-        # Use a deque to process URLs level by level
-        to_visit = deque([(self.url, current_depth)])
-        
-        # Set to track URLs in the queue to avoid adding duplicates
-        urls_in_queue = {self.normalize_url(self.url)}
-        
-        # Process URLs by depth level
-        while to_visit and current_depth <= self.maxCrawlDepth:
-            # Get all URLs at the current depth
-            current_level_urls = []
-            while to_visit and to_visit[0][1] == current_depth:
-                url, depth = to_visit.popleft()
-                
-                # Normalize the URL
-                normalized_url = self.normalize_url(url)
+        """Crawl the website, handing each page to the callback"""
+        for event in self.iter_crawl():
+            if self.callback and isinstance(event, PageCrawled):
+                self.callback(event.page)
+
+    def iter_crawl(self):
+        """Crawl the website, yielding PageCrawled and LinksDiscovered events.
 
-                if normalized_url not in self.linksVisited:
-                    current_level_urls.append(url)
-                    self.linksVisited.add(normalized_url)
+        Pages are not kept after they are yielded, so memory doesn't grow with
+        the site. The consumer handles each page before the crawl continues,
+        which keeps checkpoints consistent with what was persisted.
+        """
+        # The frontier is processed one URL at a time in FIFO order, which keeps
+        # the crawl breadth-first and lets a checkpoint be taken between pages
+        while self.to_visit:
+            if self.should_stop():
+                logging.info(f"Stopping crawl of {self.url} early: {self.stop_reason}")
+                break
+            url, depth = self.to_visit[0]
+            if depth > self.maxCrawlDepth:
+                break
+            self.to_visit.popleft()
+            self.current_depth = depth
             
-            # Process all URLs at the current depth
-            for url in current_level_urls:
-                try:
-                    print(f"Crawling {url} at depth {current_depth}/{self.maxCrawlDepth}")
-                    
-                    # Clear performance log buffer before navigation
-                    self.log_cache = None
-                    try:
-                        self.driver.get_log('performance') 
-                    except Exception: 
-                        pass 
-
-                    # Navigate to URL and handle redirects
-                    redirect_info = self.navigate_to_url(url)
-                    
-                    # If we should skip this page (external redirect or invalid URL type), continue to next URL
-                    if not redirect_info["continue"]:
-                        continue
-                    
-                    # Get the current URL (might be different if there was a redirect)
-                    current_url = self.driver.current_url
-                    
-                    # Create notifications list
-                    projectNotifications = []
-                    
-                    # Add redirect notification if needed
-                    if redirect_info.get("redirected", False) and redirect_info.get("internal", False):
-                        redirect_message = f"Page redirects to {redirect_info['target']}"
-                        projectNotifications.append(ProjectNotification("redirect", redirect_message))
-                    
-                    # Scan for external resources
-                    page = self.scanPageForExternalResources(current_url)
-                    
-                    # Add performance metrics
-                    page.ttfb = redirect_info.get("ttfb")
-                    page.render_time = redirect_info.get("render_time")
-                    
-                    # Print performance metrics in the log
-                    ttfb_str = f"{page.ttfb} ms" if page.ttfb else "N/A"
-                    render_time_str = f"{page.render_time} ms" if page.render_time else "N/A"
-                    print(f"Performance metrics for {current_url}:")
-                    print(f"  Time to First Byte (TTFB): {ttfb_str}")
-                    print(f"  Time to Complete Render: {render_time_str}")
-                    
-                    # Run all the other scans in parallel
-                    parallel_scan_results = self.scan_page_parallel(current_url)
-                    page.projectNotifications.extend(parallel_scan_results)
-                    
-                    # Add any redirect notifications
-                    page.projectNotifications.extend(projectNotifications)
-                    
-                    # Save the page
-                    self.rawPages.append(page)
-                    
-                    # Call the callback if it exists
-                    if self.callback:
-                        self.callback(page)
-                    
-                    # Only collect new links if we haven't reached max depth
-                    if current_depth < self.maxCrawlDepth:
-                        # Get internal links and add them to the next depth level
-                        internal_links = self.getInternalLinks()
-                        for link in internal_links:
-                            normalized_link = self.normalize_url(link)
-                            # Check if the link is already in our visited set or in the queue
-                            if normalized_link not in self.linksVisited and normalized_link not in urls_in_queue:
-                                to_visit.append((link, current_depth + 1))
-                                urls_in_queue.add(normalized_link)
-                
-                except Exception as e:
-                    logging.error(f"Error crawling {url}: {e}")
+            # Normalize the URL
+            normalized_url = self.normalize_url(url)
+            if normalized_url in self.linksVisited:
+                continue
+            self.linksVisited.add(normalized_url)
             
-            # Move to the next depth level
-            if to_visit:
-                current_depth = to_visit[0][1]
-            else:
-                break
+            # Leaf pages saved after the last checkpoint don't need rendering again;
+            # inner pages are re-rendered so their outgoing links get queued
+            if normalized_url in self.persisted_urls and depth >= self.maxCrawlDepth:
+                continue
+            
+            page, new_links = None, []
+            try:
+                self.browser.ensure_healthy()
+                page, new_links = self.crawl_page(url, depth)
+            except Exception as e:
+                logging.error(f"Error crawling {url}: {e}")
+                self.pages_failed += 1
+                if self.browser.is_session_error(e):
+                    self.requeue_after_crash(url, depth, normalized_url)
+            
+            if page is not None:
+                yield PageCrawled(page, depth)
+                page = None
+            if new_links:
+                yield LinksDiscovered(url, new_links, depth + 1)
+            
+            self.pages_since_checkpoint += 1
+            if self.pages_since_checkpoint >= self.checkpoint_interval:
+                self._save_checkpoint()
                 
-        print(f"Finished crawling {self.url}. Visited {len(self.linksVisited)} pages.")
\ No newline at end of file
+        print(f"Finished crawling {self.url}. Visited {len(self.linksVisited)} pages.")
@@ -0,0 +1,640 @@
+import os
+import json
+import time
+import queue
+import shutil
+import asyncio
+import logging
+import tempfile
+import threading
+import concurrent.futures
+from collections import deque
+
+import url_normalizer
+from browser import CHROME_ARGUMENTS
+from Webcrawler import Webcrawler, PageCrawled, LinksDiscovered
+from url_filter import UrlFilter
+from crawl_scope import CrawlScope
+from page_load import PageLoadPolicy, PAGE_LOAD_STRATEGY, SCRIPTS_COMMAND
+
+logger = logging.getLogger("async_engine")
+
+# Chrome binary started by the async engine
+CHROME_BIN = os.getenv("CHROME_BIN", "chromium")
+# Tabs rendering pages concurrently in one browser
+TABS = int(os.getenv("CRAWLER_ASYNC_TABS", "8"))
+# Link checks (HEAD requests) in flight at once across all tabs
+LINK_CHECKS = int(os.getenv("CRAWLER_ASYNC_LINK_CHECKS", "50"))
+# Seconds to wait for Chrome to open its DevTools port
+STARTUP_SECONDS = 30
+# How often the consumer thread runs the stop check while no pages arrive
+STOP_CHECK_SECONDS = 1
+
+
+class CDPError(Exception):
+    """A DevTools command failed"""
+
+
+class CDPConnectionClosed(CDPError):
+    """The browser or the tab went away"""
+
+
+class ChromeProcess:
+    """Headless Chrome with remote debugging on a free port"""
+
+    def __init__(self, binary=None):
+        self.binary = binary or CHROME_BIN
+        self.process = None
+        self.user_data_dir = None
+
+    async def start(self):
+        """Launch Chrome and return the browser's DevTools websocket URL"""
+        self.user_data_dir = tempfile.mkdtemp(prefix="crawler-chrome-")
+        self.process = await asyncio.create_subprocess_exec(
+            self.binary, *CHROME_ARGUMENTS,
+            "--remote-debugging-port=0",
+            f"--user-data-dir={self.user_data_dir}",
+            "about:blank",
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        # Chrome writes the port it picked and the browser target path here once it listens
+        port_file = os.path.join(self.user_data_dir, "DevToolsActivePort")
+        deadline = time.monotonic() + STARTUP_SECONDS
+        while time.monotonic() < deadline:
+            if self.process.returncode is not None:
+                raise CDPConnectionClosed(f"Chrome exited with code {self.process.returncode}")
+            try:
+                with open(port_file) as f:
+                    lines = f.read().split()
+                if len(lines) >= 2:
+                    return f"ws://127.0.0.1:{lines[0]}{lines[1]}"
+            except FileNotFoundError:
+                pass
+            await asyncio.sleep(0.05)
+        raise CDPConnectionClosed("Chrome did not open its DevTools port")
+
+    async def stop(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+            try:
+                await asyncio.wait_for(self.process.wait(), 10)
+            except asyncio.TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+        self.process = None
+        if self.user_data_dir:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            self.user_data_dir = None
+
+
+class CDPConnection:
+    """One websocket to the browser, multiplexing all tabs as flattened sessions"""
+
+    def __init__(self, http):
+        self.http = http
+        self.ws = None
+        self.reader = None
+        self.next_id = 0
+        self.pending = {}
+        self.listeners = {}  # session id -> callable(method, params)
+        self.closed = False
+
+    async def connect(self, ws_url):
+        self.ws = await self.http.ws_connect(ws_url, max_msg_size=0)
+        self.reader = asyncio.ensure_future(self._read())
+
+    async def send(self, method, params=None, session_id=None):
+        if self.closed:
+            raise CDPConnectionClosed("DevTools connection is closed")
+        self.next_id += 1
+        message = {"id": self.next_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.next_id] = future
+        await self.ws.send_str(json.dumps(message))
+        return await future
+
+    async def _read(self):
+        try:
+            async for message in self.ws:
+                data = json.loads(message.data)
+                if "id" in data:
+                    future = self.pending.pop(data["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in data:
+                        future.set_exception(CDPError(data["error"].get("message", "DevTools error")))
+                    else:
+                        future.set_result(data.get("result", {}))
+                else:
+                    listener = self.listeners.get(data.get("sessionId"))
+                    if listener is not None:
+                        listener(data.get("method"), data.get("params", {}))
+        except Exception as e:
+            logger.error(f"DevTools connection failed: {e}")
+        finally:
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(CDPConnectionClosed("DevTools connection closed"))
+            self.pending = {}
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader is not None:
+            await self.reader
+
+
+class CDPTab:
+    """A browser tab; its network events are kept in performance log form"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.target_id = None
+        self.session_id = None
+        self.events = []
+        self.loaded = asyncio.Event()
+        self.dom_loaded = asyncio.Event()
+        self.crashed = False
+
+    async def open(self):
+        target = await self.connection.send("Target.createTarget", {"url": "about:blank"})
+        self.target_id = target["targetId"]
+        attached = await self.connection.send("Target.attachToTarget", {"targetId": self.target_id, "flatten": True})
+        self.session_id = attached["sessionId"]
+        self.connection.listeners[self.session_id] = self._on_event
+        await self.send("Page.enable")
+        await self.send("Network.enable")
+        await self.send("Inspector.enable")
+        # Scripts stay off unless the page load policy renders a shell
+        await self.send(SCRIPTS_COMMAND, {"value": True})
+
+    async def send(self, method, params=None):
+        if self.crashed:
+            raise CDPConnectionClosed("Tab crashed")
+        return await self.connection.send(method, params, self.session_id)
+
+    def _on_event(self, method, params):
+        if method == "Page.loadEventFired":
+            self.loaded.set()
+        elif method == "Page.domContentEventFired":
+            self.dom_loaded.set()
+        elif method in ("Inspector.targetCrashed", "Inspector.detached"):
+            self.crashed = True
+            self.loaded.set()
+            self.dom_loaded.set()
+        if method.startswith("Network.") or method.startswith("Page."):
+            self.events.append({"method": method, "params": params})
+
+    def take_events(self):
+        """Return and clear the events since the last call, like reading Chrome's performance log"""
+        events, self.events = self.events, []
+        return events
+
+    async def navigate(self, url, timeout):
+        """Navigate and wait as long as PAGE_LOAD_STRATEGY says, like WebDriver's get()"""
+        self.loaded.clear()
+        self.dom_loaded.clear()
+        result = await self.send("Page.navigate", {"url": url})
+        if result.get("errorText"):
+            raise CDPError(f"{result['errorText']} loading {url}")
+        if PAGE_LOAD_STRATEGY == "none":
+            return
+        event = self.dom_loaded if PAGE_LOAD_STRATEGY == "eager" else self.loaded
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            raise CDPError(f"Timed out after {timeout}s loading {url}")
+        if self.crashed:
+            raise CDPConnectionClosed(f"Tab crashed loading {url}")
+
+    async def evaluate(self, expression):
+        result = await self.send("Runtime.evaluate", {"expression": expression, "returnByValue": True})
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CDPError(details.get("exception", {}).get("description") or details.get("text", "Script error"))
+        return result.get("result", {}).get("value")
+
+    async def close(self):
+        self.connection.listeners.pop(self.session_id, None)
+        if self.target_id and not self.connection.closed:
+            try:
+                await self.connection.send("Target.closeTarget", {"targetId": self.target_id})
+            except CDPError:
+                pass
+
+
+# Attributes of every matched element; src/href are read as properties, like WebDriver does
+ELEMENTS_SCRIPT = """
+Array.from(document.querySelectorAll(%s), e => {
+    const attributes = {};
+    for (const a of e.attributes) attributes[a.name] = a.value;
+    for (const name of ['src', 'href']) if (typeof e[name] === 'string') attributes[name] = e[name];
+    attributes['#text'] = e.innerText || '';
+    return attributes;
+})
+"""
+
+
+class TabElement:
+    """Element snapshot returned by TabDriver.find_elements"""
+
+    def __init__(self, attributes):
+        self._attributes = attributes
+
+    def get_attribute(self, name):
+        return self._attributes.get(name)
+
+    @property
+    def text(self):
+        return self._attributes.get("#text") or ""
+
+
+class TabDriver:
+    """Blocking facade over a CDPTab with the subset of the WebDriver API the scanners use.
+
+    It is called from scanner threads; every call is run on the event loop.
+    """
+
+    def __init__(self, tab, loop):
+        self.tab = tab
+        self.loop = loop
+        self.page_load_timeout = 30
+        self._current_url = None
+        self._page_source = None
+
+    def _run(self, coroutine):
+        # Bounded, so scanner threads can't hang on a loop that is shutting down
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(self.page_load_timeout + 30)
+
+    def set_page_load_timeout(self, seconds):
+        self.page_load_timeout = seconds
+
+    def get(self, url):
+        self._current_url = None
+        self._page_source = None
+        self._run(self.tab.navigate(url, self.page_load_timeout))
+
+    @property
+    def current_url(self):
+        if self._current_url is None:
+            self._current_url = self._run(self.tab.evaluate("document.location.href"))
+        return self._current_url
+
+    @property
+    def page_source(self):
+        if self._page_source is None:
+            self._page_source = self._run(self.tab.evaluate("document.documentElement.outerHTML")) or ""
+        return self._page_source
+
+    def get_log(self, log_type):
+        if log_type != "performance":
+            return []
+        return [{"message": json.dumps({"message": event})} for event in self.tab.take_events()]
+
+    def execute_script(self, script, *args):
+        if args:
+            raise CDPError("Script arguments are not supported by the async engine")
+        return self._run(self.tab.evaluate(f"(function() {{\n{script}\n}})()"))
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self._run(self.tab.send(cmd, cmd_args))
+
+    def find_elements(self, by, value):
+        if by not in ("tag name", "css selector"):
+            raise CDPError(f"Locator {by} is not supported by the async engine")
+        attributes = self._run(self.tab.evaluate(ELEMENTS_SCRIPT % json.dumps(value))) or []
+        return [TabElement(a) for a in attributes]
+
+    def quit(self):
+        pass
+
+
+class TabBrowser:
+    """Stand-in for BrowserSession backed by one DevTools tab"""
+
+    def __init__(self, tab, loop):
+        self.driver = TabDriver(tab, loop)
+
+    def quit(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def page_loaded(self, url):
+        pass
+
+    def ensure_healthy(self):
+        if self.driver.tab.crashed:
+            raise CDPConnectionClosed("Tab crashed")
+
+    def is_session_error(self, error):
+        return isinstance(error, CDPConnectionClosed)
+
+
+_DONE = object()
+
+
+class AsyncCrawler:
+    """Crawl engine rendering many pages at once in the tabs of one headless Chrome.
+
+    Chrome is driven over the DevTools protocol from an asyncio event loop on
+    a background thread: every tab navigates independently, link checks are
+    async HEAD requests through one shared connection pool, and pages are
+    scanned by the regular Webcrawler scanners (one per tab), so the
+    crawledPage/ProjectNotification output is the same as with Selenium.
+
+    It has the Webcrawler interface CrawlerService uses: iter_crawl() yields
+    the same events, and checkpoints put pages that were rendered but not yet
+    handed to the consumer back into the frontier. The crawl is breadth-first
+    up to the order in which concurrent pages finish.
+    """
+
+    def __init__(self, url, maxCrawlDepth=1, maxTitleLength=60, max_workers=10, scan_cache=None, url_filter=None, scope=None, page_load=None, tabs=None):
+        self.url = url
+        self.maxCrawlDepth = maxCrawlDepth
+        self.maxTitleLength = maxTitleLength
+        self.max_workers = max_workers
+        self.scan_cache = scan_cache
+        self.url_filter = url_filter if url_filter is not None else UrlFilter()
+        self.scope = scope if scope is not None else CrawlScope(url)
+        self.page_load = page_load if page_load is not None else PageLoadPolicy()
+        self.tabs = tabs or TABS
+        self.link_graph = None
+        self.stop_check = None
+        self.stop_reason = None
+        self.checkpoint_callback = None
+        self.checkpoint_interval = 25
+        self.current_depth = 0
+        self.to_visit = deque([(url, 0)])
+        self.linksVisited = set()
+        self.urls_in_queue = {self.normalize_url(url)}
+        self.persisted_urls = set()
+        # Frontier state shared between the event loop and the consumer thread
+        self.frontier_lock = threading.Lock()
+        self.in_flight = {}  # normalized URL -> (url, depth) being rendered
+        self.unconsumed = {}  # normalized page URL -> (normalized URL, url, depth) rendered, not yet yielded
+        self.scanners = []
+        self.pages_skipped_failed = 0
+        self.closing = False
+        self.loop = None
+        self.http = None
+        self.link_slots = None
+
+    def normalize_url(self, url):
+        return url_normalizer.normalize_url(url)
+
+    @property
+    def pages_rendered(self):
+        return sum(scanner.pages_rendered for scanner in self.scanners)
+
+    @property
+    def pages_failed(self):
+        return self.pages_skipped_failed + sum(scanner.pages_failed for scanner in self.scanners)
+
+    def set_stop_check(self, stop_check):
+        """Set a callable(crawler) that returns a reason (e.g. "cancelled") when the crawl must stop"""
+        self.stop_check = stop_check
+
+    def should_stop(self):
+        """Check whether the crawl has to end early; once stopped it stays stopped"""
+        if self.stop_reason is None and self.stop_check is not None:
+            reason = self.stop_check(self)
+            if reason:
+                self.stop_reason = reason
+        return self.stop_reason is not None
+
+    def set_checkpoint_callback(self, callback, interval=25):
+        """Set a callback that receives the crawl state every `interval` pages"""
+        self.checkpoint_callback = callback
+        self.checkpoint_interval = max(1, interval)
+
+    def get_checkpoint(self):
+        """Return a JSON-serializable snapshot of the crawl frontier.
+
+        Pages that are still rendering or waiting for the consumer are saved as
+        unvisited, so a resume renders them again instead of losing them. As
+        with Webcrawler, the visited set is rebuilt from the saved pages.
+        """
+        with self.frontier_lock:
+            to_visit = [[url, depth] for url, depth in self.in_flight.values()]
+            to_visit.extend([url, depth] for _, url, depth in self.unconsumed.values())
+            to_visit.extend([url, depth] for url, depth in self.to_visit)
+            return {
+                "current_depth": self.current_depth,
+                "to_visit": to_visit,
+            }
+
+    def restore_checkpoint(self, state, persisted_urls=(), visited_urls=()):
+        """Resume from a snapshot produced by get_checkpoint()"""
+        self.current_depth = state.get("current_depth", 0)
+        self.to_visit = deque((url, depth) for url, depth in state.get("to_visit", []))
+        self.linksVisited = set(state.get("links_visited", []))
+        self.linksVisited.update(visited_urls)
+        self.linksVisited.difference_update(self.normalize_url(url) for url, _ in self.to_visit)
+        self.urls_in_queue = set(self.linksVisited)
+        self.urls_in_queue.update(self.normalize_url(url) for url, _ in self.to_visit)
+        self.persisted_urls = set(persisted_urls)
+        logger.info(f"Restored crawl checkpoint: {len(self.linksVisited)} visited, {len(self.to_visit)} queued")
+
+    def pages_crawled(self):
+        """Pages of this job rendered so far, including those saved before a resume"""
+        return self.pages_rendered + len(self.persisted_urls)
+
+    def get_stats(self):
+        """Frontier and page counters for progress reporting"""
+        return {
+            "discovered": len(self.urls_in_queue),
+            "rendered": self.pages_rendered,
+            "failed": self.pages_failed,
+            "frontier": len(self.to_visit) + len(self.in_flight),
+        }
+
+    def close(self):
+        pass
+
+    def iter_crawl(self):
+        """Crawl the website, yielding PageCrawled and LinksDiscovered events.
+
+        The crawl runs on its own thread; at most a few pages per tab wait for
+        the consumer, so a slow consumer slows the crawl down instead of
+        buffering pages.
+        """
+        events = queue.Queue(maxsize=self.tabs * 2)
+        thread = threading.Thread(target=self._run, args=(events,), name="async-crawler", daemon=True)
+        thread.start()
+        pages_since_checkpoint = 0
+        try:
+            while True:
+                # The stop check may query the database, so it runs here and not on the event loop
+                self.should_stop()
+                try:
+                    event = events.get(timeout=STOP_CHECK_SECONDS)
+                except queue.Empty:
+                    continue
+                if event is _DONE:
+                    break
+                if isinstance(event, BaseException):
+                    raise event
+                yield event
+                if isinstance(event, PageCrawled):
+                    with self.frontier_lock:
+                        self.unconsumed.pop(self.normalize_url(event.page.url), None)
+                    pages_since_checkpoint += 1
+                    if pages_since_checkpoint >= self.checkpoint_interval and self.checkpoint_callback:
+                        pages_since_checkpoint = 0
+                        try:
+                            self.checkpoint_callback(self.get_checkpoint())
+                        except Exception as e:
+                            logger.error(f"Error saving crawl checkpoint: {e}")
+        finally:
+            # Unblock the crawl thread if the consumer stopped early
+            self.closing = True
+            while thread.is_alive():
+                try:
+                    events.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+        print(f"Finished crawling {self.url}. Visited {len(self.linksVisited)} pages.")
+
+    def _run(self, events):
+        try:
+            asyncio.run(self._crawl(events))
+        except BaseException as e:
+            events.put(e)
+        finally:
+            events.put(_DONE)
+
+    async def _crawl(self, events):
+        # Imported here so aiohttp is only needed when the async engine is used
+        import aiohttp
+
+        self.loop = asyncio.get_running_loop()
+        chrome = ChromeProcess()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.tabs, thread_name_prefix="tab-scan")
+        self.http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=3))
+        self.link_slots = asyncio.Semaphore(LINK_CHECKS)
+        connection = CDPConnection(self.http)
+        workers = []
+        try:
+            await connection.connect(await chrome.start())
+            workers = [asyncio.ensure_future(self._worker(connection, executor, events)) for _ in range(self.tabs)]
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Scans still running fail fast once the browser connection is gone;
+            # wait for them off the loop, which they may still call into
+            await connection.close()
+            await self.loop.run_in_executor(None, executor.shutdown)
+            await self.http.close()
+            await chrome.stop()
+
+    def _make_scanner(self, tab):
+        """A Webcrawler that renders and scans pages in one tab, sharing this crawl's frontier"""
+        scanner = Webcrawler(self.url, self.maxCrawlDepth, self.maxTitleLength, max_workers=self.max_workers,
+                             browser=TabBrowser(tab, self.loop), scan_cache=self.scan_cache,
+                             url_filter=self.url_filter, scope=self.scope, page_load=self.page_load)
+        # The sets are shared between tabs, so the scanner mutates them under this crawl's lock
+        scanner.frontier_lock = self.frontier_lock
+        scanner.linksVisited = self.linksVisited
+        scanner.urls_in_queue = self.urls_in_queue
+        scanner.link_graph = self.link_graph
+        scanner.set_stop_check(lambda _: self.stop_reason)
+        scanner.head_request = self.head_request
+        self.scanners.append(scanner)
+        return scanner
+
+    def head_request(self, href):
+        """HEAD a link on the event loop; called from scanner threads"""
+        return asyncio.run_coroutine_threadsafe(self._head(href), self.loop).result(30)
+
+    async def _head(self, href):
+        import aiohttp
+
+        async with self.link_slots:
+            try:
+                async with self.http.head(href, allow_redirects=True) as response:
+                    return response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                return None
+
+    def _next_url(self):
+        """Pop the next URL to render, or None if there is nothing to do right now"""
+        if self.closing or self.stop_reason is not None:
+            return None
+        with self.frontier_lock:
+            while self.to_visit:
+                url, depth = self.to_visit.popleft()
+                if depth > self.maxCrawlDepth:
+                    continue
+                normalized_url = self.normalize_url(url)
+                if normalized_url in self.linksVisited:
+                    continue
+                self.linksVisited.add(normalized_url)
+                # Leaf pages saved after the last checkpoint don't need rendering again
+                if normalized_url in self.persisted_urls and depth >= self.maxCrawlDepth:
+                    continue
+                self.current_depth = depth
+                self.in_flight[normalized_url] = (url, depth)
+                return url, depth, normalized_url
+        return None
+
+    async def _put(self, events, event):
+        while not self.closing:
+            try:
+                events.put_nowait(event)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.01)
+
+    async def _worker(self, connection, executor, events):
+        tab = CDPTab(connection)
+        await tab.open()
+        scanner = self._make_scanner(tab)
+        try:
+            while True:
+                item = self._next_url()
+                if item is None:
+                    # Pages still rendering in other tabs may queue more links
+                    if self.in_flight and not self.closing and self.stop_reason is None:
+                        await asyncio.sleep(0.05)
+                        continue
+                    if self.stop_reason is not None:
+                        logger.info(f"Stopping crawl of {self.url} early: {self.stop_reason}")
+                    return
+                url, depth, normalized_url = item
+                page, new_links = None, []
+                try:
+                    scanner.browser.ensure_healthy()
+                    page, new_links = await self.loop.run_in_executor(executor, scanner.crawl_page, url, depth)
+                except Exception as e:
+                    logger.error(f"Error crawling {url}: {e}")
+                    self.pages_skipped_failed += 1
+                finally:
+                    # The scanner queued the links for itself; the shared frontier takes them over
+                    scanner.to_visit.clear()
+                if connection.closed:
+                    raise CDPConnectionClosed("Browser connection lost")
+                if tab.crashed:
+                    logger.info(f"Tab crashed on {url}, opening a new one")
+                    await tab.close()
+                    tab = CDPTab(connection)
+                    await tab.open()
+                    scanner.browser = TabBrowser(tab, self.loop)
+                with self.frontier_lock:
+                    self.in_flight.pop(normalized_url, None)
+                    self.to_visit.extend((link, depth + 1) for link in new_links)
+                    if page is not None:
+                        self.unconsumed[self.normalize_url(page.url)] = (normalized_url, url, depth)
+                if page is not None:
+                    await self._put(events, PageCrawled(page, depth))
+                if new_links:
+                    await self._put(events, LinksDiscovered(url, new_links, depth + 1))
+        finally:
+            await tab.close()
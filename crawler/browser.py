@@ -0,0 +1,202 @@
+import os
+import time
+import logging
+from urllib.parse import urlparse
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import WebDriverException, InvalidSessionIdException
+import psutil
+
+from page_load import PAGE_LOAD_STRATEGY, set_scripts_enabled
+
+logger = logging.getLogger("browser")
+
+# Command line switches of every Chrome instance, shared with the async engine
+CHROME_ARGUMENTS = [
+    '--disable-infobars',
+    '--disable-gpu',
+    '--disable-logging',
+    '--disable-extensions',
+    '--disable-notifications',
+    '--disable-default-apps',
+    '--window-size=1920,1080',
+    '--headless=new',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    # Add more performance-enhancing options
+    '--blink-settings=imagesEnabled=false',  # Disable image loading
+]
+
+
+class BrowserSession:
+    """Owns the Chrome WebDriver and recycles it before it degrades.
+
+    The watchdog restarts the browser after a fixed number of pages, when the
+    chromedriver/Chrome process tree grows past a memory threshold, or when the
+    session stops responding.
+    """
+
+    def __init__(self, max_pages=None, max_memory_mb=None):
+        self.max_pages = max_pages if max_pages is not None else int(os.getenv("CRAWLER_BROWSER_MAX_PAGES", "500"))
+        self.max_memory_mb = max_memory_mb if max_memory_mb is not None else int(os.getenv("CRAWLER_BROWSER_MAX_MEMORY_MB", "1500"))
+        self.driver = None
+        self.pages_since_start = 0
+        self.restarts = 0
+        self.visited_origins = set()  # Origins whose storage is cleared on reset()
+        self.start()
+
+    def build_options(self):
+        """Chrome options used for every browser instance"""
+        chrome_options = Options()
+        for argument in CHROME_ARGUMENTS:
+            chrome_options.add_argument(argument)
+        chrome_options.add_experimental_option('excludeSwitches', ['enable-automation'])
+        chrome_options.add_experimental_option('useAutomationExtension', False)
+        # Navigations return early and the crawler waits for each page's own condition
+        chrome_options.page_load_strategy = PAGE_LOAD_STRATEGY
+
+        logging_prefs = {
+            'performance': 'INFO',
+            'browser': 'INFO'
+        }
+        chrome_options.set_capability('goog:loggingPrefs', logging_prefs)
+        return chrome_options
+
+    def start(self):
+        """Launch chromedriver and Chrome"""
+        chromedriver_path = os.getenv("CHROMEDRIVER_PATH", "/usr/bin/chromedriver")
+        service = Service(executable_path=chromedriver_path)
+
+        try:
+            self.driver = webdriver.Chrome(service=service, options=self.build_options())
+            # Scripts stay off unless the page load policy renders a shell
+            set_scripts_enabled(self.driver, False)
+            self.pages_since_start = 0
+            logger.info("WebDriver initialized successfully.")
+        except Exception as e:
+            logger.error(f"Failed to initialize WebDriver: {e}", exc_info=True)
+            try:
+                browser_logs = service.get_log('browser') if service else []
+                if browser_logs:
+                    logger.error("Browser logs during startup failure:")
+                    for entry in browser_logs:
+                        logger.error(entry)
+            except Exception as log_e:
+                logger.error(f"Could not retrieve browser logs: {log_e}")
+            raise
+
+    def quit(self):
+        """Shut down the browser, ignoring errors from an already dead session"""
+        if self.driver is None:
+            return
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error quitting WebDriver: {e}")
+        self.driver = None
+
+    def restart(self, reason):
+        """Replace the browser with a fresh instance"""
+        logger.warning(f"Restarting browser after {self.pages_since_start} pages: {reason}")
+        started = time.time()
+        self.quit()
+        self.start()
+        self.visited_origins.clear()
+        self.restarts += 1
+        logger.info(f"Browser restarted in {round((time.time() - started) * 1000)} ms")
+
+    def memory_usage_mb(self):
+        """Resident memory of chromedriver and all Chrome processes it spawned"""
+        try:
+            root = psutil.Process(self.driver.service.process.pid)
+            processes = [root] + root.children(recursive=True)
+        except Exception:
+            return None
+
+        rss = 0
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+            except psutil.Error:
+                continue
+        return rss / (1024 * 1024)
+
+    def is_responsive(self):
+        """Check that the WebDriver session still answers commands"""
+        try:
+            self.driver.execute_script("return 1;")
+            return True
+        except Exception:
+            return False
+
+    def is_session_error(self, error):
+        """Whether an exception means the browser session is gone"""
+        if isinstance(error, InvalidSessionIdException):
+            return True
+        if isinstance(error, WebDriverException):
+            return not self.is_responsive()
+        return False
+
+    def page_loaded(self, url):
+        """Record a navigation for the page-count recycling policy and storage reset"""
+        self.pages_since_start += 1
+        parsed = urlparse(url)
+        if parsed.scheme and parsed.netloc:
+            self.visited_origins.add(f"{parsed.scheme}://{parsed.netloc}")
+
+    def reset(self):
+        """Prepare a warm browser for the next job without restarting the process.
+
+        Opens a fresh tab as the new browsing context, closes the old ones and
+        clears cookies, cache, storage and the buffered performance log.
+        """
+        started = time.time()
+        try:
+            old_handles = list(self.driver.window_handles)
+            self.driver.switch_to.new_window('tab')
+            new_handle = self.driver.current_window_handle
+            for handle in old_handles:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.driver.switch_to.window(new_handle)
+            set_scripts_enabled(self.driver, False)
+
+            self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            self.driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+            for origin in self.visited_origins:
+                self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {
+                    'origin': origin,
+                    'storageTypes': 'all'
+                })
+            self.visited_origins.clear()
+
+            # Drain logs left over from the previous job
+            self.driver.get_log('performance')
+        except Exception as e:
+            logger.warning(f"Browser reset failed, restarting instead: {e}")
+            self.visited_origins.clear()
+            self.restart("reset failed")
+            return
+
+        logger.info(f"Browser reset in {round((time.time() - started) * 1000)} ms")
+
+    def check(self):
+        """Return the reason the browser needs a restart, or None if it is healthy"""
+        if self.driver is None:
+            return "no active session"
+        if self.max_pages and self.pages_since_start >= self.max_pages:
+            return f"page limit of {self.max_pages} reached"
+        if self.max_memory_mb:
+            memory_mb = self.memory_usage_mb()
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                return f"memory usage {memory_mb:.0f} MB exceeds {self.max_memory_mb} MB"
+        if not self.is_responsive():
+            return "session not responding"
+        return None
+
+    def ensure_healthy(self):
+        """Restart the browser if the watchdog finds a problem"""
+        reason = self.check()
+        if reason:
+            self.restart(reason)
@@ -0,0 +1,356 @@
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+
+import url_normalizer
+from page_load import STATE_SCRIPT, ORIGIN_SCRIPT
+
+logger = logging.getLogger("capture")
+
+# Set to a directory to record every crawl job into a capture archive
+CAPTURE_DIR = os.getenv("CRAWLER_CAPTURE_DIR", "")
+
+
+class ReplayMiss(Exception):
+    """A page was requested that is not in the capture archive"""
+
+
+def _key(by, value):
+    return f"{by}|{value}"
+
+
+def _script_key(script, args):
+    return json.dumps([script, list(args)], default=str)
+
+
+def _part_path(base, part):
+    """Path of one part of an archive: the first run of a job, then one per slice or resume"""
+    return f"{base}.jsonl.gz" if part == 0 else f"{base}.{part}.jsonl.gz"
+
+
+class CaptureWriter:
+    """Writes a capture archive: gzip-compressed JSON lines, one record per
+    rendered page plus one per checked link.
+
+    A page record holds the requested and final URL, the rendered DOM
+    (page_source), the performance log (network events), the results of every
+    script the crawler ran and the attributes it read from located elements.
+    Each slice or resume of a job writes the next numbered part of the job's
+    archive, so an earlier run is never overwritten.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.links = set()
+        self.pages = 0
+
+    @classmethod
+    def create(cls, job):
+        """Return a writer for the job if CRAWLER_CAPTURE_DIR is set, else None"""
+        if not CAPTURE_DIR:
+            return None
+        try:
+            os.makedirs(CAPTURE_DIR, exist_ok=True)
+            base = os.path.join(CAPTURE_DIR, f"project_{job['project_id']}_job_{job['queue_id']}")
+            part = 0
+            while os.path.exists(_part_path(base, part)):
+                part += 1
+            return cls(_part_path(base, part))
+        except Exception as e:
+            logger.error(f"Could not start capture for project {job['project_id']}: {e}")
+            return None
+
+    def write_page(self, record):
+        with self.lock:
+            self.file.write(json.dumps(dict(record, type="page"), default=str) + "\n")
+            self.pages += 1
+
+    def write_link(self, href, status_code):
+        with self.lock:
+            if href in self.links:
+                return
+            self.links.add(href)
+            self.file.write(json.dumps({"type": "link", "href": href, "status": status_code}) + "\n")
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+                logger.info(f"Captured {self.pages} pages and {len(self.links)} links to {self.path}")
+
+
+class CaptureArchive:
+    """A capture archive loaded for replay, including the parts written by later slices of the job"""
+
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+        self.links = {}
+        self.start_url = None
+        base = path[:-len(".jsonl.gz")] if path.endswith(".jsonl.gz") else path
+        self._load(path)
+        part = 1
+        while os.path.exists(_part_path(base, part)):
+            self._load(_part_path(base, part))
+            part += 1
+
+    def _load(self, path):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record.get("type") == "link":
+                        self.links[record["href"]] = record["status"]
+                    elif record.get("type") == "page":
+                        if self.start_url is None:
+                            self.start_url = record["url"]
+                        self.pages[url_normalizer.normalize_url(record["url"])] = record
+        except (EOFError, json.JSONDecodeError) as e:
+            # The worker writing this part was killed; keep what was written before
+            logger.warning(f"Capture archive {path} is truncated, loaded it up to the cut: {e}")
+
+    def get_page(self, url):
+        record = self.pages.get(url_normalizer.normalize_url(url))
+        if record is None:
+            raise ReplayMiss(f"{url} is not in capture archive {self.path}")
+        return record
+
+    def head_request(self, href):
+        """Recorded link check result; links that were never checked count as reachable"""
+        return self.links.get(href, 200)
+
+
+class RecordingElement:
+    """Element proxy that records the attributes read from it"""
+
+    def __init__(self, element, attributes):
+        self._element = element
+        self._attributes = attributes
+
+    def get_attribute(self, name):
+        value = self._element.get_attribute(name)
+        self._attributes[name] = value
+        return value
+
+    @property
+    def text(self):
+        value = self._element.text
+        self._attributes["#text"] = value
+        return value
+
+
+class RecordingDriver:
+    """WebDriver proxy that records everything the crawler reads from a page"""
+
+    def __init__(self, driver, writer):
+        self._driver = driver
+        self._writer = writer
+        self._lock = threading.Lock()
+        self._record = None
+        self._started = None
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+    def _finish_page(self):
+        if self._record is not None:
+            with self._lock:
+                self._record["current_url"] = self._driver.current_url
+                self._record["page_source"] = self._driver.page_source
+            self._writer.write_page(self._record)
+            self._record = None
+
+    def get(self, url):
+        # The previous page is complete once the crawler navigates away
+        self.close_capture()
+        self._started = time.time()
+        # Failed navigations are not recorded, so they fail on replay as well
+        self._driver.get(url)
+        self._record = {
+            "url": url,
+            "load_seconds": round(time.time() - self._started, 3),
+            "performance_log": None,
+            "scripts": {},
+            "elements": {},
+        }
+
+    def get_log(self, log_type):
+        entries = self._driver.get_log(log_type)
+        # The reads while waiting for the page and the scanners' read hold its network events
+        if log_type == "performance" and self._record is not None:
+            self._record["performance_log"] = (self._record["performance_log"] or []) + entries
+        return entries
+
+    def execute_script(self, script, *args):
+        result = self._driver.execute_script(script, *args)
+        if self._record is not None:
+            if script == STATE_SCRIPT:
+                # The page counts as loaded when the crawler's wait for it ends
+                self._record["load_seconds"] = round(time.time() - self._started, 3)
+            with self._lock:
+                self._record["scripts"][_script_key(script, args)] = result
+        return result
+
+    def find_elements(self, by, value):
+        elements = self._driver.find_elements(by, value)
+        if self._record is None:
+            return elements
+        attributes = [{} for _ in elements]
+        with self._lock:
+            self._record["elements"][_key(by, value)] = attributes
+        return [RecordingElement(element, attrs) for element, attrs in zip(elements, attributes)]
+
+    def close_capture(self):
+        """Write the current page; capture errors never fail the crawl"""
+        try:
+            self._finish_page()
+        except Exception as e:
+            logger.error(f"Error capturing page: {e}")
+            self._record = None
+
+
+class RecordingBrowser:
+    """BrowserSession proxy whose driver records into a capture archive.
+
+    Restarts and resets are passed through to the real session; the proxy
+    follows whatever driver the session currently has.
+    """
+
+    def __init__(self, browser, writer):
+        self._browser = browser
+        self._writer = writer
+        self._proxy = None
+
+    def __getattr__(self, name):
+        return getattr(self._browser, name)
+
+    @property
+    def driver(self):
+        driver = self._browser.driver
+        if self._proxy is None or self._proxy._driver is not driver:
+            if self._proxy is not None:
+                self._proxy.close_capture()
+            self._proxy = RecordingDriver(driver, self._writer)
+        return self._proxy
+
+    def close_capture(self):
+        if self._proxy is not None:
+            self._proxy.close_capture()
+
+
+class ReplayElement:
+    """Element with the attributes recorded during capture"""
+
+    def __init__(self, attributes):
+        self._attributes = attributes
+
+    def get_attribute(self, name):
+        return self._attributes.get(name)
+
+    @property
+    def text(self):
+        return self._attributes.get("#text") or ""
+
+
+class ReplayDriver:
+    """Serves recorded pages through the subset of the WebDriver API the crawler uses"""
+
+    def __init__(self, archive, simulate_load=False):
+        self.archive = archive
+        self.simulate_load = simulate_load
+        self.page = None
+        self.log_served = False
+        self.navigations = 0
+
+    def get(self, url):
+        self.page = self.archive.get_page(url)
+        self.log_served = False
+        self.navigations += 1
+        if self.simulate_load:
+            time.sleep(self.page.get("load_seconds") or 0)
+
+    def set_page_load_timeout(self, seconds):
+        pass
+
+    @property
+    def current_url(self):
+        return self.page["current_url"] if self.page else "about:blank"
+
+    @property
+    def page_source(self):
+        return self.page["page_source"] if self.page else ""
+
+    def get_log(self, log_type):
+        if log_type != "performance" or self.page is None or self.log_served:
+            return []
+        self.log_served = True
+        return self.page.get("performance_log") or []
+
+    def execute_script(self, script, *args):
+        # Recorded pages are always loaded, whatever the crawler waited for during capture
+        if script == ORIGIN_SCRIPT:
+            return self.navigations
+        if script == STATE_SCRIPT:
+            return [self.navigations, "complete"]
+        if self.page is None:
+            return None
+        return self.page["scripts"].get(_script_key(script, args))
+
+    def find_elements(self, by, value):
+        if self.page is None:
+            return []
+        return [ReplayElement(attributes) for attributes in self.page["elements"].get(_key(by, value), [])]
+
+    def quit(self):
+        pass
+
+
+class ReplayBrowser:
+    """Stand-in for BrowserSession that replays a capture archive, no browser or network needed"""
+
+    def __init__(self, archive, simulate_load=False):
+        self.driver = ReplayDriver(archive, simulate_load)
+
+    def start(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def restart(self, reason):
+        pass
+
+    def reset(self):
+        pass
+
+    def page_loaded(self, url):
+        pass
+
+    def ensure_healthy(self):
+        pass
+
+    def is_session_error(self, error):
+        return False
+
+
+def attach_recorder(crawler, writer):
+    """Record a Webcrawler's pages and link checks into a capture writer"""
+    crawler.browser = RecordingBrowser(crawler.browser, writer)
+    head_request = crawler.head_request
+
+    def recording_head_request(href):
+        status_code = head_request(href)
+        writer.write_link(href, status_code)
+        return status_code
+
+    crawler.head_request = recording_head_request
+
+
+def attach_replay(crawler, archive):
+    """Answer a Webcrawler's link checks from a capture archive"""
+    crawler.head_request = archive.head_request
@@ -0,0 +1,368 @@
+import os
+import time
+import zlib
+import socket
+import hashlib
+import logging
+from contextlib import contextmanager
+
+import url_normalizer
+from Webcrawler import Webcrawler, PageCrawled, LinksDiscovered
+
+logger = logging.getLogger("crawl_frontier")
+
+# Identifies this process in frontier claims
+NODE_ID = os.getenv("CRAWLER_NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# URLs a node claims at once, and how long a claim is valid without being renewed
+CLAIM_BATCH = int(os.getenv("CRAWLER_FRONTIER_CLAIM_BATCH", "10"))
+LEASE_SECONDS = int(os.getenv("CRAWLER_FRONTIER_LEASE_SECONDS", "300"))
+# Hosts are spread over this many shards; each node prefers its own range of them
+SHARDS = int(os.getenv("CRAWLER_FRONTIER_SHARDS", "64"))
+# How long a node waits for claimable URLs while other nodes hold the remaining leases
+IDLE_SECONDS = int(os.getenv("CRAWLER_FRONTIER_IDLE_SECONDS", "30"))
+# Claims of a URL before it is given up as failed, e.g. because it keeps crashing nodes
+MAX_ATTEMPTS = 2
+# First key of the advisory lock held while a node finalizes a job
+FINALIZE_LOCK = 4401
+
+# A node left a distributed job because all remaining URLs are claimed by other nodes
+STOP_DRAINED = "drained"
+
+CLAIM_QUERY = """
+    UPDATE crawl_frontier f
+    SET state = 'claimed', claimed_by = %s, lease_until = NOW() + make_interval(secs => %s), attempts = f.attempts + 1
+    FROM (
+        SELECT fingerprint FROM crawl_frontier
+        WHERE queue_id = %s AND attempts < %s
+          AND (state = 'queued' OR (state = 'claimed' AND lease_until < NOW()))
+        ORDER BY depth, MOD(shard - %s + %s, %s)
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ) c
+    WHERE f.queue_id = %s AND f.fingerprint = c.fingerprint
+    RETURNING f.url, f.depth, f.fingerprint
+"""
+
+INSERT_QUERY = """
+    INSERT INTO crawl_frontier (queue_id, fingerprint, url, depth, shard, state)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (queue_id, fingerprint) DO NOTHING
+"""
+
+STATS_QUERY = """
+    SELECT COUNT(*),
+           COUNT(*) FILTER (WHERE state = 'done'),
+           COUNT(*) FILTER (WHERE state = 'failed'),
+           COUNT(*) FILTER (WHERE state IN ('queued', 'claimed') AND attempts < %s),
+           COUNT(*) FILTER (WHERE state = 'claimed' AND lease_until >= NOW())
+    FROM crawl_frontier WHERE queue_id = %s
+"""
+
+STATS_FIELDS = ("discovered", "done", "failed", "pending", "claimed")
+
+
+def fingerprint(normalized_url):
+    """64-bit fingerprint of a normalized URL, the frontier's key"""
+    return int.from_bytes(hashlib.blake2b(normalized_url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+def host_shard(url):
+    return zlib.crc32(url_normalizer.get_base_domain(url).encode("utf-8")) % SHARDS
+
+
+class SharedFrontier:
+    """Frontier of one job in the crawl_frontier table, shared by every node crawling it.
+
+    URLs are keyed by fingerprint, so each one is queued once per job no
+    matter which node discovers it. Nodes claim small batches with
+    FOR UPDATE SKIP LOCKED; a claim is a lease that other nodes take over once
+    it expires, so the URLs of a node that died are crawled again. Claims
+    prefer the node's own range of host shards, spreading the hosts of a
+    multi-host site over the nodes.
+    """
+
+    def __init__(self, db, job, node_id=None):
+        self.db = db
+        self.job = job
+        self.queue_id = job["queue_id"]
+        self.node_id = node_id or NODE_ID
+        self.shard_offset = zlib.crc32(self.node_id.encode("utf-8")) % SHARDS
+
+    def add(self, links, depth, state="queued"):
+        """Queue links (or record them as rendered under another URL with state="alias"); known URLs are ignored"""
+        rows = []
+        for link in links:
+            rows.append((self.queue_id, fingerprint(url_normalizer.normalize_url(link)), link, depth,
+                         host_shard(link), state))
+        if not rows:
+            return
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            self.db.execute_many(cursor, "insert_frontier", INSERT_QUERY, rows)
+            cursor.close()
+
+    def claim(self, limit=None):
+        """Lease up to `limit` URLs to this node, shallowest first; returns (url, depth, fingerprint) tuples"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            self.db.execute(
+                cursor,
+                "claim_frontier",
+                CLAIM_QUERY,
+                (self.node_id, LEASE_SECONDS, self.queue_id, MAX_ATTEMPTS,
+                 self.shard_offset, SHARDS, SHARDS, limit or CLAIM_BATCH, self.queue_id)
+            )
+            rows = cursor.fetchall()
+            cursor.close()
+        return rows
+
+    def _update(self, name, statement, params):
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            self.db.execute(cursor, name, statement, params)
+            cursor.close()
+
+    def complete(self, fingerprints, state="done"):
+        """Mark claimed URLs as crawled ("done") or given up ("failed")"""
+        if not fingerprints:
+            return
+        self._update(
+            "complete_frontier",
+            """
+            UPDATE crawl_frontier SET state = %s, lease_until = NULL
+            WHERE queue_id = %s AND fingerprint = ANY(%s) AND claimed_by = %s
+            """,
+            (state, self.queue_id, list(fingerprints), self.node_id)
+        )
+
+    def release(self, fingerprints, retry=False):
+        """Hand claimed URLs back to the queue.
+
+        URLs released without `retry` were never tried, so the claim doesn't
+        count as an attempt.
+        """
+        if not fingerprints:
+            return
+        self._update(
+            "release_frontier",
+            """
+            UPDATE crawl_frontier
+            SET state = 'queued', claimed_by = NULL, lease_until = NULL,
+                attempts = CASE WHEN %s THEN attempts ELSE attempts - 1 END
+            WHERE queue_id = %s AND fingerprint = ANY(%s) AND claimed_by = %s AND state = 'claimed'
+            """,
+            (retry, self.queue_id, list(fingerprints), self.node_id)
+        )
+
+    def renew(self, fingerprints):
+        """Extend this node's leases on URLs it is still working on"""
+        if not fingerprints:
+            return
+        self._update(
+            "renew_frontier",
+            """
+            UPDATE crawl_frontier SET lease_until = NOW() + make_interval(secs => %s)
+            WHERE queue_id = %s AND fingerprint = ANY(%s) AND claimed_by = %s AND state = 'claimed'
+            """,
+            (LEASE_SECONDS, self.queue_id, list(fingerprints), self.node_id)
+        )
+
+    def drop_queued(self):
+        """Stop handing out URLs, e.g. once the job is cancelled or out of budget.
+
+        Expired leases are dropped too: the node holding them is gone, and
+        nodes joining a stopped job never claim them again, so they would keep
+        the job from being finalized.
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE crawl_frontier SET state = 'dropped'
+                WHERE queue_id = %s AND (state = 'queued' OR (state = 'claimed' AND lease_until < NOW()))
+                """,
+                (self.queue_id,)
+            )
+            cursor.close()
+
+    def root_urls(self):
+        """The start URL and where it redirected to, once crawled"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT url FROM crawl_frontier WHERE queue_id = %s AND state IN ('done', 'alias') AND depth = 0",
+                (self.queue_id,)
+            )
+            urls = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+        return urls
+
+    def _stats(self, cursor):
+        cursor.execute(STATS_QUERY, (MAX_ATTEMPTS, self.queue_id))
+        return dict(zip(STATS_FIELDS, cursor.fetchone()))
+
+    def stats(self):
+        """Job-wide counters: discovered, done, failed, pending (claimable or claimed) and claimed (live leases)"""
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            stats = self._stats(cursor)
+            cursor.close()
+        return stats
+
+    @contextmanager
+    def finalizing(self):
+        """Hold the job's coordinator lock while its frontier is finished.
+
+        Yields the final stats, or None if another node is finalizing, the job
+        was finalized already or URLs are still pending, and the cursor of the
+        transaction holding the lock. The lock is held until the block ends, so
+        exactly one node finalizes a job. Frontier rows are locked by that
+        transaction, so the block has to delete them through this cursor.
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", (FINALIZE_LOCK, self.queue_id))
+            locked = cursor.fetchone()[0]
+            stats = None
+            if locked:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM crawl_queue WHERE id = %s)", (self.queue_id,))
+                if cursor.fetchone()[0]:
+                    stats = self._stats(cursor)
+                    if stats["pending"] or stats["claimed"]:
+                        stats = None
+            if stats is not None:
+                # URLs that used up their attempts are failures
+                cursor.execute(
+                    """
+                    UPDATE crawl_frontier SET state = 'failed'
+                    WHERE queue_id = %s AND state IN ('queued', 'claimed')
+                    """,
+                    (self.queue_id,)
+                )
+                stats = self._stats(cursor)
+            yield stats, cursor
+            cursor.close()
+
+
+class DistributedCrawler(Webcrawler):
+    """Webcrawler that takes its URLs from a SharedFrontier instead of a local queue.
+
+    Pages are rendered and scanned as usual. Discovered links go to the
+    shared frontier, and claimed URLs are only marked done after
+    `before_commit` (which flushes buffered results) returned, so a node that
+    dies loses no saved pages and its unfinished URLs are re-leased.
+    """
+
+    def __init__(self, url, frontier, *args, before_commit=None, **kwargs):
+        super().__init__(url, *args, **kwargs)
+        self.frontier = frontier
+        self.before_commit = before_commit
+        self.to_visit.clear()
+        self.frontier_stats = dict.fromkeys(STATS_FIELDS, 0)
+        self.stats_refreshed = 0
+
+    def refresh_stats(self, force=False):
+        # Shared counters are read at most every few seconds
+        if force or time.time() - self.stats_refreshed >= 5:
+            self.frontier_stats = self.frontier.stats()
+            self.stats_refreshed = time.time()
+            # A start URL redirecting to another host moves the site there; the node
+            # that rendered it widened its scope, the others follow here
+            for url in self.frontier.root_urls():
+                if not self.is_internal(url):
+                    self.scope.allow_host(self.get_base_domain(url))
+        return self.frontier_stats
+
+    def pages_crawled(self):
+        """Pages of the whole job crawled so far, by every node"""
+        return self.frontier_stats["done"]
+
+    def get_stats(self):
+        stats = self.refresh_stats()
+        return {
+            "discovered": stats["discovered"],
+            "rendered": stats["done"],
+            "failed": stats["failed"],
+            "frontier": stats["pending"],
+            "saved": stats["done"],
+        }
+
+    def commit(self, done, failed):
+        """Mark finished URLs once their results are in the database"""
+        if self.before_commit is not None:
+            self.before_commit()
+        self.frontier.complete(done)
+        self.frontier.complete(failed, state="failed")
+
+    def iter_crawl(self):
+        """Crawl claimed batches until the shared frontier is exhausted, yielding the usual events.
+
+        Stops with STOP_DRAINED when every remaining URL stayed leased by other
+        nodes for IDLE_SECONDS; the node holding the last lease finishes the job.
+        """
+        self.frontier.add([self.url], 0)
+        self.refresh_stats(force=True)
+        idle_since = None
+        while not self.should_stop():
+            batch = self.frontier.claim()
+            if not batch:
+                if not self.refresh_stats(force=True)["pending"]:
+                    break
+                # Pages leased by other nodes may still queue more links
+                idle_since = idle_since or time.time()
+                if time.time() - idle_since >= IDLE_SECONDS:
+                    self.stop_reason = STOP_DRAINED
+                    break
+                time.sleep(1)
+                continue
+            idle_since = None
+            claimed_at = time.time()
+            done, failed = [], []
+            remaining = [fp for _, _, fp in batch]
+            try:
+                for url, depth, fp in batch:
+                    if self.should_stop():
+                        break
+                    if time.time() - claimed_at > LEASE_SECONDS / 2:
+                        self.frontier.renew(remaining)
+                        claimed_at = time.time()
+                    self.current_depth = depth
+                    self.linksVisited.add(self.normalize_url(url))
+                    page, new_links = None, []
+                    failures = self.pages_failed
+                    try:
+                        self.browser.ensure_healthy()
+                        page, new_links = self.crawl_page(url, depth)
+                        (failed if self.pages_failed > failures else done).append(fp)
+                    except Exception as e:
+                        logger.error(f"Error crawling {url}: {e}")
+                        self.pages_failed += 1
+                        if self.browser.is_session_error(e):
+                            # Another attempt, possibly on another node, once the browser is back
+                            self.frontier.release([fp], retry=True)
+                            self.browser.restart("browser session died")
+                        else:
+                            failed.append(fp)
+                    finally:
+                        remaining.remove(fp)
+                        self.to_visit.clear()
+
+                    if page is not None:
+                        # Redirect and canonical targets count as crawled for every node, but
+                        # not as pages of their own: only "done" URLs were saved
+                        rendered = [page.url] if self.normalize_url(page.url) != self.normalize_url(url) else []
+                        if page.canonical_url and self.follow_canonical:
+                            rendered.append(page.canonical_url)
+                        self.frontier.add(rendered, depth, state="alias")
+                        yield PageCrawled(page, depth)
+                        page = None
+                    if new_links:
+                        self.frontier.add(new_links, depth + 1)
+                        yield LinksDiscovered(url, new_links, depth + 1)
+            finally:
+                # URLs of the batch that were never tried go back to the other nodes
+                self.frontier.release(remaining)
+                self.commit(done, failed)
+            self.refresh_stats()
+
+        print(f"Finished crawling {self.url} on node {self.frontier.node_id}. Rendered {self.pages_rendered} pages.")
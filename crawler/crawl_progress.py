@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger("crawl_progress")
+
+
+class CrawlProgress:
+    """Per-job progress counters, written to crawl_progress in batches.
+
+    The dashboard reads one row per project instead of counting crawl_result
+    rows. Updates are flushed every `flush_pages` saved pages or
+    `flush_seconds`, whichever comes first, and can optionally be announced
+    with NOTIFY on the crawl_progress channel.
+    """
+
+    def __init__(self, db, job, flush_pages=None, flush_seconds=None):
+        self.db = db
+        self.job = job
+        self.flush_pages = flush_pages if flush_pages is not None else int(os.getenv("CRAWLER_PROGRESS_FLUSH_PAGES", "10"))
+        self.flush_seconds = flush_seconds if flush_seconds is not None else float(os.getenv("CRAWLER_PROGRESS_FLUSH_SECONDS", "5"))
+        self.notify = os.getenv("CRAWLER_PROGRESS_NOTIFY", "0") == "1"
+        self.started = time.time()
+        self.last_flush = 0
+        self.pages_since_flush = 0
+        self.pages_saved = 0
+        self.pages_discovered = 0
+        self.pages_rendered = 0
+        self.pages_failed = 0
+        self.frontier_size = 0
+
+    def page_saved(self, count=1):
+        """Count saved pages"""
+        self.pages_saved += count
+        self.pages_since_flush += count
+
+    def update_from_crawler(self, crawler):
+        """Take the frontier counters from the running crawler"""
+        stats = crawler.get_stats()
+        self.pages_discovered = stats["discovered"]
+        self.pages_rendered = stats["rendered"]
+        self.pages_failed = stats["failed"]
+        self.frontier_size = stats["frontier"]
+        # Distributed jobs count the pages saved by every node
+        if "saved" in stats:
+            self.pages_saved = stats["saved"]
+
+    def eta_seconds(self):
+        """Estimate remaining time from the average time per processed page"""
+        processed = self.pages_rendered + self.pages_failed
+        if processed == 0:
+            return None
+        per_page = (time.time() - self.started) / processed
+        return round(per_page * self.frontier_size)
+
+    def maybe_flush(self, crawler):
+        """Flush if enough pages were saved or enough time passed since the last write"""
+        if (self.pages_since_flush >= self.flush_pages or
+                time.time() - self.last_flush >= self.flush_seconds):
+            self.update_from_crawler(crawler)
+            self.flush()
+
+    def flush(self, status="running"):
+        """Write the current counters to the progress row"""
+        self.pages_since_flush = 0
+        self.last_flush = time.time()
+        row = {
+            "project_id": self.job["project_id"],
+            "queue_id": self.job["queue_id"],
+            "status": status,
+            "pages_discovered": self.pages_discovered,
+            "pages_rendered": self.pages_rendered,
+            "pages_saved": self.pages_saved,
+            "pages_failed": self.pages_failed,
+            "frontier_size": self.frontier_size,
+            "eta_seconds": self.eta_seconds() if status == "running" else 0,
+        }
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                self.db.execute(
+                    cursor,
+                    "upsert_crawl_progress",
+                    """
+                    INSERT INTO crawl_progress
+                    (project_id, queue_id, status, pages_discovered, pages_rendered, pages_saved,
+                     pages_failed, frontier_size, eta_seconds, started_at, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (project_id) DO UPDATE SET
+                        queue_id = EXCLUDED.queue_id,
+                        status = EXCLUDED.status,
+                        pages_discovered = EXCLUDED.pages_discovered,
+                        pages_rendered = EXCLUDED.pages_rendered,
+                        pages_saved = EXCLUDED.pages_saved,
+                        pages_failed = EXCLUDED.pages_failed,
+                        frontier_size = EXCLUDED.frontier_size,
+                        eta_seconds = EXCLUDED.eta_seconds,
+                        started_at = EXCLUDED.started_at,
+                        updated_at = EXCLUDED.updated_at
+                    """,
+                    (row["project_id"], row["queue_id"], row["status"], row["pages_discovered"],
+                     row["pages_rendered"], row["pages_saved"], row["pages_failed"], row["frontier_size"],
+                     row["eta_seconds"], datetime.fromtimestamp(self.started), datetime.now())
+                )
+                if self.notify:
+                    cursor.execute("SELECT pg_notify('crawl_progress', %s)", (json.dumps(row),))
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error writing progress for project {self.job['project_id']}: {e}")
@@ -0,0 +1,176 @@
+import os
+import logging
+from functools import lru_cache
+
+import url_normalizer
+
+logger = logging.getLogger("crawl_scope")
+
+SUFFIX_LIST_PATH = os.getenv(
+    "CRAWLER_PUBLIC_SUFFIX_LIST",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+)
+
+# Crawl scope modes: "host" only follows the project's exact host, "domain"
+# everything under its registrable domain (www., shop., ...)
+SCOPE_HOST = "host"
+SCOPE_DOMAIN = "domain"
+DEFAULT_SCOPE = os.getenv("CRAWLER_DEFAULT_SCOPE", SCOPE_DOMAIN)
+
+_rules = None
+
+
+def _to_ascii(rule):
+    """IDNA-encode a rule, since hosts are compared in their normalized ASCII form"""
+    try:
+        return rule.encode("idna").decode("ascii")
+    except UnicodeError:
+        return rule
+
+
+def _load_rules():
+    """Read the public suffix list into (rules, wildcards, exceptions) sets"""
+    rules, wildcards, exceptions = set(), set(), set()
+    try:
+        with open(SUFFIX_LIST_PATH, encoding="utf-8") as f:
+            for line in f:
+                rule = line.split()[0] if line.strip() else ""
+                if not rule or rule.startswith("//"):
+                    continue
+                rule = rule.lower()
+                if rule.startswith("!"):
+                    exceptions.add(_to_ascii(rule[1:]))
+                elif rule.startswith("*."):
+                    wildcards.add(_to_ascii(rule[2:]))
+                else:
+                    rules.add(_to_ascii(rule))
+    except OSError as e:
+        logger.error(f"Could not read public suffix list {SUFFIX_LIST_PATH}: {e}")
+    return rules, wildcards, exceptions
+
+
+def _get_rules():
+    global _rules
+    if _rules is None:
+        _rules = _load_rules()
+    return _rules
+
+
+def _is_ip(host):
+    return host.startswith("[") or host.replace(".", "").isdigit()
+
+
+def _match_suffix(labels):
+    """Length in labels of a host's public suffix, and whether a rule of the list matched.
+
+    Labels not covered by the list are treated as a one-label suffix, like
+    the "*" default rule of the public suffix algorithm.
+    """
+    rules, wildcards, exceptions = _get_rules()
+    # Find the longest matching suffix, walking from the full host down
+    for i in range(len(labels)):
+        candidate = ".".join(labels[i:])
+        if candidate in exceptions:
+            return len(labels) - i - 1, True
+        if candidate in rules:
+            return len(labels) - i, True
+        if i + 1 < len(labels) and ".".join(labels[i + 1:]) in wildcards:
+            return len(labels) - i, True
+    return 1, False
+
+
+def _strip_port(host):
+    return host.rsplit(":", 1)[0] if not host.startswith("[") else host
+
+
+@lru_cache(maxsize=url_normalizer.CACHE_SIZE)
+def registrable_domain(host):
+    """Return the registrable domain (public suffix plus one label) of a normalized host.
+
+    Ports are ignored; IP addresses and bare suffixes are returned unchanged.
+    """
+    host = _strip_port(host)
+    if not host or _is_ip(host):
+        return host
+    labels = host.split(".")
+    suffix_length, _ = _match_suffix(labels)
+
+    if suffix_length >= len(labels):
+        return host
+    return ".".join(labels[-(suffix_length + 1):])
+
+
+def has_known_suffix(host):
+    """Whether the public suffix list has a rule for a normalized host's suffix"""
+    host = _strip_port(host)
+    if not host or _is_ip(host):
+        return False
+    return _match_suffix(host.split("."))[1]
+
+
+class CrawlScope:
+    """Decides which hosts belong to a project's site.
+
+    A host is in scope if it is the root host, shares the root's registrable
+    domain (in "domain" mode) or matches one of the explicitly allowed hosts,
+    where "*.example.org" also allows every subdomain of example.org. The
+    verdict is cached per host, since the same few hosts are looked up for
+    every link and resource of every page.
+
+    Sites whose suffix is not in the public suffix list fall back to "host"
+    mode, as their registrable domain can't be told from a shared suffix.
+    """
+
+    def __init__(self, root_url, mode=None, allowed_hosts=None):
+        self.mode = mode if mode in (SCOPE_HOST, SCOPE_DOMAIN) else DEFAULT_SCOPE
+        self.root_host = url_normalizer.get_base_domain(root_url)
+        if self.mode == SCOPE_DOMAIN and not _is_ip(self.root_host) and not has_known_suffix(self.root_host):
+            logger.warning(f"Public suffix of {self.root_host} is unknown, limiting the crawl to that host")
+            self.mode = SCOPE_HOST
+        self.root_domain = registrable_domain(self.root_host)
+        self.allowed_hosts = set()
+        self.allowed_suffixes = []
+        for host in allowed_hosts or []:
+            self.allow_host(host)
+        self._cache = {}
+
+    @classmethod
+    def from_settings(cls, root_url, settings):
+        """Build the scope from a project's crawl settings"""
+        settings = settings or {}
+        return cls(root_url, settings.get("scope"), settings.get("allowed_hosts"))
+
+    def allow_host(self, host):
+        """Add a host (or "*.domain" pattern) to the scope"""
+        host = host.strip().lower()
+        if not host:
+            return
+        if host.startswith("*."):
+            self.allowed_suffixes.append(url_normalizer.normalize_host(host[2:]))
+        else:
+            self.allowed_hosts.add(url_normalizer.normalize_host(host))
+        self._cache = {}
+
+    def contains_host(self, host):
+        """Whether a normalized host belongs to the site"""
+        verdict = self._cache.get(host)
+        if verdict is None:
+            verdict = self._classify(host)
+            if len(self._cache) >= url_normalizer.CACHE_SIZE:
+                self._cache.clear()
+            self._cache[host] = verdict
+        return verdict
+
+    def _classify(self, host):
+        if host == self.root_host or host in self.allowed_hosts:
+            return True
+        for suffix in self.allowed_suffixes:
+            if host == suffix or host.endswith("." + suffix):
+                return True
+        if self.mode == SCOPE_DOMAIN:
+            return registrable_domain(host) == self.root_domain
+        return False
+
+    def contains(self, url):
+        """Whether a URL belongs to the site"""
+        return self.contains_host(url_normalizer.get_base_domain(url))
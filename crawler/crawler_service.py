@@ -1,10 +1,26 @@
 import os
+import json
 import time
 import logging
+import threading
 from datetime import datetime
-from urllib.parse import urlparse
 from dotenv import load_dotenv
-from Webcrawler import Webcrawler, crawledPage
+from Webcrawler import Webcrawler, crawledPage, PageCrawled
+from browser import BrowserSession
+from scan_cache import ScanCache
+from database import Database
+from crawl_progress import CrawlProgress
+from link_graph import LinkGraph
+from url_filter import UrlFilter
+from crawl_scope import CrawlScope
+from page_load import PageLoadPolicy
+from parquet_export import ParquetExporter
+from capture import CaptureWriter, attach_recorder
+from job_budget import JobBudget, STOP_CANCELLED, STOP_TIME_LIMIT, STOP_PAGE_LIMIT, STOP_SHUTDOWN, STOP_SLICE, install_signal_handlers, shutdown_requested
+from job_scheduler import CANDIDATES, CANDIDATES_QUERY, CANDIDATE_FIELDS, CLAIM_QUERY, STALE_SECONDS, pick_job, is_distributed
+from crawl_frontier import SharedFrontier, DistributedCrawler, STOP_DRAINED, NODE_ID
+from url_normalizer import normalize_url, clean_url
+from notification_groups import split_notifications, merge_groups, SAMPLE_URLS
 import psycopg2
 from psycopg2 import sql
 
@@ -25,6 +41,9 @@ logger = logging.getLogger("crawler_service")
 # Load environment variables
 load_dotenv()
 
+# Latest migration in migrations/ whose tables and columns the crawler uses
+SCHEMA_VERSION = "0001_crawler_schema"
+
 class CrawlerService:
     def __init__(self, max_depth=1, max_title_length=60):
         self.max_depth = max_depth
@@ -33,241 +52,867 @@ class CrawlerService:
         if not self.db_url:
             raise ValueError("DATABASE_URL environment variable not set")
         
-        # Initialize database connection
-        self.conn = None
-        self.connect_db()
+        # Worker threads per crawl; the connection pool is sized to match
+        self.max_workers = int(os.getenv("CRAWLER_WORKERS", "10"))
+        
+        # Initialize database connection pool
+        self.db = Database(self.db_url, int(os.getenv("CRAWLER_DB_POOL_SIZE", str(self.max_workers))))
+        self.check_schema()
         # Track URLs saved in the current session for a specific project
         self._saved_urls_this_session = set()
+        self._session_lock = threading.Lock()
+        # Compiled upsert statement per column set: columns -> (statement name, SQL)
+        self._upsert_statements = {}
+        # Crawl results waiting to be written in one batch
+        self._pending_results = []
+        self.write_batch_size = int(os.getenv("CRAWLER_WRITE_BATCH_SIZE", "50"))
+        # Record the internal link graph of each crawl
+        self.record_link_graph = os.getenv("CRAWLER_LINK_GRAPH", "1") == "1"
+        # Batches of superseded generation rows deleted per idle loop iteration
+        self.gc_batch_size = int(os.getenv("CRAWLER_GC_BATCH_SIZE", "5000"))
+        # Pages between frontier checkpoints
+        self.checkpoint_interval = int(os.getenv("CRAWLER_CHECKPOINT_INTERVAL", "25"))
+        # Browser kept warm between jobs
+        self.browser = None
+        # Scan results shared across jobs and projects, keyed by page content
+        self.scan_cache = ScanCache()
+        # Parquet export of the running job, if CRAWLER_EXPORT_DIR is set
+        self.exporter = None
+        # "selenium" renders one page at a time, "async" many tabs over DevTools
+        self.engine = os.getenv("CRAWLER_ENGINE", "selenium")
+        # Distributed jobs this worker left while other workers still had URLs leased:
+        # queue id -> time it left; they are not picked again for a while
+        self._left_jobs = {}
+        self.rejoin_seconds = int(os.getenv("CRAWLER_DISTRIBUTED_REJOIN_SECONDS", "30"))
 
     def connect_db(self):
-        """Establish database connection"""
+        """Establish the database connection pool"""
+        self.db.connect()
+
+    def check_schema(self):
+        """Make sure the migrations the crawler relies on have been applied.
+
+        The schema is shared with the API, so it is created by the migrations in
+        migrations/ (go run ./cmd/migrate) and not by the crawler.
+        """
+        with self.db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+            applied = cursor.fetchone()[0]
+            if applied:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM schema_migrations WHERE version = %s)", (SCHEMA_VERSION,))
+                applied = cursor.fetchone()[0]
+            cursor.close()
+        if not applied:
+            raise RuntimeError(f"Database migration {SCHEMA_VERSION} has not been applied, run `go run ./cmd/migrate` first")
+
+    def get_browser(self):
+        """Return the warm browser session, starting it if needed"""
+        if self.browser is None or self.browser.driver is None:
+            self.browser = BrowserSession()
+        return self.browser
+
+    def create_crawler(self, job):
+        """Create the crawl engine for a job"""
+        options = dict(scan_cache=self.scan_cache,
+                       url_filter=UrlFilter.from_settings(job.get('settings')),
+                       scope=CrawlScope.from_settings(job['url'], job.get('settings')),
+                       page_load=PageLoadPolicy.from_settings(job.get('settings')))
+        if self.engine == "async":
+            # Imported here so the async engine's dependencies are only needed when it is used
+            from async_engine import AsyncCrawler
+            return AsyncCrawler(job['url'], self.max_depth, self.max_title_length, max_workers=self.max_workers, **options)
+        return Webcrawler(job['url'], self.max_depth, self.max_title_length, max_workers=self.max_workers,
+                          browser=self.get_browser(), **options)
+
+    def reset_browser(self):
+        """Clear browser state between jobs so the next one starts from a clean context"""
+        if self.browser is None:
+            return
         try:
-            if self.conn is None or self.conn.closed:
-                self.conn = psycopg2.connect(self.db_url)
-                self.conn.autocommit = False 
-                logger.info("Connected to database")
+            self.browser.reset()
         except Exception as e:
-            logger.error(f"Database connection error: {e}")
-            raise
+            logger.error(f"Error resetting browser, discarding it: {e}")
+            self.browser.quit()
+            self.browser = None
 
     def get_next_crawl_job(self):
-        """Get the next crawl job from the queue"""
+        """Get the next crawl job from the queue, chosen by the fair-share scheduler"""
         try:
-            self.connect_db()
-            cursor = self.conn.cursor()
-            
-            # Get the next job with the earliest time_start
-            query = """
-            SELECT cq.id, cq.project_id, p.url 
-            FROM crawl_queue cq
-            JOIN projects p ON cq.project_id = p.id
-            ORDER BY cq.time_start ASC
-            LIMIT 1
-            """
-            
-            cursor.execute(query)
-            result = cursor.fetchone()
-            cursor.close()
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                
+                # The oldest queue entries with everything the scheduler weighs
+                cursor.execute(CANDIDATES_QUERY, (STALE_SECONDS, CANDIDATES))
+                candidates = [dict(zip(CANDIDATE_FIELDS, row)) for row in cursor.fetchall()]
+                
+                now = time.time()
+                self._left_jobs = {queue_id: left for queue_id, left in self._left_jobs.items()
+                                   if now - left < self.rejoin_seconds}
+                skip = set(self._left_jobs)
+                while True:
+                    result = pick_job(candidates, skip=skip)
+                    if result is None:
+                        break
+                    # Another worker may have claimed the job since the candidates were read
+                    distributed = is_distributed(result["settings"], result["last_crawl_pages"])
+                    cursor.execute(CLAIM_QUERY, (NODE_ID, result["queue_id"], distributed, STALE_SECONDS))
+                    if cursor.fetchone() is not None:
+                        break
+                    skip.add(result["queue_id"])
+                cursor.close()
             
             if result:
                 # Clear the saved URLs set when starting a new job
-                self._saved_urls_this_session.clear()
-                logger.info(f"Cleared saved URL cache for new job {result[0]}")
+                with self._session_lock:
+                    self._saved_urls_this_session.clear()
+                    if self._pending_results:
+                        logger.error(f"Dropping {len(self._pending_results)} crawl results of an earlier job that could not be written")
+                        self._pending_results = []
+                logger.info(f"Cleared saved URL cache for new job {result['queue_id']}")
                 return {
-                    "queue_id": result[0],
-                    "project_id": result[1],
-                    "url": result[2]
+                    "queue_id": result["queue_id"],
+                    "project_id": result["project_id"],
+                    "url": result["url"],
+                    # Queue ids only grow, so they double as generation ids
+                    "generation": result["queue_id"],
+                    "settings": result["settings"] or {},
+                    "run_seconds": result["run_seconds"] or 0,
+                    "distributed": distributed
                 }
             return None
             
         except Exception as e:
             logger.error(f"Error getting next crawl job: {e}")
-            if self.conn:
-                self.conn.rollback()
             return None
 
-    def save_crawl_result(self, project_id, crawled_page: crawledPage):
-        """Upsert crawl results to database, preventing duplicates within the same session"""
-        # Normalize URL before checking/saving (ensure consistency with Webcrawler normalization)
-        normalized_url = crawled_page.url # Placeholder: Use consistent normalization
+    def get_upsert_statement(self, conn, columns):
+        """Return the (name, SQL) of the crawl_result upsert for a column set, compiling it once"""
+        with self._session_lock:
+            statement = self._upsert_statements.get(columns)
+            if statement is None:
+                statement = self._compile_upsert(conn, columns)
+                self._upsert_statements[columns] = statement
+        return statement
+
+    def _compile_upsert(self, conn, columns):
+        insert_columns = ['project_id', 'generation', 'url', 'time_crawled'] + list(columns)
+        columns_sql = sql.SQL(", ").join(map(sql.Identifier, insert_columns))
+        values_placeholders_sql = sql.SQL(", ").join([sql.Placeholder()] * len(insert_columns))
+        
+        # Prepare the UPDATE SET part, excluding base columns like project_id, url
+        update_assignments = [sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(key)) for key in columns]
+        update_set_sql = sql.SQL(", ").join(update_assignments)
+
+        # Construct the final UPSERT query using sql.SQL.format
+        # Ensure the constraint name is correct
+        upsert_query = sql.SQL("""
+            INSERT INTO crawl_result ({columns})
+            VALUES ({placeholders})
+            ON CONFLICT (project_id, generation, url) DO UPDATE SET {update_set}
+        """).format(
+            columns=columns_sql,
+            placeholders=values_placeholders_sql,
+            update_set=update_set_sql
+        )
+        
+        return (f"upsert_crawl_result_{len(self._upsert_statements)}", upsert_query.as_string(conn))
+
+    def save_crawl_result(self, job, crawled_page: crawledPage):
+        """Buffer a crawl result for the job's generation, preventing duplicates within the same session.
+
+        Rows are written in batches; returns the number of pages written to the
+        database by this call (0 while the page is only buffered).
+        """
+        project_id = job['project_id']
+        # Pages are deduplicated by their normalized URL (same engine as the
+        # Webcrawler) but stored as they were crawled, minus fragment and
+        # stripped query parameters
+        url = clean_url(crawled_page.url)
+        
+        session_key = (project_id, normalize_url(crawled_page.url))
+        timestamp = datetime.now()
+        
+        # --- Data to potentially save/update --- 
+        # TODO: Populate this dict based on actual data extracted by Webcrawler
+        # This should mirror the columns in your crawl_result table you want to fill
+        data_to_save = {
+             'html': crawled_page.html,
+             'ttfb_ms': getattr(crawled_page, 'ttfb', None),
+             'render_time_ms': getattr(crawled_page, 'render_time', None)
+             # 'status_code': getattr(crawled_page, 'status_code', None),
+             # 'load_time_seconds': getattr(crawled_page, 'load_time_seconds', None),
+             # 'title': getattr(crawled_page, 'title', None),
+             # 'meta_description': getattr(crawled_page, 'meta_description', None),
+             # 'headers': json.dumps(getattr(crawled_page, 'headers', None)), 
+             # 'image_alt_issues_count': getattr(crawled_page, 'image_alt_issues_count', None),
+             # etc...
+         }
+         
+        # Filter out None values if necessary, depending on column constraints
+        valid_data = {k: v for k, v in data_to_save.items() if v is not None} # Example: Filter None
+        # valid_data = data_to_save # Or keep all
+        
+        # High-cardinality notifications are aggregated per (category, subject)
+        per_page_notifications, notification_groups = split_notifications(crawled_page.projectNotifications)
+        
+        pending = {
+            "url": url,
+            "columns": tuple(valid_data.keys()),
+            "values": [project_id, job['generation'], url, timestamp] + list(valid_data.values()),
+            "notifications": [
+                (project_id, job['generation'], url, notification.category, notification.message, timestamp)
+                for notification in per_page_notifications
+            ],
+            "groups": notification_groups,
+            "export": (url, timestamp, data_to_save['ttfb_ms'], data_to_save['render_time_ms'],
+                       getattr(crawled_page, 'canonical_url', None),
+                       [(notification.category, notification.message) for notification in per_page_notifications]),
+        }
+        
+        with self._session_lock:
+            if session_key in self._saved_urls_this_session:
+                logger.warning(f"Skipping duplicate save attempt for {url} in project {project_id} within this session.")
+                return 0
+            self._saved_urls_this_session.add(session_key)
+            self._pending_results.append(pending)
+            if len(self._pending_results) < self.write_batch_size:
+                return 0
+        
+        return self.flush_crawl_results(job)
+
+    def flush_crawl_results(self, job):
+        """Write all buffered crawl results and notifications in one transaction.
+
+        If the batch fails, its pages are retried one by one so that a single
+        bad row only loses its own page. If the transaction can't be written at
+        all, the pages stay buffered for the next flush. Returns the number of
+        pages written.
+        """
+        with self._session_lock:
+            batch = self._pending_results
+            self._pending_results = []
+        if not batch:
+            return 0
         
-        session_key = (project_id, normalized_url)
-        if session_key in self._saved_urls_this_session:
-            logger.warning(f"Skipping duplicate save attempt for {normalized_url} in project {project_id} within this session.")
-            return
-            
         try:
-            self.connect_db()
-            cursor = self.conn.cursor()
-            timestamp = datetime.now()
-            
-            # Base columns always present
-            base_columns = ['project_id', 'url', 'time_crawled']
-            base_values = [project_id, normalized_url, timestamp]
-            
-            # --- Data to potentially save/update --- 
-            # TODO: Populate this dict based on actual data extracted by Webcrawler
-            # This should mirror the columns in your crawl_result table you want to fill
-            data_to_save = {
-                 'html': crawled_page.html,
-                 'ttfb_ms': getattr(crawled_page, 'ttfb', None),
-                 'render_time_ms': getattr(crawled_page, 'render_time', None)
-                 # 'status_code': getattr(crawled_page, 'status_code', None),
-                 # 'load_time_seconds': getattr(crawled_page, 'load_time_seconds', None),
-                 # 'title': getattr(crawled_page, 'title', None),
-                 # 'meta_description': getattr(crawled_page, 'meta_description', None),
-                 # 'headers': json.dumps(getattr(crawled_page, 'headers', None)), 
-                 # 'image_alt_issues_count': getattr(crawled_page, 'image_alt_issues_count', None),
-                 # etc...
-             }
-             
-            # Filter out None values if necessary, depending on column constraints
-            valid_data = {k: v for k, v in data_to_save.items() if v is not None} # Example: Filter None
-            # valid_data = data_to_save # Or keep all
-
-            # Prepare dynamic parts of the query
-            insert_columns = base_columns + list(valid_data.keys())
-            all_values = base_values + list(valid_data.values())
-            
-            columns_sql = sql.SQL(", ").join(map(sql.Identifier, insert_columns))
-            values_placeholders_sql = sql.SQL(", ").join([sql.Placeholder()] * len(all_values))
-            
-            # Prepare the UPDATE SET part, excluding base columns like project_id, url
-            update_assignments = []
-            for key in valid_data.keys(): # Only update columns with actual data
-                update_assignments.append(sql.SQL("{col} = EXCLUDED.{col}").format(col=sql.Identifier(key)))
-            update_set_sql = sql.SQL(", ").join(update_assignments)
-
-            # Construct the final UPSERT query using sql.SQL.format
-            # Ensure the constraint name is correct
-            upsert_query = sql.SQL("""
-                INSERT INTO crawl_result ({columns})
-                VALUES ({placeholders})
-                ON CONFLICT (project_id, url) DO UPDATE SET {update_set}
-            """).format(
-                columns=columns_sql,
-                placeholders=values_placeholders_sql,
-                update_set=update_set_sql
-            )
+            written = batch
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SAVEPOINT flush_batch")
+                try:
+                    self._write_results(conn, cursor, job, batch)
+                except psycopg2.Error as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT flush_batch")
+                    logger.warning(f"Error saving {len(batch)} crawl results for project {job['project_id']}, "
+                                   f"retrying them one by one: {e}")
+                    written = []
+                    for pending in batch:
+                        cursor.execute("SAVEPOINT flush_page")
+                        try:
+                            self._write_results(conn, cursor, job, [pending])
+                            cursor.execute("RELEASE SAVEPOINT flush_page")
+                            written.append(pending)
+                        except psycopg2.Error as page_error:
+                            cursor.execute("ROLLBACK TO SAVEPOINT flush_page")
+                            logger.error(f"Could not save {pending['url']} for project {job['project_id']}: {page_error}")
+                cursor.close()
             
-            # Execute upsert
-            cursor.execute(upsert_query, all_values)
+            self.export_pages(job, written)
+            return len(written)
             
-            # --- Handle Notifications --- 
-            # Removed the delete statement to prevent overwriting notifications 
-            # from previous visits to the same URL within a single session.
-            # This might result in duplicate notifications appearing if a URL is processed multiple times.
-            # cursor.execute(
-            #     "DELETE FROM project_notifications WHERE project_id = %s AND url = %s",
-            #     (project_id, normalized_url)
-            # )
-            for notification in crawled_page.projectNotifications:
-                # Add ON CONFLICT DO NOTHING to gracefully handle duplicate notifications
-                # Assumes project_notifications_unique_key is on (project_id, url, category, message)
-                # If the constraint is different, adjust the ON CONFLICT target columns
+        except Exception as e:
+            logger.error(f"Database error saving {len(batch)} crawl results for project {job['project_id']}, "
+                         f"keeping them buffered: {e}")
+            with self._session_lock:
+                self._pending_results[:0] = batch
+        return 0
+
+    def _write_results(self, conn, cursor, job, batch):
+        # One prepared upsert per column set, executed in batched round trips
+        rows_by_columns = {}
+        for pending in batch:
+            rows_by_columns.setdefault(pending["columns"], []).append(pending["values"])
+        for columns, rows in rows_by_columns.items():
+            name, upsert_query = self.get_upsert_statement(conn, columns)
+            self.db.execute_many(cursor, name, upsert_query, rows)
+        
+        # --- Handle Notifications --- 
+        # Add ON CONFLICT DO NOTHING to gracefully handle duplicate notifications
+        # within the generation
+        notification_rows = [row for pending in batch for row in pending["notifications"]]
+        self.db.execute_many(
+            cursor,
+            "insert_project_notification",
+            """
+            INSERT INTO project_notifications 
+            (project_id, generation, url, category, message, timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (project_id, generation, url, category, message) DO NOTHING
+            """,
+            notification_rows
+        )
+        
+        # Add this batch's pages to the aggregated notification groups
+        groups = merge_groups((pending["url"], pending["groups"]) for pending in batch)
+        group_rows = [
+            (job['project_id'], job['generation'], category, subject, group["message"],
+             group["count"], group["urls"], datetime.now())
+            for (category, subject), group in groups.items()
+        ]
+        self.db.execute_many(
+            cursor,
+            "upsert_notification_group",
+            f"""
+            INSERT INTO project_notification_groups
+            (project_id, generation, category, subject, message, url_count, urls, timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (project_id, generation, category, subject) DO UPDATE SET
+                url_count = project_notification_groups.url_count + EXCLUDED.url_count,
+                urls = (project_notification_groups.urls || EXCLUDED.urls)[1:{SAMPLE_URLS}],
+                timestamp = EXCLUDED.timestamp
+            """,
+            group_rows
+        )
+
+    def export_pages(self, job, batch):
+        """Hand written pages to the Parquet exporter; export errors never fail the crawl"""
+        if self.exporter is None:
+            return
+        try:
+            for pending in batch:
+                url, crawled_at, ttfb_ms, render_time_ms, canonical_url, notifications = pending["export"]
+                self.exporter.add_page(url, crawled_at, ttfb_ms, render_time_ms, canonical_url,
+                                       notifications, pending["groups"])
+        except Exception as e:
+            logger.error(f"Parquet export failed for project {job['project_id']}, disabling it for this job: {e}")
+            self.exporter.abort()
+            self.exporter = None
+
+    def finish_export(self, job, link_graph, metrics):
+        """Add the link graph to the export and publish its files"""
+        if self.exporter is None:
+            return
+        try:
+            if link_graph is not None and metrics is not None:
+                self.exporter.add_link_graph(link_graph, metrics)
+            self.exporter.finish()
+        except Exception as e:
+            logger.error(f"Error finishing Parquet export for project {job['project_id']}: {e}")
+            self.exporter.abort()
+        self.exporter = None
+
+    def export_persisted_pages(self, job):
+        """Add pages saved before a resume to the export.
+
+        Aggregated notifications of those pages are only stored as groups with
+        sample URLs, so the export has their per-page notifications only.
+        """
+        if self.exporter is None:
+            return
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute(
                     """
-                    INSERT INTO project_notifications 
-                    (project_id, url, category, message, timestamp)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (project_id, url, category, message) DO NOTHING
+                    SELECT url, category, message FROM project_notifications
+                    WHERE project_id = %s AND generation = %s
                     """,
-                    (project_id, normalized_url, notification.category, notification.message, timestamp)
+                    (job['project_id'], job['generation'])
                 )
-            
-            self.conn.commit()
-            self._saved_urls_this_session.add(session_key)
-            
-        except psycopg2.Error as e: # Catch specific psycopg2 errors
-            logger.error(f"Database error saving crawl result for {normalized_url}: {e}")
-            if self.conn:
-                self.conn.rollback()
+                notifications = {}
+                for url, category, message in cursor.fetchall():
+                    notifications.setdefault(url, []).append((category, message))
+                cursor.execute(
+                    """
+                    SELECT url, time_crawled, ttfb_ms, render_time_ms FROM crawl_result
+                    WHERE project_id = %s AND generation = %s
+                    """,
+                    (job['project_id'], job['generation'])
+                )
+                for url, crawled_at, ttfb_ms, render_time_ms in cursor:
+                    self.exporter.add_page(url, crawled_at,
+                                           float(ttfb_ms) if ttfb_ms is not None else None,
+                                           float(render_time_ms) if render_time_ms is not None else None,
+                                           None, notifications.get(url, []))
+                cursor.close()
         except Exception as e:
-            logger.error(f"Unexpected error saving crawl result for {normalized_url}: {e}")
-            if self.conn:
-                self.conn.rollback()
+            logger.error(f"Error exporting resumed pages for project {job['project_id']}: {e}")
+
+    def save_checkpoint(self, job, state, link_graph=None):
+        """Persist the crawl frontier so the job can resume after a restart.
 
-    def remove_from_queue(self, queue_id):
-        """Remove processed job from queue"""
+        The part of the link graph recorded since the last checkpoint is
+        written in the same transaction.
+        """
+        # Buffered pages must be in the database before the frontier says they were visited
+        self.flush_crawl_results(job)
+        if self._pending_results:
+            logger.warning(f"Not saving checkpoint for job {job['queue_id']}, {len(self._pending_results)} crawl results are not written yet")
+            return
         try:
-            self.connect_db()
-            cursor = self.conn.cursor()
-            
-            cursor.execute(
-                "DELETE FROM crawl_queue WHERE id = %s",
-                (queue_id,)
-            )
+            marks = None
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                if link_graph is not None:
+                    marks = link_graph.save_delta(cursor, job['project_id'], job['generation'])
+                cursor.execute(
+                    """
+                    INSERT INTO crawl_checkpoint (queue_id, project_id, state, updated_at)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (queue_id) DO UPDATE SET state = EXCLUDED.state, updated_at = EXCLUDED.updated_at
+                    """,
+                    (job['queue_id'], job['project_id'], json.dumps(state), datetime.now())
+                )
+                cursor.close()
+            if marks is not None:
+                link_graph.saved = marks
+            logger.info(f"Saved checkpoint for job {job['queue_id']} ({len(state['to_visit'])} URLs queued)")
+        except Exception as e:
+            logger.error(f"Error saving checkpoint for job {job['queue_id']}: {e}")
+
+    def load_checkpoint(self, job):
+        """Load a previously saved frontier for the job, or None for a fresh crawl"""
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT state FROM crawl_checkpoint WHERE queue_id = %s",
+                    (job['queue_id'],)
+                )
+                result = cursor.fetchone()
+                cursor.close()
+            return result[0] if result else None
+        except Exception as e:
+            logger.error(f"Error loading checkpoint for job {job['queue_id']}: {e}")
+            return None
+
+    def load_link_graph(self, job, root_url):
+        """Load the link graph a resumed job saved with its checkpoints.
+
+        Returns None if it can't be read; the job then records no link graph.
+        """
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                link_graph = LinkGraph.load(cursor, job['project_id'], job['generation'], root_url)
+                cursor.close()
+            return link_graph
+        except Exception as e:
+            logger.error(f"Error loading link graph of job {job['queue_id']}, recording none: {e}")
+            return None
+
+    def get_persisted_urls(self, job):
+        """Normalized URLs of the pages already saved in the job's generation.
+
+        Returns (persisted, visited): all of them, and those saved before the
+        job's last checkpoint, which are the visited set of that checkpoint.
+        """
+        project_id = job['project_id']
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT cr.url, cr.time_crawled <= cc.updated_at
+                    FROM crawl_result cr
+                    LEFT JOIN crawl_checkpoint cc ON cc.queue_id = %s
+                    WHERE cr.project_id = %s AND cr.generation = %s
+                    """,
+                    (job['queue_id'], project_id, job['generation'])
+                )
+                persisted, visited = set(), set()
+                for url, before_checkpoint in cursor:
+                    persisted.add(normalize_url(url))
+                    if before_checkpoint:
+                        visited.add(normalize_url(url))
+                cursor.close()
+            return persisted, visited
+        except Exception as e:
+            logger.error(f"Error loading persisted URLs for project {project_id}: {e}")
+            return set(), set()
+
+    def remove_from_queue(self, queue_id, cursor=None):
+        """Remove processed job from queue, in the transaction of `cursor` if given"""
+        try:
+            if cursor is not None:
+                self._delete_job(cursor, queue_id)
+            else:
+                with self.db.connection() as conn:
+                    cursor = conn.cursor()
+                    self._delete_job(cursor, queue_id)
+                    cursor.close()
             
-            self.conn.commit()
             logger.info(f"Removed job {queue_id} from queue")
             
         except Exception as e:
             logger.error(f"Error removing job from queue: {e}")
-            if self.conn:
-                self.conn.rollback()
 
+    @staticmethod
+    def _delete_job(cursor, queue_id):
+        cursor.execute(
+            "DELETE FROM crawl_queue WHERE id = %s",
+            (queue_id,)
+        )
+        cursor.execute(
+            "DELETE FROM crawl_checkpoint WHERE queue_id = %s",
+            (queue_id,)
+        )
+        cursor.execute(
+            "DELETE FROM crawl_frontier WHERE queue_id = %s",
+            (queue_id,)
+        )
 
     def process_crawl_job(self, job):
         """Process a crawl job"""
+        if job.get('distributed'):
+            return self.process_distributed_job(job)
         logger.info(f"Processing crawl job for project {job['project_id']}, URL: {job['url']}")
         crawler = None # Initialize crawler to None
+        progress = None
+        capture = None
         try:
             # Initialize webcrawler with improved functionality
-            crawler = Webcrawler(job['url'], self.max_depth, self.max_title_length)
+            try:
+                crawler = self.create_crawler(job)
+            except Exception as e:
+                self.fail_job(job, e)
+                return
+            
+            progress = CrawlProgress(self.db, job)
+            self.exporter = ParquetExporter.create(job)
+            
+            # Record pages and link checks for offline replay if CRAWLER_CAPTURE_DIR is set
+            capture = CaptureWriter.create(job)
+            if capture is not None and not isinstance(crawler, Webcrawler):
+                logger.warning("Capture is only supported by the selenium engine, skipping it")
+                capture.close()
+                capture = None
+            if capture is not None:
+                attach_recorder(crawler, capture)
             
-            # Set up a callback to save pages as they're crawled
-            def save_page_callback(page: crawledPage):
-                # Pass the entire crawledPage object
-                self.save_crawl_result(job['project_id'], page)
+            # Wall-clock/page budget and cancellation, checked between pages
+            budget = JobBudget(self.db, job)
+            crawler.set_stop_check(budget.check)
+            
+            crawler.set_checkpoint_callback(
+                lambda state: self.save_checkpoint(job, state, crawler.link_graph),
+                self.checkpoint_interval
+            )
             
-            # Pass the callback to the crawler
-            crawler.set_callback(save_page_callback)
+            # Resume from the last checkpoint if the job was interrupted
+            checkpoint = self.load_checkpoint(job)
+            if self.record_link_graph:
+                root_url = crawler.normalize_url(job['url'])
+                # A resumed job continues the graph saved with its checkpoints
+                crawler.link_graph = self.load_link_graph(job, root_url) if checkpoint else LinkGraph(root_url)
+            if checkpoint:
+                persisted_urls, visited_urls = self.get_persisted_urls(job)
+                self._saved_urls_this_session.update((job['project_id'], url) for url in persisted_urls)
+                crawler.restore_checkpoint(checkpoint, persisted_urls, visited_urls)
+                progress.page_saved(len(persisted_urls))
+                self.export_persisted_pages(job)
+                logger.info(f"Resuming job {job['queue_id']} from checkpoint ({len(persisted_urls)} pages already saved)")
+            
+            progress.update_from_crawler(crawler)
+            progress.flush()
             
             # Start crawling - this will now save pages as it goes
-            crawler.crawl() # This blocks until crawl finishes
+            # Pages are streamed out of the crawler and saved as they arrive;
+            # this blocks until the crawl finishes or is stopped
+            for event in crawler.iter_crawl():
+                if isinstance(event, PageCrawled):
+                    progress.page_saved(self.save_crawl_result(job, event.page))
+                    progress.maybe_flush(crawler)
+            progress.page_saved(self.flush_crawl_results(job))
+            
+            if crawler.stop_reason in (STOP_SHUTDOWN, STOP_SLICE):
+                # The slice is over or the service is shutting down: keep the job
+                # queued so it resumes from here once it is scheduled again
+                self.save_checkpoint(job, crawler.get_checkpoint(), crawler.link_graph)
+                self.end_slice(job, budget.elapsed())
+                self.release_job(job)
+                progress.update_from_crawler(crawler)
+                progress.flush(status="paused" if crawler.stop_reason == STOP_SLICE else "interrupted")
+                logger.info(f"Paused crawl job {job['queue_id']} ({crawler.stop_reason}), it will resume from its checkpoint")
+                return
+            
+            metrics = None
+            if crawler.link_graph is not None:
+                metrics = self.save_link_graph(job, crawler.link_graph)
+            self.finish_export(job, crawler.link_graph, metrics)
+            
+            # Cancelled or out-of-budget jobs are finalized with what was crawled so far
+            status = crawler.stop_reason or "completed"
+            progress.update_from_crawler(crawler)
+            progress.flush(status=status)
             
-            # Update last_crawl timestamp in projects table after successful crawl
-            self.update_project_last_crawl(job['project_id'])
+            # Update last_crawl timestamp and switch the project to the new generation,
+            # unless a job stopped early saved nothing and would blank the previous results
+            if crawler.stop_reason and progress.pages_saved == 0:
+                self.update_project_last_crawl(job['project_id'])
+            else:
+                self.update_project_last_crawl(job['project_id'], job['generation'], progress.pages_saved)
             
             # Remove job from queue *after* successful processing and timestamp update
             self.remove_from_queue(job['queue_id'])
             
-            logger.info(f"Completed crawl job for project {job['project_id']}")
+            logger.info(f"Finished crawl job for project {job['project_id']} ({status})")
             
         except Exception as e:
             logger.error(f"Error processing crawl job {job.get('queue_id', '?')} for project {job.get('project_id', '?')}: {e}", exc_info=True) # Log traceback
-            # Optionally, update crawl status to 'error' in the database here
+            if progress is not None:
+                progress.update_from_crawler(crawler)
+                progress.flush(status="failed")
             # Don't remove from queue on error to allow potential retry or inspection
+            self.release_job(job)
         finally:
+            # Keep whatever was crawled in the job's (inactive) generation for a resume
+            self.flush_crawl_results(job)
+            # An unfinished export is rebuilt from scratch when the job resumes
+            if self.exporter is not None:
+                self.exporter.abort()
+                self.exporter = None
+            if capture is not None:
+                crawler.browser.close_capture()
+                capture.close()
              # Ensure crawler resources are released even if errors occur
             if crawler is not None: # Check if crawler was initialized
                 try:
                     crawler.close()
                 except Exception as close_err:
                     logger.error(f"Error closing crawler resources: {close_err}")
+            self.reset_browser()
+            logger.info(f"Scan cache: {self.scan_cache.hits} hits, {self.scan_cache.misses} misses, {len(self.scan_cache.entries)} entries; "
+                        f"link checks: {self.scan_cache.link_hits} hits, {self.scan_cache.link_misses} misses")
+            self.scan_cache.save()
                     
-    def update_project_last_crawl(self, project_id):
-        """Update the last_crawl timestamp for the project"""
+    def process_distributed_job(self, job):
+        """Crawl a share of a job whose frontier is shared with other workers.
+
+        This worker claims URLs from crawl_frontier until none are left. The
+        worker that finds the frontier finished finalizes the job; workers
+        that run out of URLs while others still hold leases leave the job to
+        them. The link graph is not recorded, as no worker sees every page.
+        """
+        logger.info(f"Joining distributed crawl job {job['queue_id']} for project {job['project_id']}, URL: {job['url']}")
+        crawler = None
         try:
-            self.connect_db()
-            cursor = self.conn.cursor()
-            timestamp = datetime.now()
-            cursor.execute(
-                "UPDATE projects SET last_crawl = %s WHERE id = %s",
-                (timestamp, project_id)
-            )
-            self.conn.commit()
+            frontier = SharedFrontier(self.db, job)
+            try:
+                crawler = DistributedCrawler(job['url'], frontier, self.max_depth, self.max_title_length,
+                                             max_workers=self.max_workers, browser=self.get_browser(), scan_cache=self.scan_cache,
+                                             url_filter=UrlFilter.from_settings(job.get('settings')),
+                                             scope=CrawlScope.from_settings(job['url'], job.get('settings')),
+                                             page_load=PageLoadPolicy.from_settings(job.get('settings')),
+                                             before_commit=lambda: self.flush_crawl_results(job))
+            except Exception as e:
+                self.fail_job(job, e)
+                return
+            progress = CrawlProgress(self.db, job)
+            budget = JobBudget(self.db, job)
+            crawler.set_stop_check(budget.check)
+            
+            for event in crawler.iter_crawl():
+                if isinstance(event, PageCrawled):
+                    progress.page_saved(self.save_crawl_result(job, event.page))
+                    progress.maybe_flush(crawler)
+            
+            if crawler.stop_reason in (STOP_CANCELLED, STOP_TIME_LIMIT, STOP_PAGE_LIMIT):
+                # The job ends for every worker; what is leased right now still finishes
+                frontier.drop_queued()
+            elif crawler.stop_reason is not None:
+                # Sliced, shutting down or drained: the job goes on without this worker
+                self.end_slice(job, budget.elapsed())
+                self._left_jobs[job['queue_id']] = time.time()
+                # Other workers still crawling keep the job's status at running
+                others_active = crawler.refresh_stats(force=True)["claimed"]
+                progress.update_from_crawler(crawler)
+                if crawler.stop_reason == STOP_DRAINED or others_active:
+                    progress.flush()
+                else:
+                    progress.flush(status="paused" if crawler.stop_reason == STOP_SLICE else "interrupted")
+                logger.info(f"Left distributed crawl job {job['queue_id']} ({crawler.stop_reason}) "
+                            f"after rendering {crawler.pages_rendered} pages")
+                return
+            
+            if not self.finalize_distributed_job(job, crawler.stop_reason or "completed", progress, crawler):
+                self._left_jobs[job['queue_id']] = time.time()
+                logger.info(f"Left distributed crawl job {job['queue_id']}, other workers are still finishing it")
+            
+        except Exception as e:
+            # Leases of this worker expire and its URLs are crawled by the others
+            logger.error(f"Error in distributed crawl job {job.get('queue_id', '?')} for project {job.get('project_id', '?')}: {e}", exc_info=True)
+        finally:
+            self.flush_crawl_results(job)
+            if crawler is not None:
+                try:
+                    crawler.close()
+                except Exception as close_err:
+                    logger.error(f"Error closing crawler resources: {close_err}")
+            self.reset_browser()
+            self.scan_cache.save()
+    
+    def finalize_distributed_job(self, job, status, progress, crawler):
+        """Finish a distributed job if its frontier is done and no other worker is finishing it.
+
+        Runs under the job's advisory lock: publishes the export, switches the
+        project to the new generation and removes the job from the queue in the
+        transaction holding the lock. Returns whether this worker finalized the job.
+        """
+        with crawler.frontier.finalizing() as (stats, cursor):
+            if stats is None:
+                return False
+            self.exporter = ParquetExporter.create(job)
+            self.export_persisted_pages(job)
+            self.finish_export(job, None, None)
+            
+            crawler.frontier_stats = stats
+            crawler.stats_refreshed = time.time()
+            progress.update_from_crawler(crawler)
+            progress.flush(status=status)
+            # A job that stopped early without saving anything keeps the previous results
+            if status != "completed" and stats["done"] == 0:
+                self.update_project_last_crawl(job['project_id'])
+            else:
+                self.update_project_last_crawl(job['project_id'], job['generation'], stats["done"])
+            self.remove_from_queue(job['queue_id'], cursor)
+        logger.info(f"Finished distributed crawl job for project {job['project_id']} ({status}, {stats['done']} pages)")
+        return True
+    
+    def save_link_graph(self, job, link_graph):
+        """Write the job's link graph and its metrics, replacing any partial earlier attempt.
+
+        Returns the computed metrics, or None if saving failed.
+        """
+        try:
+            metrics = link_graph.compute_metrics()
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                for table in ("crawl_link_edges", "crawl_link_nodes"):
+                    cursor.execute(
+                        sql.SQL("DELETE FROM {table} WHERE project_id = %s AND generation = %s").format(table=sql.Identifier(table)),
+                        (job['project_id'], job['generation'])
+                    )
+                link_graph.save(cursor, job['project_id'], job['generation'], metrics=metrics)
+                cursor.close()
+            return metrics
+        except Exception as e:
+            logger.error(f"Error saving link graph for project {job['project_id']}: {e}")
+            return None
+
+    def fail_job(self, job, error):
+        """End a job whose crawler can't be created; picking it again would fail the same way"""
+        logger.error(f"Cannot start crawl job {job['queue_id']} for project {job['project_id']}, removing it: {error}",
+                     exc_info=True)
+        CrawlProgress(self.db, job).flush(status="failed")
+        self.remove_from_queue(job['queue_id'])
+
+    def end_slice(self, job, run_seconds):
+        """Record the end of a job's slice so the scheduler treats it as waiting again"""
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                # Workers of a distributed job run side by side, so the longest one counts
+                cursor.execute(
+                    "UPDATE crawl_queue SET last_slice_at = %s, run_seconds = GREATEST(run_seconds, %s) WHERE id = %s",
+                    (datetime.now(), run_seconds, job['queue_id'])
+                )
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error ending slice of job {job['queue_id']}: {e}")
+
+    def release_job(self, job):
+        """Give up this worker's claim so the job can be scheduled again"""
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "UPDATE crawl_queue SET claimed_by = NULL, claimed_at = NULL WHERE id = %s AND claimed_by = %s",
+                    (job['queue_id'], NODE_ID)
+                )
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error releasing job {job['queue_id']}: {e}")
+
+    def update_project_last_crawl(self, project_id, generation=None, pages=None):
+        """Update the last_crawl timestamp and, if given, make the generation the active one.
+
+        `pages` is the size of the finished crawl, used by the scheduler to
+        estimate the next one. The active generation only moves forward: a job
+        that finishes after a newer one was activated leaves the project alone.
+        """
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                timestamp = datetime.now()
+                if generation is None:
+                    cursor.execute(
+                        "UPDATE projects SET last_crawl = %s WHERE id = %s",
+                        (timestamp, project_id)
+                    )
+                else:
+                    cursor.execute(
+                        """
+                        UPDATE projects
+                        SET last_crawl = %s, active_generation = %s, last_crawl_pages = COALESCE(%s, last_crawl_pages)
+                        WHERE id = %s AND active_generation <= %s
+                        """,
+                        (timestamp, generation, pages, project_id, generation)
+                    )
+                    if cursor.rowcount == 0:
+                        logger.warning(f"Not activating generation {generation} of project {project_id}, a newer one is active")
+                cursor.close()
             logger.info(f"Updated last_crawl time for project {project_id}")
         except Exception as e:
             logger.error(f"Error updating last_crawl time for project {project_id}: {e}")
-            if self.conn:
-                self.conn.rollback()
+
+    def collect_old_generations(self):
+        """Delete one batch of rows from generations older than their project's active one.
+
+        Returns the number of rows deleted. Generations of jobs that are still
+        in the queue are skipped, even if a newer generation is already active.
+        """
+        deleted = 0
+        try:
+            with self.db.connection() as conn:
+                cursor = conn.cursor()
+                for table in ("project_notifications", "project_notification_groups",
+                              "crawl_link_edges", "crawl_link_nodes", "crawl_result"):
+                    cursor.execute(
+                        sql.SQL("""
+                            DELETE FROM {table} WHERE ctid IN (
+                                SELECT t.ctid FROM {table} t
+                                JOIN projects p ON p.id = t.project_id
+                                WHERE t.generation < p.active_generation
+                                AND NOT EXISTS (SELECT 1 FROM crawl_queue q WHERE q.id = t.generation)
+                                LIMIT %s
+                            )
+                        """).format(table=sql.Identifier(table)),
+                        (self.gc_batch_size,)
+                    )
+                    deleted += cursor.rowcount
+                cursor.close()
+            if deleted:
+                logger.info(f"Garbage-collected {deleted} rows from old crawl generations")
+        except Exception as e:
+            logger.error(f"Error collecting old crawl generations: {e}")
+        return deleted
 
     def run(self):
         """Main service loop"""
         logger.info("Starting crawler service")
+        install_signal_handlers()
         
-        while True:
+        # Launch the browser up front so the first job doesn't pay the startup cost;
+        # the async engine starts its own browser per job
+        if self.engine != "async":
+            try:
+                self.get_browser()
+            except Exception as e:
+                logger.error(f"Failed to pre-warm browser: {e}")
+        
+        while not shutdown_requested():
             job = None # Ensure job is defined
             try:
                 # Get next job
@@ -276,16 +921,20 @@ class CrawlerService:
                 if job:
                     logger.info(f"Found job {job['queue_id']} for project {job['project_id']}")
                     self.process_crawl_job(job)
+                    # One bounded batch, so a busy queue doesn't starve the cleanup
+                    self.collect_old_generations()
                 else:
                     # logger.info("No jobs in queue, waiting...") # Reduce noise
-                    pass # No job, just wait
+                    # Use idle time to clean up superseded crawl generations
+                    if self.collect_old_generations():
+                        continue
                 
                 # Wait before checking again
                 time.sleep(5)
                 
             except psycopg2.OperationalError as db_err:
                  logger.error(f"Database operational error in main loop: {db_err}. Attempting reconnect...")
-                 self.close() # Close existing broken connection
+                 self.db.close() # Close existing broken connections
                  time.sleep(10) # Wait before trying to reconnect
                  try:
                       self.connect_db()
@@ -297,17 +946,16 @@ class CrawlerService:
                 proj_id = job['project_id'] if job else 'N/A'
                 logger.error(f"Error in main loop (Job: {job_id}, Project: {proj_id}): {e}", exc_info=True) # Log traceback
                 time.sleep(10) # Wait a bit longer after a general error
+        
+        logger.info("Shutdown requested, stopping crawler service")
 
     def close(self):
-        """Close database connection"""
+        """Close database connections and the warm browser"""
         self._saved_urls_this_session.clear() # Clear cache on close
-        if self.conn and not self.conn.closed:
-            try:
-                 self.conn.close()
-                 logger.info("Closed database connection")
-            except Exception as e:
-                 logger.error(f"Error closing database connection: {e}")
-        self.conn = None # Ensure conn is reset
+        if self.browser is not None:
+            self.browser.quit()
+            self.browser = None
+        self.db.close()
 
 if __name__ == "__main__":
     service = None # Ensure service is defined
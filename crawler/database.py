@@ -0,0 +1,107 @@
+import os
+import logging
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extras import execute_batch
+
+logger = logging.getLogger("database")
+
+
+class Database:
+    """Thread-safe Postgres connection pool with per-connection prepared statements.
+
+    Statements are written with %s placeholders. The first time a connection
+    runs a named statement it is PREPAREd on the server, and later calls only
+    send EXECUTE with the parameters. Set CRAWLER_DB_PREPARED=0 to send plain
+    queries instead, e.g. behind a transaction-mode pgbouncer.
+    """
+
+    def __init__(self, db_url, pool_size=10):
+        self.db_url = db_url
+        self.pool_size = max(1, pool_size)
+        self.use_prepared = os.getenv("CRAWLER_DB_PREPARED", "1") != "0"
+        self.pool = None
+        self.lock = threading.Lock()
+        self._prepared = {}  # connection -> names of statements prepared on it
+        self.connect()
+
+    def connect(self):
+        """Create the connection pool if it doesn't exist yet"""
+        with self.lock:
+            if self.pool is not None and not self.pool.closed:
+                return
+            try:
+                self.pool = pool.ThreadedConnectionPool(1, self.pool_size, self.db_url)
+                self._prepared.clear()
+                logger.info(f"Connected to database (pool size {self.pool_size})")
+            except Exception as e:
+                logger.error(f"Database connection error: {e}")
+                raise
+
+    def close(self):
+        """Close every pooled connection"""
+        with self.lock:
+            if self.pool is not None and not self.pool.closed:
+                try:
+                    self.pool.closeall()
+                    logger.info("Closed database connection pool")
+                except Exception as e:
+                    logger.error(f"Error closing database connection pool: {e}")
+            self.pool = None
+            self._prepared.clear()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for one transaction; commits on success, rolls back on error"""
+        self.connect()
+        conn = self.pool.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            broken = isinstance(e, psycopg2.OperationalError) or conn.closed
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if broken:
+                self._prepared.pop(conn, None)
+            self.pool.putconn(conn, close=broken)
+
+    @staticmethod
+    def _to_positional(statement):
+        """Rewrite %s placeholders as $1, $2, ... for PREPARE"""
+        parts = statement.split("%s")
+        positional = parts[0]
+        for i, part in enumerate(parts[1:], start=1):
+            positional += f"${i}" + part
+        return positional
+
+    def _ensure_prepared(self, cursor, name, statement):
+        prepared = self._prepared.setdefault(cursor.connection, set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {self._to_positional(statement)}")
+            prepared.add(name)
+
+    def execute(self, cursor, name, statement, params):
+        """Execute a named statement, preparing it on this connection first if needed"""
+        if not self.use_prepared:
+            cursor.execute(statement, params)
+            return
+        self._ensure_prepared(cursor, name, statement)
+        placeholders = ", ".join(["%s"] * len(params))
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+    def execute_many(self, cursor, name, statement, param_list):
+        """Execute a named statement for many parameter tuples in batched round trips"""
+        if not param_list:
+            return
+        if not self.use_prepared:
+            execute_batch(cursor, statement, param_list)
+            return
+        self._ensure_prepared(cursor, name, statement)
+        placeholders = ", ".join(["%s"] * len(param_list[0]))
+        execute_batch(cursor, f"EXECUTE {name} ({placeholders})", param_list)
@@ -0,0 +1,121 @@
+import os
+import signal
+import logging
+import threading
+import time
+
+from job_scheduler import STALE_SECONDS
+
+logger = logging.getLogger("job_budget")
+
+# Why a job stopped before its frontier was exhausted
+STOP_CANCELLED = "cancelled"
+STOP_TIME_LIMIT = "time_limit"
+STOP_PAGE_LIMIT = "page_limit"
+STOP_SHUTDOWN = "shutdown"
+STOP_SLICE = "slice"
+
+_cancel_signal = threading.Event()
+_shutdown_signal = threading.Event()
+
+
+def install_signal_handlers():
+    """SIGUSR1 cancels the running job; SIGTERM stops it for a later resume and ends the service"""
+    try:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: _cancel_signal.set())
+        signal.signal(signal.SIGTERM, lambda signum, frame: _shutdown_signal.set())
+    except ValueError:
+        # Signal handlers can only be installed from the main thread
+        logger.warning("Not running in the main thread, signal handlers not installed")
+
+
+def shutdown_requested():
+    """Whether SIGTERM was received"""
+    return _shutdown_signal.is_set()
+
+
+class JobBudget:
+    """Wall-clock and page budget of one crawl job, plus its cancellation flag.
+
+    check() is called by the crawler between pages and during link checks,
+    so it has to stay cheap: limits are compared in memory and the
+    crawl_queue.cancel_requested flag set by the dashboard is polled at most
+    every `poll_seconds`. Jobs are also cut into slices of `slice_pages`
+    rendered pages while other jobs are waiting, so the scheduler can run
+    them in between; a sliced job resumes from its checkpoint.
+    """
+
+    def __init__(self, db, job, max_seconds=None, max_pages=None, poll_seconds=None, slice_pages=None):
+        self.db = db
+        self.job = job
+        self.max_seconds = max_seconds if max_seconds is not None else float(os.getenv("CRAWLER_JOB_MAX_SECONDS", "3600"))
+        self.max_pages = max_pages if max_pages is not None else int(os.getenv("CRAWLER_JOB_MAX_PAGES", "10000"))
+        self.poll_seconds = poll_seconds if poll_seconds is not None else float(os.getenv("CRAWLER_CANCEL_POLL_SECONDS", "5"))
+        self.slice_pages = slice_pages if slice_pages is not None else int(os.getenv("CRAWLER_SLICE_PAGES", "500"))
+        self.started = time.time()
+        # Time spent in earlier slices of the same job counts against the budget
+        self.used_seconds = job.get("run_seconds") or 0
+        self.last_poll = 0
+        self.cancelled = False
+        self.others_waiting = False
+        self.lock = threading.Lock()
+        # A cancel signal only applies to the job that was running when it arrived
+        _cancel_signal.clear()
+
+    def check(self, crawler):
+        """Return the reason the job has to stop, or None to keep crawling"""
+        if _shutdown_signal.is_set():
+            return STOP_SHUTDOWN
+        if _cancel_signal.is_set():
+            return STOP_CANCELLED
+        if self.max_seconds and self.elapsed() >= self.max_seconds:
+            return STOP_TIME_LIMIT
+        # Pages saved before a resume, or by other nodes, count against the budget as well
+        if self.max_pages and crawler.pages_crawled() >= self.max_pages:
+            return STOP_PAGE_LIMIT
+        if self.cancel_requested():
+            return STOP_CANCELLED
+        if self.slice_pages and crawler.pages_rendered >= self.slice_pages and self.others_waiting:
+            return STOP_SLICE
+        return None
+
+    def elapsed(self):
+        """Seconds this job has been crawling, over all of its slices"""
+        return self.used_seconds + time.time() - self.started
+
+    def cancel_requested(self):
+        """Poll the job's cancel flag; a job that disappeared from the queue counts as cancelled.
+
+        The same query notes whether other jobs are waiting, for slicing. Jobs
+        claimed by another worker are not waiting, unless that worker is gone.
+        """
+        with self.lock:
+            now = time.time()
+            if self.cancelled or now - self.last_poll < self.poll_seconds:
+                return self.cancelled
+            self.last_poll = now
+            try:
+                with self.db.connection() as conn:
+                    cursor = conn.cursor()
+                    self.db.execute(
+                        cursor,
+                        "select_cancel_requested",
+                        """
+                        SELECT cq.cancel_requested, EXISTS (
+                            SELECT 1 FROM crawl_queue o
+                            LEFT JOIN crawl_progress op ON op.queue_id = o.id
+                            WHERE o.id <> cq.id
+                            AND (o.claimed_by IS NULL
+                                 OR GREATEST(o.claimed_at, op.updated_at) < NOW() - %s * INTERVAL '1 second')
+                        )
+                        FROM crawl_queue cq WHERE cq.id = %s
+                        """,
+                        (STALE_SECONDS, self.job["queue_id"])
+                    )
+                    row = cursor.fetchone()
+                    cursor.close()
+                self.cancelled = row is None or bool(row[0])
+                self.others_waiting = row is not None and bool(row[1])
+            except Exception as e:
+                logger.error(f"Error checking cancellation of job {self.job['queue_id']}: {e}")
+            return self.cancelled
@@ -0,0 +1,115 @@
+import os
+import math
+import logging
+
+logger = logging.getLogger("job_scheduler")
+
+# Queue entries considered per scheduling decision, oldest first
+CANDIDATES = int(os.getenv("CRAWLER_SCHEDULER_CANDIDATES", "200"))
+# Priority multiplier of users with an active premium subscription
+PREMIUM_WEIGHT = float(os.getenv("CRAWLER_SCHEDULER_PREMIUM_WEIGHT", "2"))
+# Assumed size of projects that were never crawled before
+DEFAULT_PAGES = int(os.getenv("CRAWLER_SCHEDULER_DEFAULT_PAGES", "100"))
+# A running job whose progress row wasn't updated for this long belongs to a dead worker
+STALE_SECONDS = int(os.getenv("CRAWLER_SCHEDULER_STALE_SECONDS", "600"))
+# Projects whose last crawl had at least this many pages are crawled by several workers, 0 to disable
+DISTRIBUTED_MIN_PAGES = int(os.getenv("CRAWLER_DISTRIBUTED_MIN_PAGES", "0"))
+
+CANDIDATES_QUERY = """
+    SELECT cq.id, cq.project_id, p.url, p.crawl_settings, p.user_id,
+           EXTRACT(EPOCH FROM NOW() - COALESCE(cq.last_slice_at, cq.time_start))::float8,
+           COALESCE(s.status = 'premium' AND s.valid_until > NOW(), FALSE),
+           p.last_crawl_pages,
+           cq.run_seconds,
+           cq.cancel_requested,
+           COALESCE(cq.claimed_by IS NOT NULL
+                    AND GREATEST(cq.claimed_at, cp.updated_at) > NOW() - %s * INTERVAL '1 second', FALSE),
+           cp.pages_saved
+    FROM crawl_queue cq
+    JOIN projects p ON cq.project_id = p.id
+    LEFT JOIN subscription s ON s.user_id = p.user_id
+    LEFT JOIN crawl_progress cp ON cp.project_id = cq.project_id AND cp.queue_id = cq.id
+    ORDER BY cq.time_start ASC
+    LIMIT %s
+"""
+
+# Take a job for this worker. Claims of workers that stopped updating the job's
+# progress expire; distributed jobs can be joined while claimed.
+CLAIM_QUERY = """
+    UPDATE crawl_queue cq
+    SET claimed_by = %s, claimed_at = NOW(), started_at = COALESCE(cq.started_at, NOW())
+    WHERE cq.id = %s
+    AND (cq.claimed_by IS NULL OR %s
+         OR GREATEST(cq.claimed_at, (SELECT cp.updated_at FROM crawl_progress cp WHERE cp.queue_id = cq.id))
+            < NOW() - %s * INTERVAL '1 second')
+    RETURNING cq.id
+"""
+
+CANDIDATE_FIELDS = ("queue_id", "project_id", "url", "settings", "user_id", "wait_seconds", "premium",
+                    "last_crawl_pages", "run_seconds", "cancel_requested", "running", "pages_saved")
+
+
+def is_distributed(settings, last_crawl_pages):
+    """Whether a project is crawled by several workers at once; the project's "distributed" setting wins"""
+    if settings and settings.get("distributed") is not None:
+        return bool(settings["distributed"])
+    return bool(DISTRIBUTED_MIN_PAGES) and (last_crawl_pages or 0) >= DISTRIBUTED_MIN_PAGES
+
+
+def estimated_pages(candidate):
+    """Pages still to crawl, from the previous crawl's size minus what this job already saved"""
+    total = candidate["last_crawl_pages"] or DEFAULT_PAGES
+    return max(total - (candidate["pages_saved"] or 0), 1)
+
+
+def job_score(candidate, user_load):
+    """Priority of a waiting job; higher runs first.
+
+    Waiting time raises the score linearly, so every job eventually runs.
+    Premium users get a fixed multiplier, expected size divides the score
+    logarithmically (small sites jump ahead of 50k-page ones without
+    starving them), and every job the same user already has running or
+    ahead in the queue divides it again, giving each user a fair share.
+    """
+    weight = PREMIUM_WEIGHT if candidate["premium"] else 1.0
+    size = 1 + math.log10(1 + estimated_pages(candidate))
+    return (1 + max(candidate["wait_seconds"], 0)) * weight / size / (1 + user_load)
+
+
+def pick_job(candidates, skip=()):
+    """Choose the next job from candidate rows (dicts with CANDIDATE_FIELDS), or None.
+
+    Queue ids in `skip` are not picked, e.g. distributed jobs this node just left
+    or jobs another worker claimed first.
+    """
+    running = {}
+    waiting = []
+    for candidate in candidates:
+        # Jobs another worker is crawling right now count towards their user's load;
+        # only distributed ones can be joined by more workers
+        if candidate["running"]:
+            running[candidate["user_id"]] = running.get(candidate["user_id"], 0) + 1
+        if candidate["queue_id"] in skip:
+            continue
+        if not candidate["running"] or is_distributed(candidate["settings"], candidate["last_crawl_pages"]):
+            waiting.append(candidate)
+    if not waiting:
+        return None
+
+    # Cancelled jobs only need finalizing, which is quick
+    for candidate in waiting:
+        if candidate["cancel_requested"]:
+            return candidate
+
+    best = None
+    best_score = None
+    queued_ahead = {}
+    for candidate in waiting:  # oldest first
+        user = candidate["user_id"]
+        score = job_score(candidate, running.get(user, 0) + queued_ahead.get(user, 0))
+        queued_ahead[user] = queued_ahead.get(user, 0) + 1
+        if best is None or score > best_score:
+            best, best_score = candidate, score
+    logger.info(f"Scheduled job {best['queue_id']} of user {best['user_id']} "
+                f"(score {best_score:.1f}, waited {best['wait_seconds']:.0f}s, ~{estimated_pages(best)} pages)")
+    return best
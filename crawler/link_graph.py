@@ -0,0 +1,231 @@
+import io
+import logging
+import threading
+from array import array
+
+logger = logging.getLogger("link_graph")
+
+NODE_COLUMNS = ("project_id", "generation", "node_id", "url", "crawled", "inlinks", "outlinks", "click_depth", "pagerank")
+EDGE_COLUMNS = ("project_id", "generation", "source_id", "target_id")
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_rows(cursor, table, columns, rows, chunk_size):
+    """COPY tab-separated rows into a table in chunks"""
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(row))
+        buffer.write("\n")
+        count += 1
+        if count >= chunk_size:
+            buffer.seek(0)
+            cursor.copy_from(buffer, table, columns=columns)
+            buffer = io.StringIO()
+            count = 0
+    if count:
+        buffer.seek(0)
+        cursor.copy_from(buffer, table, columns=columns)
+
+
+class LinkGraph:
+    """Internal link graph of a crawl, stored as integer node ids in flat arrays.
+
+    Nodes are normalized URLs; edges are (source id, target id) pairs in two
+    parallel unsigned int arrays, so a site with millions of links costs a few
+    bytes per edge. Metrics are computed with NumPy/SciPy at the end of the job.
+    Edges are only recorded where the crawler already extracts links, i.e. for
+    pages above the maximum crawl depth.
+
+    A job that is paused or interrupted writes what it added since its last
+    checkpoint with save_delta() and continues from load() when it resumes,
+    so the graph covers every slice of the crawl.
+    """
+
+    def __init__(self, root_url):
+        self.lock = threading.Lock()  # Pages may be processed on several threads
+        self.ids = {}
+        self.urls = []
+        self.crawled = array('B')
+        self.sources = array('I')
+        self.targets = array('I')
+        self.crawl_order = array('I')  # Node ids in the order their pages were crawled
+        # Nodes, edges and crawled pages already written by save_delta()
+        self.saved = (0, 0, 0)
+        self.root = self.node_id(root_url)
+
+    @classmethod
+    def load(cls, cursor, project_id, generation, root_url):
+        """Rebuild the graph of an interrupted job from the rows written by save_delta()"""
+        graph = cls(root_url)
+        cursor.execute(
+            """
+            SELECT node_id, url, crawled FROM crawl_link_nodes
+            WHERE project_id = %s AND generation = %s ORDER BY node_id
+            """,
+            (project_id, generation)
+        )
+        rows = cursor.fetchall()
+        if rows:
+            graph.ids, graph.urls, graph.crawled = {}, [], array('B')
+            # Node ids are dense, as every save continues where the last one ended
+            for node, url, crawled in rows:
+                graph.ids[url] = node
+                graph.urls.append(url)
+                graph.crawled.append(1 if crawled else 0)
+                if crawled:
+                    graph.crawl_order.append(node)
+            graph.root = graph.node_id(root_url)
+        cursor.execute(
+            "SELECT source_id, target_id FROM crawl_link_edges WHERE project_id = %s AND generation = %s",
+            (project_id, generation)
+        )
+        for source, target in cursor:
+            graph.sources.append(source)
+            graph.targets.append(target)
+        graph.saved = (len(rows), len(graph.sources), len(graph.crawl_order))
+        logger.info(f"Loaded link graph with {len(graph.urls)} nodes and {len(graph.sources)} edges")
+        return graph
+
+    def node_id(self, url):
+        """Return the id of a URL, adding it as a node if needed"""
+        node = self.ids.get(url)
+        if node is None:
+            node = len(self.urls)
+            self.ids[url] = node
+            self.urls.append(url)
+            self.crawled.append(0)
+        return node
+
+    def mark_crawled(self, url):
+        """Flag a URL as a page that was actually rendered"""
+        with self.lock:
+            node = self.node_id(url)
+            if not self.crawled[node]:
+                self.crawled[node] = 1
+                self.crawl_order.append(node)
+
+    def add_edges(self, source_url, target_urls):
+        """Record the links found on one page"""
+        with self.lock:
+            source = self.node_id(source_url)
+            for target_url in target_urls:
+                target = self.node_id(target_url)
+                if target != source:
+                    self.sources.append(source)
+                    self.targets.append(target)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def _adjacency(self):
+        import numpy as np
+        from scipy import sparse
+
+        n = len(self.urls)
+        sources = np.frombuffer(self.sources, dtype=np.uint32)
+        targets = np.frombuffer(self.targets, dtype=np.uint32)
+        data = np.ones(len(sources), dtype=np.float64)
+        matrix = sparse.csr_matrix((data, (sources, targets)), shape=(n, n))
+        # A page linking to the same target twice still counts as one link
+        matrix.data[:] = 1.0
+        return matrix
+
+    def compute_metrics(self, damping=0.85, iterations=100, tolerance=1e-9):
+        """Return per-node inlinks, outlinks, click depth (-1 if unreachable) and PageRank"""
+        import numpy as np
+        from scipy.sparse import csgraph
+
+        n = len(self.urls)
+        adjacency = self._adjacency()
+        inlinks = np.asarray(adjacency.sum(axis=0)).ravel().astype(np.int64)
+        outlinks = np.asarray(adjacency.sum(axis=1)).ravel().astype(np.int64)
+
+        depths = csgraph.shortest_path(adjacency, directed=True, unweighted=True, indices=self.root)
+        depths = np.where(np.isinf(depths), -1, depths).astype(np.int64)
+
+        # Power iteration on the row-normalized transition matrix; rank of
+        # dangling pages is spread evenly over all pages
+        rank = np.full(n, 1.0 / n)
+        dangling = outlinks == 0
+        safe_outlinks = np.where(dangling, 1, outlinks)
+        transition_t = adjacency.multiply(1.0 / safe_outlinks[:, None]).T.tocsr()
+        for _ in range(iterations):
+            new_rank = damping * (transition_t @ rank + rank[dangling].sum() / n) + (1 - damping) / n
+            converged = np.abs(new_rank - rank).sum() < tolerance
+            rank = new_rank
+            if converged:
+                break
+
+        return {
+            "inlinks": inlinks,
+            "outlinks": outlinks,
+            "click_depth": depths,
+            "pagerank": rank,
+        }
+
+    def save_delta(self, cursor, project_id, generation, chunk_size=100000):
+        """Write the nodes, edges and crawled flags added since the last save.
+
+        Nodes get placeholder metrics until save() rewrites the whole graph at
+        the end of the job. Returns the new save marks, to be stored in
+        `saved` once the transaction has committed.
+        """
+        with self.lock:
+            marks = (len(self.urls), len(self.sources), len(self.crawl_order))
+            nodes_saved, edges_saved, crawled_saved = self.saved
+            nodes = [(node, self.urls[node], self.crawled[node]) for node in range(nodes_saved, marks[0])]
+            sources = self.sources[edges_saved:marks[1]]
+            targets = self.targets[edges_saved:marks[1]]
+            # Nodes written earlier whose page has been crawled since
+            crawled = [node for node in self.crawl_order[crawled_saved:marks[2]] if node < nodes_saved]
+
+        if crawled:
+            cursor.execute(
+                """
+                UPDATE crawl_link_nodes SET crawled = TRUE
+                WHERE project_id = %s AND generation = %s AND node_id = ANY(%s)
+                """,
+                (project_id, generation, crawled)
+            )
+        _copy_rows(
+            cursor, "crawl_link_nodes", NODE_COLUMNS,
+            ((str(project_id), str(generation), str(node), _escape(url), "t" if is_crawled else "f", "0", "0", "\\N", "0")
+             for node, url, is_crawled in nodes),
+            chunk_size
+        )
+        _copy_rows(
+            cursor, "crawl_link_edges", EDGE_COLUMNS,
+            ((str(project_id), str(generation), str(source), str(target)) for source, target in zip(sources, targets)),
+            chunk_size
+        )
+        return marks
+
+    def save(self, cursor, project_id, generation, chunk_size=100000, metrics=None):
+        """Stream nodes with their metrics and all edges into Postgres with COPY"""
+        if not self.urls:
+            return
+        if metrics is None:
+            metrics = self.compute_metrics()
+
+        _copy_rows(
+            cursor, "crawl_link_nodes", NODE_COLUMNS,
+            (
+                (str(project_id), str(generation), str(node), _escape(url), "t" if self.crawled[node] else "f",
+                 str(metrics["inlinks"][node]), str(metrics["outlinks"][node]),
+                 str(metrics["click_depth"][node]) if metrics["click_depth"][node] >= 0 else "\\N",
+                 repr(float(metrics["pagerank"][node])))
+                for node, url in enumerate(self.urls)
+            ),
+            chunk_size
+        )
+        _copy_rows(
+            cursor, "crawl_link_edges", EDGE_COLUMNS,
+            ((str(project_id), str(generation), str(source), str(target))
+             for source, target in zip(self.sources, self.targets)),
+            chunk_size
+        )
+        logger.info(f"Saved link graph with {len(self.urls)} nodes and {len(self.sources)} edges")
@@ -0,0 +1,52 @@
+import os
+
+# Categories that repeat the same subject on many pages, mapped to the message
+# prefix in front of the subject. Their notifications are stored once per
+# (category, subject) in project_notification_groups instead of once per page.
+GROUPED_CATEGORIES = {
+    "external_resource": "",
+    "accessibility": "Image missing alt text: ",
+}
+
+# Affected URLs kept per group; url_count always has the full number
+SAMPLE_URLS = int(os.getenv("CRAWLER_GROUP_SAMPLE_URLS", "20"))
+
+
+def notification_subject(notification):
+    """Return the grouping subject of a notification, or None if it is stored per page"""
+    prefix = GROUPED_CATEGORIES.get(notification.category)
+    if prefix is None or not notification.message.startswith(prefix):
+        return None
+    return notification.message[len(prefix):]
+
+
+def split_notifications(notifications):
+    """Split a page's notifications into per-page ones and (category, subject, message) groups"""
+    per_page = []
+    grouped = []
+    seen = set()
+    for notification in notifications:
+        subject = notification_subject(notification)
+        if subject is None:
+            per_page.append(notification)
+        elif (notification.category, subject) not in seen:
+            seen.add((notification.category, subject))
+            grouped.append((notification.category, subject, notification.message))
+    return per_page, grouped
+
+
+def merge_groups(pages):
+    """Merge the groups of several pages, given as (url, groups) pairs.
+
+    Returns {(category, subject): {"message", "count", "urls"}}.
+    """
+    merged = {}
+    for url, groups in pages:
+        for category, subject, message in groups:
+            group = merged.get((category, subject))
+            if group is None:
+                group = merged[(category, subject)] = {"message": message, "count": 0, "urls": []}
+            group["count"] += 1
+            if len(group["urls"]) < SAMPLE_URLS:
+                group["urls"].append(url)
+    return merged
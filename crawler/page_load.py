@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import logging
+
+logger = logging.getLogger("page_load")
+
+# WebDriver pageLoadStrategy of every browser: "none" returns as soon as the
+# navigation starts and leaves all waiting to the crawler's wait condition,
+# "eager" blocks until DOMContentLoaded and "normal" until the load event
+PAGE_LOAD_STRATEGY = os.getenv("CRAWLER_PAGE_LOAD_STRATEGY", "none")
+
+# Wait conditions: "dom" waits for DOMContentLoaded, "network_idle" also for
+# no requests in flight, "load" for the load event
+WAIT_DOM = "dom"
+WAIT_NETWORK_IDLE = "network_idle"
+WAIT_LOAD = "load"
+WAIT_CONDITIONS = (WAIT_DOM, WAIT_NETWORK_IDLE, WAIT_LOAD)
+DEFAULT_WAIT = os.getenv("CRAWLER_PAGE_WAIT", WAIT_NETWORK_IDLE)
+# Seconds a page may take to reach its wait condition
+DEFAULT_TIMEOUT = float(os.getenv("CRAWLER_PAGE_LOAD_TIMEOUT", "30"))
+# How long the network has to be quiet for "network_idle"
+NETWORK_IDLE_MS = int(os.getenv("CRAWLER_NETWORK_IDLE_MS", "500"))
+# Reload pages that look like they are rendered by JavaScript with scripts on
+# and wait for their load event
+DEFAULT_ESCALATE = os.getenv("CRAWLER_PAGE_WAIT_ESCALATE", "1") == "1"
+# A page with scripts and less visible text than this is treated as a JavaScript shell
+SHELL_TEXT_LENGTH = 200
+# Requests that may stay open on an idle page (long polling, streams), like networkidle2
+IDLE_CONNECTIONS = 2
+POLL_SECONDS = 0.05
+# Consecutive failed polls tolerated while the old document unloads
+POLL_ERRORS = 20
+
+# Document state polled while waiting
+STATE_SCRIPT = "return [performance.timeOrigin, document.readyState];"
+
+# Whether a parsed document is a JavaScript application shell: it has scripts
+# but (almost) no text, or an empty mount point of a common framework
+SHELL_SCRIPT = """
+if (!document.scripts.length) return false;
+var text = document.body ? (document.body.innerText || '').trim().length : 0;
+return text < %d || !!document.querySelector(
+    '#root:empty, #app:empty, #__next:empty, app-root:empty, [ng-app], [data-reactroot]:empty');
+""" % SHELL_TEXT_LENGTH
+
+ORIGIN_SCRIPT = "return performance.timeOrigin;"
+
+# Page scripts are off in every tab and only turned on to render a shell; the
+# switch is per tab and survives navigations
+SCRIPTS_COMMAND = "Emulation.setScriptExecutionDisabled"
+
+FINISHED_EVENTS = frozenset(["Network.loadingFinished", "Network.loadingFailed"])
+
+
+class PageLoadTimeout(Exception):
+    """A page did not reach its wait condition in time"""
+
+
+def set_scripts_enabled(driver, enabled):
+    """Turn page scripts of the driver's tab on or off; returns False if the driver can't"""
+    try:
+        driver.execute_cdp_cmd(SCRIPTS_COMMAND, {"value": not enabled})
+        return True
+    except Exception as e:
+        logger.debug(f"Could not turn scripts {'on' if enabled else 'off'}: {e}")
+        return False
+
+
+class PageLoadPolicy:
+    """Decides how long the crawler waits for a page after navigating.
+
+    The browser returns control right after the navigation starts (see
+    PAGE_LOAD_STRATEGY) and the policy polls the new document until its wait
+    condition holds. Pages are loaded with scripts off; "dom" and
+    "network_idle" pages whose DOM looks like an empty JavaScript application
+    shell are reloaded with scripts on and waited for until their load event.
+    Network events read while waiting are kept, so the scanners see the same
+    performance log as after a blocking load.
+    """
+
+    def __init__(self, wait=None, timeout=None, escalate=None):
+        self.wait = wait if wait in WAIT_CONDITIONS else DEFAULT_WAIT
+        self.timeout = float(timeout) if timeout else DEFAULT_TIMEOUT
+        self.escalate = DEFAULT_ESCALATE if escalate is None else bool(escalate)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build the policy from a project's crawl settings"""
+        settings = settings or {}
+        return cls(settings.get("page_wait"), settings.get("page_load_timeout"), settings.get("page_wait_escalate"))
+
+    @staticmethod
+    def document_origin(driver):
+        """timeOrigin of the current document, to tell it apart from the next one"""
+        try:
+            return driver.execute_script(ORIGIN_SCRIPT)
+        except Exception:
+            return None
+
+    def wait_for_page(self, driver, previous_origin, performance_log):
+        """Block until the document that replaced `previous_origin` is ready.
+
+        Performance log entries read while waiting are appended to
+        `performance_log`. Raises PageLoadTimeout if the new document never
+        becomes interactive; a network that stays busy or a load event that
+        never fires only ends the wait.
+        """
+        deadline = time.monotonic() + self.timeout
+        wait = self.wait
+        in_flight = set()
+        quiet_since = time.monotonic()
+        state = None
+        errors = 0
+        checked_shell = not self.escalate or wait == WAIT_LOAD
+        rendering = False
+
+        try:
+            while True:
+                if wait == WAIT_NETWORK_IDLE:
+                    if self._read_network(driver, performance_log, in_flight):
+                        quiet_since = time.monotonic()
+                    if len(in_flight) > IDLE_CONNECTIONS:
+                        quiet_since = time.monotonic()
+
+                try:
+                    state = driver.execute_script(STATE_SCRIPT)
+                    errors = 0
+                except Exception:
+                    # Scripts can fail while one document replaces the other
+                    errors += 1
+                    if errors >= POLL_ERRORS:
+                        raise
+                    state = None
+                if state and state[0] != previous_origin and state[1] != "loading":
+                    ready_state = state[1]
+                    if not checked_shell:
+                        # Decided once, as soon as the DOM is parsed
+                        checked_shell = True
+                        if self.is_shell(driver):
+                            wait = WAIT_LOAD
+                            if self.reload_with_scripts(driver):
+                                logger.debug(f"Rendering {driver.current_url} with JavaScript, it looks like an application shell")
+                                rendering = True
+                                previous_origin = state[0]
+                                continue
+                    if wait == WAIT_DOM or ready_state == "complete":
+                        break
+                    if wait == WAIT_NETWORK_IDLE and (time.monotonic() - quiet_since) * 1000 >= NETWORK_IDLE_MS:
+                        break
+
+                if time.monotonic() >= deadline:
+                    if state and state[0] != previous_origin and state[1] != "loading":
+                        logger.info(f"Page did not reach '{wait}' within {self.timeout:g}s, continuing with its DOM")
+                        break
+                    raise PageLoadTimeout(f"Timed out after {self.timeout:g}s waiting for the page")
+                time.sleep(POLL_SECONDS)
+        finally:
+            if rendering:
+                # The next page is loaded without scripts again
+                set_scripts_enabled(driver, False)
+
+        if wait != WAIT_NETWORK_IDLE:
+            self._read_network(driver, performance_log, in_flight)
+
+    @staticmethod
+    def reload_with_scripts(driver):
+        """Reload the current page with scripts on; returns False if the driver can't"""
+        if not set_scripts_enabled(driver, True):
+            return False
+        try:
+            driver.execute_cdp_cmd("Page.reload", {})
+            return True
+        except Exception as e:
+            logger.debug(f"Could not reload {driver.current_url}: {e}")
+            set_scripts_enabled(driver, False)
+            return False
+
+    @staticmethod
+    def is_shell(driver):
+        """Whether the current page needs JavaScript rendering"""
+        try:
+            return bool(driver.execute_script(SHELL_SCRIPT))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _read_network(driver, performance_log, in_flight):
+        """Drain the performance log into `performance_log`; returns whether any request started or ended"""
+        try:
+            entries = driver.get_log('performance')
+        except Exception:
+            return False
+        changed = False
+        for entry in entries:
+            performance_log.append(entry)
+            try:
+                message = json.loads(entry["message"])["message"]
+                method = message["method"]
+                if method == "Network.requestWillBeSent":
+                    in_flight.add(message["params"]["requestId"])
+                    changed = True
+                elif method in FINISHED_EVENTS:
+                    in_flight.discard(message["params"]["requestId"])
+                    changed = True
+            except (KeyError, json.JSONDecodeError):
+                continue
+        return changed
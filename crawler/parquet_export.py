@@ -0,0 +1,171 @@
+import os
+import logging
+
+logger = logging.getLogger("parquet_export")
+
+# Set to a directory to export every finished crawl as Parquet files
+EXPORT_DIR = os.getenv("CRAWLER_EXPORT_DIR", "")
+ROW_GROUP_SIZE = int(os.getenv("CRAWLER_EXPORT_ROW_GROUP_SIZE", "5000"))
+
+
+def _schemas():
+    import pyarrow as pa
+
+    return {
+        "pages": pa.schema([
+            ("url", pa.string()),
+            ("crawled_at", pa.timestamp("ms")),
+            ("ttfb_ms", pa.float64()),
+            ("render_time_ms", pa.float64()),
+            ("canonical_url", pa.string()),
+            ("notification_count", pa.int32()),
+        ]),
+        "notifications": pa.schema([
+            ("url", pa.string()),
+            ("category", pa.string()),
+            ("message", pa.string()),
+            ("grouped", pa.bool_()),
+        ]),
+        "link_nodes": pa.schema([
+            ("node_id", pa.uint32()),
+            ("url", pa.string()),
+            ("crawled", pa.bool_()),
+            ("inlinks", pa.int64()),
+            ("outlinks", pa.int64()),
+            ("click_depth", pa.int64()),
+            ("pagerank", pa.float64()),
+        ]),
+        "link_edges": pa.schema([
+            ("source_id", pa.uint32()),
+            ("target_id", pa.uint32()),
+        ]),
+    }
+
+
+class ParquetExporter:
+    """Writes one crawl generation as Parquet files, one per table.
+
+    Rows are buffered per table and written as a row group every
+    `row_group_size` rows, so memory stays bounded during the crawl. Files are
+    written as "<table>.parquet.partial" under
+    <directory>/project_<id>/generation_<generation>/ and renamed when the
+    crawl is finished, so readers never see a half-written export.
+    """
+
+    def __init__(self, directory, job, row_group_size=None):
+        # Imported here so pyarrow is only needed when exporting is enabled
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.pq = pq
+        self.row_group_size = row_group_size or ROW_GROUP_SIZE
+        self.path = os.path.join(directory, f"project_{job['project_id']}", f"generation_{job['generation']}")
+        os.makedirs(self.path, exist_ok=True)
+        self.schemas = _schemas()
+        self.writers = {}
+        self.buffers = {table: [] for table in self.schemas}
+        self.rows_written = {table: 0 for table in self.schemas}
+
+    @classmethod
+    def create(cls, job):
+        """Return an exporter if CRAWLER_EXPORT_DIR is set, else None"""
+        if not EXPORT_DIR:
+            return None
+        try:
+            return cls(EXPORT_DIR, job)
+        except ImportError:
+            logger.error("CRAWLER_EXPORT_DIR is set but pyarrow is not installed, skipping export")
+        except Exception as e:
+            logger.error(f"Could not start Parquet export for project {job['project_id']}: {e}")
+        return None
+
+    def _file(self, table, partial=True):
+        return os.path.join(self.path, f"{table}.parquet" + (".partial" if partial else ""))
+
+    def _write(self, table, columns):
+        """Write one row group given as {column: values}"""
+        writer = self.writers.get(table)
+        if writer is None:
+            writer = self.writers[table] = self.pq.ParquetWriter(
+                self._file(table), self.schemas[table], compression="zstd"
+            )
+        batch = self.pa.Table.from_pydict(columns, schema=self.schemas[table])
+        writer.write_table(batch, row_group_size=self.row_group_size)
+        self.rows_written[table] += batch.num_rows
+
+    def _append(self, table, rows):
+        buffer = self.buffers[table]
+        buffer.extend(rows)
+        if len(buffer) >= self.row_group_size:
+            self._flush_buffer(table)
+
+    def _flush_buffer(self, table):
+        buffer = self.buffers[table]
+        if not buffer:
+            return
+        names = self.schemas[table].names
+        self._write(table, {name: [row[i] for row in buffer] for i, name in enumerate(names)})
+        self.buffers[table] = []
+
+    def add_page(self, url, crawled_at, ttfb_ms, render_time_ms, canonical_url, notifications, groups=()):
+        """Add a saved page with its per-page notifications and (category, subject, message) groups"""
+        self._append("pages", [(url, crawled_at, ttfb_ms, render_time_ms, canonical_url,
+                                len(notifications) + len(groups))])
+        self._append("notifications",
+                     [(url, category, message, False) for category, message in notifications] +
+                     [(url, category, message, True) for category, _, message in groups])
+
+    def add_link_graph(self, link_graph, metrics):
+        """Write the link graph's nodes with their metrics and all edges"""
+        import numpy as np
+
+        n = len(link_graph.urls)
+        if n == 0:
+            return
+        click_depth = self.pa.array(metrics["click_depth"], mask=metrics["click_depth"] < 0)
+        for start in range(0, n, self.row_group_size):
+            end = min(start + self.row_group_size, n)
+            self._write("link_nodes", {
+                "node_id": np.arange(start, end, dtype=np.uint32),
+                "url": link_graph.urls[start:end],
+                "crawled": np.frombuffer(link_graph.crawled, dtype=np.uint8)[start:end].astype(bool),
+                "inlinks": metrics["inlinks"][start:end],
+                "outlinks": metrics["outlinks"][start:end],
+                "click_depth": click_depth[start:end],
+                "pagerank": metrics["pagerank"][start:end],
+            })
+
+        sources = np.frombuffer(link_graph.sources, dtype=np.uint32)
+        targets = np.frombuffer(link_graph.targets, dtype=np.uint32)
+        # Edges are small, so use bigger row groups for them
+        chunk = self.row_group_size * 20
+        for start in range(0, len(sources), chunk):
+            self._write("link_edges", {
+                "source_id": sources[start:start + chunk],
+                "target_id": targets[start:start + chunk],
+            })
+
+    def finish(self):
+        """Write remaining rows, close all files and publish them under their final names"""
+        for table in self.schemas:
+            self._flush_buffer(table)
+            if table in ("pages", "notifications") and table not in self.writers:
+                # Always publish the page tables, even for an empty crawl
+                self._write(table, {name: [] for name in self.schemas[table].names})
+        for table, writer in self.writers.items():
+            writer.close()
+            os.replace(self._file(table), self._file(table, partial=False))
+        self.writers = {}
+        logger.info(f"Exported crawl to {self.path}: " +
+                    ", ".join(f"{count} {table}" for table, count in self.rows_written.items()))
+
+    def abort(self):
+        """Close and remove the partial files of a crawl that did not finish"""
+        for table, writer in self.writers.items():
+            try:
+                writer.close()
+                os.remove(self._file(table))
+            except Exception as e:
+                logger.error(f"Error removing partial export {self._file(table)}: {e}")
+        self.writers = {}
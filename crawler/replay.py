@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Replay a capture archive through the crawler, without a browser or network.
+
+Usage: python replay.py ARCHIVE [--depth N] [--repeat N] [--persist PROJECT_ID]
+
+Pages are served from the archive and run through the regular scanners and
+crawledPage construction, so scanner and persistence changes can be
+benchmarked and regression-tested on real site data. With --persist, pages
+are written through CrawlerService into generation -1 of the given project,
+which is never activated and is garbage-collected like any old generation.
+"""
+import sys
+import time
+import argparse
+from collections import Counter
+
+from Webcrawler import Webcrawler
+from capture import CaptureArchive, ReplayBrowser, attach_replay
+
+
+def replay(archive, depth, on_page=None):
+    """Crawl the archive once; returns (pages, notifications by category, seconds)"""
+    crawler = Webcrawler(archive.start_url, depth, browser=ReplayBrowser(archive))
+    attach_replay(crawler, archive)
+    categories = Counter()
+    pages = 0
+
+    def callback(page):
+        nonlocal pages
+        pages += 1
+        categories.update(notification.category for notification in page.projectNotifications)
+        if on_page is not None:
+            on_page(page)
+
+    crawler.set_callback(callback)
+    started = time.perf_counter()
+    crawler.crawl()
+    elapsed = time.perf_counter() - started
+    crawler.close()
+    return pages, categories, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a crawler capture archive")
+    parser.add_argument("archive", help="capture archive written with CRAWLER_CAPTURE_DIR")
+    parser.add_argument("--depth", type=int, default=1, help="maximum crawl depth (default 1)")
+    parser.add_argument("--repeat", type=int, default=1, help="number of replays to time (default 1)")
+    parser.add_argument("--persist", type=int, metavar="PROJECT_ID",
+                        help="also save the pages to the database (needs DATABASE_URL)")
+    args = parser.parse_args()
+
+    archive = CaptureArchive(args.archive)
+    if archive.start_url is None:
+        print(f"{args.archive} contains no pages")
+        return 1
+    print(f"Loaded {len(archive.pages)} pages and {len(archive.links)} links from {args.archive}")
+
+    service = None
+    job = None
+    if args.persist is not None:
+        from crawler_service import CrawlerService
+        service = CrawlerService(max_depth=args.depth)
+        job = {"queue_id": -1, "project_id": args.persist, "url": archive.start_url, "generation": -1}
+
+    def on_page(page):
+        service.save_crawl_result(job, page)
+
+    try:
+        timings = []
+        for run in range(args.repeat):
+            if service is not None:
+                service._saved_urls_this_session.clear()
+            pages, categories, elapsed = replay(archive, args.depth, on_page if service is not None else None)
+            if service is not None:
+                service.flush_crawl_results(job)
+            timings.append(elapsed)
+            print(f"Run {run + 1}: {pages} pages in {elapsed:.3f}s ({pages / elapsed if elapsed else 0:.1f} pages/s)")
+
+        print("Notifications:")
+        for category, count in sorted(categories.items()):
+            print(f"  {category}: {count}")
+        if len(timings) > 1:
+            timings.sort()
+            print(f"Min {timings[0]:.3f}s, median {timings[len(timings) // 2]:.3f}s, max {timings[-1]:.3f}s")
+    finally:
+        if service is not None:
+            service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
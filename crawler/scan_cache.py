@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("scan_cache")
+
+
+class ScanCache:
+    """LRU cache with a TTL for scan results, keyed by a hash of the page body.
+
+    Identical pages (paginated archives, localized duplicates, staging and
+    production copies of a site) are only scanned once. Entries remember the
+    first URL they were seen on, which doubles as duplicate-content detection.
+
+    Link checks don't depend on the page a link is found on, so their status
+    codes are kept separately by absolute URL with their own, shorter TTL.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, path=None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("CRAWLER_SCAN_CACHE_SIZE", "5000"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else int(os.getenv("CRAWLER_SCAN_CACHE_TTL", "86400"))
+        self.link_ttl_seconds = int(os.getenv("CRAWLER_LINK_CACHE_TTL", "3600"))
+        self.path = path if path is not None else os.getenv("CRAWLER_SCAN_CACHE_PATH")
+        self.entries = OrderedDict()
+        self.links = OrderedDict()  # Absolute href -> status code of its HEAD request
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.link_hits = 0
+        self.link_misses = 0
+        if self.path:
+            self.load()
+
+    @staticmethod
+    def make_key(page_source, ruleset):
+        """Hash the page body together with the rule set that produced the results"""
+        digest = hashlib.sha256()
+        digest.update(ruleset.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(page_source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached entry for a key, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if time.time() - entry["created"] > self.ttl_seconds:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, url, notifications):
+        """Store scan results as (category, message) pairs"""
+        with self.lock:
+            self.entries[key] = {
+                "url": url,
+                "notifications": [[n.category, n.message] for n in notifications],
+                "created": time.time(),
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_link(self, href):
+        """Return the cached check of a link, or None if missing or expired"""
+        with self.lock:
+            entry = self.links.get(href)
+            if entry is None or time.time() - entry["created"] > self.link_ttl_seconds:
+                self.links.pop(href, None)
+                self.link_misses += 1
+                return None
+            self.links.move_to_end(href)
+            self.link_hits += 1
+            return entry
+
+    def put_link(self, href, status_code):
+        """Store the status code of a link check, None for a failed connection"""
+        with self.lock:
+            self.links[href] = {"status": status_code, "created": time.time()}
+            self.links.move_to_end(href)
+            while len(self.links) > self.max_entries:
+                self.links.popitem(last=False)
+
+    def load(self):
+        """Load persisted entries, dropping any that have already expired"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading scan cache from {self.path}: {e}")
+            return
+
+        # Files written before link checks were cached hold only the page entries
+        if isinstance(stored, list):
+            stored = {"pages": stored, "links": []}
+
+        now = time.time()
+        with self.lock:
+            for key, entry in stored["pages"]:
+                if now - entry["created"] <= self.ttl_seconds:
+                    self.entries[key] = entry
+            for href, entry in stored["links"]:
+                if now - entry["created"] <= self.link_ttl_seconds:
+                    self.links[href] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            while len(self.links) > self.max_entries:
+                self.links.popitem(last=False)
+        logger.info(f"Loaded {len(self.entries)} scan cache entries and {len(self.links)} link checks from {self.path}")
+
+    def save(self):
+        """Persist the cache to disk if a path is configured"""
+        if not self.path:
+            return
+        with self.lock:
+            snapshot = {"pages": list(self.entries.items()), "links": list(self.links.items())}
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error saving scan cache to {self.path}: {e}")
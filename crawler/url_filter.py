@@ -0,0 +1,111 @@
+import re
+import fnmatch
+import logging
+import posixpath
+from urllib.parse import urlsplit
+
+import url_normalizer
+
+logger = logging.getLogger("url_filter")
+
+# File types that are never crawled as pages
+IGNORED_EXTENSIONS = frozenset([
+    '.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx',
+    '.zip', '.rar', '.tar', '.gz', '.7z', '.exe', '.msi', '.apk',
+    '.mp3', '.mp4', '.avi', '.mov', '.wmv', '.flv', '.jpg', '.jpeg',
+    '.png', '.gif', '.bmp', '.svg', '.ico', '.css', '.js'
+])
+
+CRAWLABLE_SCHEMES = frozenset(['http', 'https', ''])
+
+# Links that are never checked for being broken: empty, fragments only and any
+# non-http(s) scheme (javascript:, mailto:, tel:, ftp:, skype:, sms:, ...)
+UNCHECKABLE_LINK = re.compile(r'^(?:$|#$|(?!https?:)[a-z][a-z0-9+.\-]*:)', re.IGNORECASE)
+
+
+def _compile_rules(patterns):
+    """Combine glob patterns and "re:"-prefixed regexes into one matcher; invalid regexes are skipped"""
+    expressions = []
+    for pattern in patterns or []:
+        pattern = pattern.strip()
+        if not pattern:
+            continue
+        if pattern.startswith("re:"):
+            try:
+                re.compile(pattern[3:])
+            except re.error as e:
+                logger.warning(f"Ignoring invalid crawl rule {pattern!r}: {e}")
+                continue
+            expressions.append(f"(?:{pattern[3:]})")
+        else:
+            expressions.append(fnmatch.translate(pattern))
+    if not expressions:
+        return None
+    return re.compile("|".join(expressions))
+
+
+class UrlFilter:
+    """Decides which discovered URLs are crawled.
+
+    Every URL is parsed once; extensions and schemes are checked with set
+    lookups and the per-project include/exclude rules are precompiled into a
+    single regex each. Rules match the full URL, e.g. "*/blog/*" or
+    "re:.*/page/\\d+/?$". With include rules, only matching URLs are crawled;
+    exclude rules always win.
+    """
+
+    def __init__(self, include=None, exclude=None):
+        self.include = _compile_rules(include)
+        self.exclude = _compile_rules(exclude)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build a filter from a project's crawl settings"""
+        settings = settings or {}
+        return cls(settings.get("include_patterns"), settings.get("exclude_patterns"))
+
+    @staticmethod
+    def is_crawlable_parts(parts):
+        """Scheme and file-type check on an already split URL"""
+        if parts.scheme not in CRAWLABLE_SCHEMES:
+            return False
+        extension = posixpath.splitext(parts.path)[1].lower()
+        return extension not in IGNORED_EXTENSIONS
+
+    def is_crawlable(self, url):
+        """Check if URL is a valid website (not a file or other resource to ignore)"""
+        return self.is_crawlable_parts(urlsplit(url))
+
+    def matches_rules(self, url):
+        """Apply the project's include/exclude rules"""
+        if self.exclude is not None and self.exclude.match(url):
+            return False
+        if self.include is not None and not self.include.match(url):
+            return False
+        return True
+
+    def filter_links(self, links):
+        """Filter a page's raw hrefs in one pass.
+
+        Returns (clean url, host) pairs for crawlable links that pass the rules,
+        with fragments and configured query parameters removed.
+        """
+        results = []
+        seen = set()
+        for link in links:
+            if not link:
+                continue
+            link = url_normalizer.clean_url(link)
+            if link in seen:
+                continue
+            seen.add(link)
+            parts = urlsplit(link)
+            if not self.is_crawlable_parts(parts) or not self.matches_rules(link):
+                continue
+            results.append((link, url_normalizer.normalize_host(parts.netloc, parts.scheme.lower())))
+        return results
+
+    @staticmethod
+    def is_checkable_link(href):
+        """Whether a link should be checked for being broken"""
+        return bool(href) and not UNCHECKABLE_LINK.match(href)
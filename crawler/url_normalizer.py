@@ -0,0 +1,87 @@
+import os
+import fnmatch
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Shared by the crawler and the service, so the same page always maps to the
+# same key. The caches are module-level: they hold plain strings only and stay
+# bounded no matter how many crawls run in the process.
+CACHE_SIZE = int(os.getenv("CRAWLER_URL_CACHE_SIZE", "100000"))
+
+# Query parameters dropped from URLs: "*" strips the whole query string,
+# otherwise a comma-separated list of names or glob patterns (e.g. "utm_*,gclid")
+STRIP_QUERY_PARAMS = [p.strip() for p in os.getenv("CRAWLER_STRIP_QUERY_PARAMS", "*").split(",") if p.strip()]
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _strip_param(name):
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in STRIP_QUERY_PARAMS)
+
+
+def _clean_query(query):
+    if not query or "*" in STRIP_QUERY_PARAMS:
+        return ""
+    params = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if not _strip_param(k)]
+    return urlencode(sorted(params))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_host(netloc, scheme=""):
+    """Lowercase, IDNA-encode and drop default ports and credentials from a netloc"""
+    host = netloc.rsplit("@", 1)[-1]
+    port = None
+    if host.startswith("["):
+        # IPv6 literal
+        end = host.find("]")
+        if host[end + 1:end + 2] == ":":
+            port = host[end + 2:]
+        host = host[:end + 1]
+    elif ":" in host:
+        host, port = host.rsplit(":", 1)
+
+    host = host.lower().rstrip(".")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+
+    if port and (not port.isdigit() or DEFAULT_PORTS.get(scheme) == int(port)):
+        port = None
+    return f"{host}:{port}" if port else host
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_url(url):
+    """Canonical key for a URL, used for deduplication.
+
+    Lowercases scheme and host, IDNA-encodes the host, drops default ports,
+    fragments and configured query parameters, and gives every path a
+    trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = normalize_host(parts.netloc, scheme)
+
+    # Normalize path (ensure trailing slash for all paths except the root path)
+    path = parts.path
+    if path == "":
+        path = "/"
+    elif not path.endswith("/"):
+        path = path + "/"
+
+    return urlunsplit((scheme, netloc, path, _clean_query(parts.query), ""))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def clean_url(url):
+    """URL to navigate to: fragment and configured query parameters removed, path untouched"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, _clean_query(parts.query), ""))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_base_domain(url):
+    """Normalized host of a URL"""
+    parts = urlsplit(url)
+    return normalize_host(parts.netloc, parts.scheme.lower())
@@ -0,0 +1,122 @@
+-- Tables and columns added for the crawler. Both the API and the crawler read
+-- them, so this migration has to be applied before either is deployed.
+
+CREATE TABLE IF NOT EXISTS crawl_checkpoint (
+    queue_id INTEGER PRIMARY KEY,
+    project_id INTEGER NOT NULL,
+    state JSONB NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+
+-- Set by the dashboard to stop a running job; checked between pages
+ALTER TABLE crawl_queue ADD COLUMN IF NOT EXISTS cancel_requested BOOLEAN NOT NULL DEFAULT FALSE;
+-- Scheduling: sliced jobs remember when their last slice ended and how long they ran,
+-- projects how many pages their last crawl had
+ALTER TABLE crawl_queue ADD COLUMN IF NOT EXISTS last_slice_at TIMESTAMP;
+ALTER TABLE crawl_queue ADD COLUMN IF NOT EXISTS run_seconds DOUBLE PRECISION NOT NULL DEFAULT 0;
+-- The worker running a job claims it; started_at is set on the first claim and kept
+-- across slices, so the dashboard can tell started jobs from queued ones
+ALTER TABLE crawl_queue ADD COLUMN IF NOT EXISTS claimed_by TEXT;
+ALTER TABLE crawl_queue ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
+ALTER TABLE crawl_queue ADD COLUMN IF NOT EXISTS started_at TIMESTAMP;
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS last_crawl_pages INTEGER;
+
+-- Shared frontier of distributed jobs, one row per URL fingerprint
+CREATE TABLE IF NOT EXISTS crawl_frontier (
+    queue_id INTEGER NOT NULL,
+    fingerprint BIGINT NOT NULL,
+    url TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    shard INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    claimed_by TEXT,
+    lease_until TIMESTAMP,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (queue_id, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS crawl_frontier_claim
+ON crawl_frontier (queue_id, state, depth);
+
+CREATE TABLE IF NOT EXISTS crawl_progress (
+    project_id INTEGER PRIMARY KEY,
+    queue_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    pages_discovered INTEGER NOT NULL DEFAULT 0,
+    pages_rendered INTEGER NOT NULL DEFAULT 0,
+    pages_saved INTEGER NOT NULL DEFAULT 0,
+    pages_failed INTEGER NOT NULL DEFAULT 0,
+    frontier_size INTEGER NOT NULL DEFAULT 0,
+    eta_seconds INTEGER,
+    started_at TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL
+);
+-- Jobs started before claims existed are recognized by their progress row
+UPDATE crawl_queue cq SET started_at = cp.started_at
+FROM crawl_progress cp
+WHERE cp.queue_id = cq.id AND cq.started_at IS NULL;
+
+-- Crawl generations: every job writes into its own generation and the
+-- project's active_generation is flipped when the job completes
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS active_generation INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE crawl_result ADD COLUMN IF NOT EXISTS generation INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE project_notifications ADD COLUMN IF NOT EXISTS generation INTEGER NOT NULL DEFAULT 0;
+-- Per-project crawl rules and scope, e.g. {"include_patterns": [...], "allowed_hosts": [...]}
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS crawl_settings JSONB NOT NULL DEFAULT '{}';
+CREATE UNIQUE INDEX IF NOT EXISTS crawl_result_generation_key
+ON crawl_result (project_id, generation, url);
+CREATE UNIQUE INDEX IF NOT EXISTS project_notifications_generation_key
+ON project_notifications (project_id, generation, url, category, message);
+
+CREATE TABLE IF NOT EXISTS project_notification_groups (
+    project_id INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    message TEXT NOT NULL,
+    url_count INTEGER NOT NULL,
+    urls TEXT[] NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    PRIMARY KEY (project_id, generation, category, subject)
+);
+
+CREATE TABLE IF NOT EXISTS crawl_link_nodes (
+    project_id INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    node_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    crawled BOOLEAN NOT NULL,
+    inlinks INTEGER NOT NULL,
+    outlinks INTEGER NOT NULL,
+    click_depth INTEGER,
+    pagerank DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (project_id, generation, node_id)
+);
+CREATE TABLE IF NOT EXISTS crawl_link_edges (
+    project_id INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    source_id INTEGER NOT NULL,
+    target_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS crawl_link_edges_project_generation
+ON crawl_link_edges (project_id, generation);
+
+-- The old per-project unique constraints would block a URL from
+-- appearing in two generations, so drop any that don't include it
+DO $$
+DECLARE legacy record;
+BEGIN
+    FOR legacy IN
+        SELECT c.conrelid::regclass AS table_name, c.conname
+        FROM pg_constraint c
+        WHERE c.contype = 'u'
+          AND c.conrelid IN ('crawl_result'::regclass, 'project_notifications'::regclass)
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_attribute a
+              WHERE a.attrelid = c.conrelid
+                AND a.attnum = ANY (c.conkey)
+                AND a.attname = 'generation'
+          )
+    LOOP
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', legacy.table_name, legacy.conname);
+    END LOOP;
+END $$;
@@ -0,0 +1,92 @@
+// Package migrations holds the database schema shared by the API and the crawler.
+//
+// Migrations are plain SQL files applied in file name order; each one is
+// recorded in schema_migrations under its file name without the extension.
+// Apply them with `go run ./cmd/migrate` before deploying the API or the
+// crawler.
+package migrations
+
+import (
+	"context"
+	"embed"
+	"fmt"
+	"io/fs"
+	"sort"
+	"strings"
+
+	"github.com/jackc/pgx/v5"
+)
+
+//go:embed *.sql
+var files embed.FS
+
+// Apply runs every migration that is not recorded yet and returns the versions it applied
+func Apply(ctx context.Context, conn *pgx.Conn) ([]string, error) {
+	_, err := conn.Exec(ctx, `
+		CREATE TABLE IF NOT EXISTS schema_migrations (
+			version TEXT PRIMARY KEY,
+			applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+		)
+	`)
+	if err != nil {
+		return nil, fmt.Errorf("unable to create schema_migrations: %w", err)
+	}
+
+	names, err := fs.Glob(files, "*.sql")
+	if err != nil {
+		return nil, fmt.Errorf("unable to list migrations: %w", err)
+	}
+	sort.Strings(names)
+
+	var applied []string
+	for _, name := range names {
+		version := strings.TrimSuffix(name, ".sql")
+		done, err := apply(ctx, conn, name, version)
+		if err != nil {
+			return applied, err
+		}
+		if done {
+			applied = append(applied, version)
+		}
+	}
+	return applied, nil
+}
+
+// apply runs one migration and records it in the same transaction; returns false if it was applied before
+func apply(ctx context.Context, conn *pgx.Conn, name, version string) (bool, error) {
+	statements, err := files.ReadFile(name)
+	if err != nil {
+		return false, fmt.Errorf("unable to read migration %s: %w", name, err)
+	}
+
+	tx, err := conn.Begin(ctx)
+	if err != nil {
+		return false, fmt.Errorf("unable to begin migration %s: %w", version, err)
+	}
+	defer tx.Rollback(ctx)
+
+	// Serializes concurrent runs; the second one finds the version recorded
+	if _, err := tx.Exec(ctx, "LOCK TABLE schema_migrations IN EXCLUSIVE MODE"); err != nil {
+		return false, fmt.Errorf("unable to lock schema_migrations: %w", err)
+	}
+	var exists bool
+	err = tx.QueryRow(ctx, "SELECT EXISTS (SELECT 1 FROM schema_migrations WHERE version = $1)", version).Scan(&exists)
+	if err != nil {
+		return false, fmt.Errorf("unable to check migration %s: %w", version, err)
+	}
+	if exists {
+		return false, nil
+	}
+
+	// Without arguments the file is sent as one simple query, so it may hold many statements
+	if _, err := tx.Exec(ctx, string(statements)); err != nil {
+		return false, fmt.Errorf("migration %s failed: %w", version, err)
+	}
+	if _, err := tx.Exec(ctx, "INSERT INTO schema_migrations (version) VALUES ($1)", version); err != nil {
+		return false, fmt.Errorf("unable to record migration %s: %w", version, err)
+	}
+	if err := tx.Commit(ctx); err != nil {
+		return false, fmt.Errorf("unable to commit migration %s: %w", version, err)
+	}
+	return true, nil
+}
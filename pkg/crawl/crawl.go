@@ -2,12 +2,15 @@ package crawl
 
 import (
 	"context"
+	"errors"
 	"fmt"
 
 	"github.com/jackc/pgx/v5"
-	"projekt-splazh/pkg/notifications"
 )
 
+// ErrCrawlQueued is returned when a project already has a queued or running crawl
+var ErrCrawlQueued = errors.New("crawl already queued")
+
 // Crawl_Queue represents a crawl job entity
 type Crawl_Queue struct {
 	Id        int    `json:"id"`
@@ -27,28 +30,47 @@ func NewRepository(db *pgx.Conn) *Repository {
 	}
 }
 
-// Create adds a new crawl job to the queue
+// Create adds a new crawl job to the queue. It returns ErrCrawlQueued if the
+// project already has a queued or running job.
 func (r *Repository) Create(ctx context.Context, projectID int) error {
-	// First, delete any existing crawl results for this project
-	deleteQuery := `
-		DELETE FROM crawl_result
-		WHERE project_id = @projectID
-	`
-	deleteArgs := pgx.NamedArgs{
+	// Previous results are not deleted: they stay visible until the crawler
+	// activates the new generation and are garbage-collected afterwards.
+
+	tx, err := r.db.Begin(ctx)
+	if err != nil {
+		return fmt.Errorf("unable to start transaction: %w", err)
+	}
+	defer tx.Rollback(ctx)
+
+	args := pgx.NamedArgs{
 		"projectID": projectID,
 	}
 
-	_, err := r.db.Exec(ctx, deleteQuery, deleteArgs)
+	// Lock the project so concurrent requests can't both queue a job
+	lockQuery := `
+		SELECT EXISTS (SELECT 1 FROM crawl_queue WHERE project_id = @projectID)
+		FROM projects
+		WHERE id = @projectID
+		FOR UPDATE
+	`
+	var queued bool
+	err = tx.QueryRow(ctx, lockQuery, args).Scan(&queued)
 	if err != nil {
-		return fmt.Errorf("unable to clean previous crawl results: %w", err)
+		return fmt.Errorf("unable to check crawl queue: %w", err)
+	}
+	if queued {
+		return ErrCrawlQueued
 	}
 
-	// Delete existing notifications for this project
-	notificationRepo := notifications.NewRepository(r.db)
-	notificationService := notifications.NewService(notificationRepo)
-	err = notificationService.DeleteByProjectID(ctx, projectID)
+	// Reset the progress row maintained by the crawler; no job of the
+	// project is queued or running at this point
+	progressQuery := `
+		DELETE FROM crawl_progress
+		WHERE project_id = @projectID
+	`
+	_, err = tx.Exec(ctx, progressQuery, args)
 	if err != nil {
-		return fmt.Errorf("unable to clean previous notifications: %w", err)
+		return fmt.Errorf("unable to reset crawl progress: %w", err)
 	}
 
 	// Then add the new crawl job to the queue
@@ -56,65 +78,106 @@ func (r *Repository) Create(ctx context.Context, projectID int) error {
 		INSERT INTO crawl_queue (project_id, time_start)
 		VALUES (@projectID, NOW())
 	`
-	insertArgs := pgx.NamedArgs{
-		"projectID": projectID,
+	_, err = tx.Exec(ctx, insertQuery, args)
+	if err != nil {
+		return fmt.Errorf("unable to create crawl job: %w", err)
 	}
 
-	_, err = r.db.Exec(ctx, insertQuery, insertArgs)
-	if err != nil {
+	if err := tx.Commit(ctx); err != nil {
 		return fmt.Errorf("unable to create crawl job: %w", err)
 	}
 
 	return nil
 }
 
-// GetStatus retrieves the status of a crawl job for a project
-func (r *Repository) GetStatus(ctx context.Context, projectID int) (string, int, error) {
-	// First check if there's an entry in the crawl_queue table
-	queueQuery := `
-		SELECT COUNT(*) FROM crawl_queue
+// Cancel stops a project's crawl. Jobs the crawler hasn't started yet are
+// removed from the queue; started jobs are flagged and stopped by the crawler
+// between pages, keeping the pages crawled so far.
+func (r *Repository) Cancel(ctx context.Context, projectID int) error {
+	// started_at is set by the worker that claims the job, so a job that is
+	// picked up concurrently is flagged instead of deleted
+	deleteQuery := `
+		DELETE FROM crawl_queue
 		WHERE project_id = @projectID
+		AND started_at IS NULL
 	`
-	queueArgs := pgx.NamedArgs{
+	deleteArgs := pgx.NamedArgs{
 		"projectID": projectID,
 	}
 
-	var queueCount int
-	err := r.db.QueryRow(ctx, queueQuery, queueArgs).Scan(&queueCount)
+	_, err := r.db.Exec(ctx, deleteQuery, deleteArgs)
 	if err != nil {
-		return "unknown", 0, fmt.Errorf("unable to check crawl queue: %w", err)
+		return fmt.Errorf("unable to remove queued crawl job: %w", err)
 	}
 
-	// Check for entries in crawl_result table
-	resultQuery := `
-		SELECT COUNT(*) FROM crawl_result
+	cancelQuery := `
+		UPDATE crawl_queue
+		SET cancel_requested = TRUE
 		WHERE project_id = @projectID
 	`
-	resultArgs := pgx.NamedArgs{
+	cancelArgs := pgx.NamedArgs{
+		"projectID": projectID,
+	}
+
+	_, err = r.db.Exec(ctx, cancelQuery, cancelArgs)
+	if err != nil {
+		return fmt.Errorf("unable to cancel crawl job: %w", err)
+	}
+
+	return nil
+}
+
+// GetStatus retrieves the status of a crawl job for a project
+func (r *Repository) GetStatus(ctx context.Context, projectID int) (string, int, error) {
+	// Read the queue entry and the progress row maintained by the crawler in one
+	// lookup instead of counting crawl_result rows
+	statusQuery := `
+		SELECT
+			EXISTS (SELECT 1 FROM crawl_queue WHERE project_id = @projectID),
+			(SELECT pages_saved FROM crawl_progress WHERE project_id = @projectID)
+	`
+	args := pgx.NamedArgs{
 		"projectID": projectID,
 	}
 
-	var resultCount int
-	err = r.db.QueryRow(ctx, resultQuery, resultArgs).Scan(&resultCount)
+	var queued bool
+	var pagesSaved *int
+	err := r.db.QueryRow(ctx, statusQuery, args).Scan(&queued, &pagesSaved)
 	if err != nil {
-		return "unknown", 0, fmt.Errorf("unable to check crawl results: %w", err)
+		return "unknown", 0, fmt.Errorf("unable to check crawl progress: %w", err)
 	}
 
-	// Determine status based on queue and result counts
-	if queueCount > 0 {
+	resultCount := 0
+	if pagesSaved != nil {
+		resultCount = *pagesSaved
+	} else if !queued {
+		// Projects crawled before progress tracking existed have no progress row
+		resultQuery := `
+			SELECT COUNT(*) FROM crawl_result
+			WHERE project_id = @projectID
+			AND generation = (SELECT active_generation FROM projects WHERE id = @projectID)
+		`
+		err = r.db.QueryRow(ctx, resultQuery, args).Scan(&resultCount)
+		if err != nil {
+			return "unknown", 0, fmt.Errorf("unable to check crawl results: %w", err)
+		}
+	}
+
+	// Determine status based on queue entry and pages saved
+	if queued {
 		if resultCount == 0 {
-			// Entry in crawl_queue, but none in crawl_results
+			// Entry in crawl_queue, nothing saved yet
 			return "queued", 0, nil
 		} else {
-			// Entry in crawl_queue, at least one entry in crawl_results
+			// Entry in crawl_queue, at least one page saved
 			return "in progress", resultCount, nil
 		}
 	} else {
 		if resultCount > 0 {
-			// No entry in crawl_queue, at least one entry in crawl_results
+			// No entry in crawl_queue, at least one page saved
 			return "completed", resultCount, nil
 		} else {
-			// No entries in either table
+			// No queue entry and nothing saved
 			return "not_started", 0, nil
 		}
 	}
@@ -137,6 +200,11 @@ func (s *Service) Create(ctx context.Context, projectID int) error {
 	return s.repo.Create(ctx, projectID)
 }
 
+// Cancel stops a project's queued or running crawl
+func (s *Service) Cancel(ctx context.Context, projectID int) error {
+	return s.repo.Cancel(ctx, projectID)
+}
+
 // GetStatus retrieves the status of a crawl job for a project
 func (s *Service) GetStatus(ctx context.Context, projectID int) (string, int, error) {
 	return s.repo.GetStatus(ctx, projectID)
@@ -14,6 +14,17 @@ type PageMetrics struct {
 	RenderTime float64 `json:"renderTime"`
 }
 
+// PageLinks represents the link-structure metrics of a page in the site graph
+type PageLinks struct {
+	URL        string  `json:"url"`
+	Crawled    bool    `json:"crawled"`
+	Inlinks    int     `json:"inlinks"`
+	Outlinks   int     `json:"outlinks"`
+	ClickDepth *int    `json:"clickDepth"`
+	PageRank   float64 `json:"pageRank"`
+	Orphan     bool    `json:"orphan"`
+}
+
 // Repository handles database operations for crawl results
 type Repository struct {
 	db *pgx.Conn
@@ -32,6 +43,7 @@ func (r *Repository) GetResults(ctx context.Context, projectID int) ([]PageMetri
 		SELECT url, ttfb_ms, render_time_ms
 		FROM crawl_result
 		WHERE project_id = @projectID
+		AND generation = (SELECT active_generation FROM projects WHERE id = @projectID)
 		ORDER BY render_time_ms DESC
 	`
 	args := pgx.NamedArgs{
@@ -71,6 +83,45 @@ func (r *Repository) GetResults(ctx context.Context, projectID int) ([]PageMetri
 	return results, nil
 }
 
+// GetLinks retrieves the link graph metrics of a project's pages, highest PageRank first
+func (r *Repository) GetLinks(ctx context.Context, projectID int) ([]PageLinks, error) {
+	query := `
+		SELECT url, crawled, inlinks, outlinks, click_depth, pagerank
+		FROM crawl_link_nodes
+		WHERE project_id = @projectID
+		AND generation = (SELECT active_generation FROM projects WHERE id = @projectID)
+		ORDER BY pagerank DESC
+	`
+	args := pgx.NamedArgs{
+		"projectID": projectID,
+	}
+
+	rows, err := r.db.Query(ctx, query, args)
+	if err != nil {
+		return nil, fmt.Errorf("unable to query link graph: %w", err)
+	}
+	defer rows.Close()
+
+	var results []PageLinks
+	for rows.Next() {
+		var page PageLinks
+		if err := rows.Scan(&page.URL, &page.Crawled, &page.Inlinks, &page.Outlinks, &page.ClickDepth, &page.PageRank); err != nil {
+			return nil, fmt.Errorf("error scanning link graph node: %w", err)
+		}
+
+		// Crawled pages nothing links to, other than the start page
+		page.Orphan = page.Crawled && page.Inlinks == 0 && (page.ClickDepth == nil || *page.ClickDepth != 0)
+
+		results = append(results, page)
+	}
+
+	if err := rows.Err(); err != nil {
+		return nil, fmt.Errorf("error iterating link graph: %w", err)
+	}
+
+	return results, nil
+}
+
 // Service handles business logic for crawl results operations
 type Service struct {
 	repo *Repository
@@ -86,4 +137,9 @@ func NewService(repo *Repository) *Service {
 // GetResults retrieves the performance metrics for a project's crawled pages
 func (s *Service) GetResults(ctx context.Context, projectID int) ([]PageMetrics, error) {
 	return s.repo.GetResults(ctx, projectID)
-} 
\ No newline at end of file
+} 
+
+// GetLinks retrieves the link graph metrics of a project's pages
+func (s *Service) GetLinks(ctx context.Context, projectID int) ([]PageLinks, error) {
+	return s.repo.GetLinks(ctx, projectID)
+}
\ No newline at end of file
@@ -19,6 +19,18 @@ type Notification struct {
 	Timestamp time.Time `json:"timestamp"`
 }
 
+// NotificationGroup is a notification that repeats on many pages, stored once
+// per (category, subject) with the number of affected pages and a sample of them
+type NotificationGroup struct {
+	ProjectID int       `json:"projectId"`
+	Category  string    `json:"category"`
+	Subject   string    `json:"subject"`
+	Message   string    `json:"message"`
+	URLCount  int       `json:"urlCount"`
+	URLs      []string  `json:"urls"`
+	Timestamp time.Time `json:"timestamp"`
+}
+
 type Repository struct {
 	db *pgx.Conn
 }
@@ -35,6 +47,7 @@ func (r *Repository) GetByProjectID(ctx context.Context, projectID int) ([]Notif
 		SELECT id, project_id, url, category, message, timestamp 
 		FROM project_notifications 
 		WHERE project_id = @projectId
+		AND generation = (SELECT active_generation FROM projects WHERE id = @projectId)
 		ORDER BY timestamp DESC
 	`
 	args := pgx.NamedArgs{
@@ -70,6 +83,49 @@ func (r *Repository) GetByProjectID(ctx context.Context, projectID int) ([]Notif
 	return notifications, nil
 }
 
+// GetGroupsByProjectID retrieves the aggregated notification groups of a project
+func (r *Repository) GetGroupsByProjectID(ctx context.Context, projectID int) ([]NotificationGroup, error) {
+	query := `
+		SELECT project_id, category, subject, message, url_count, urls, timestamp
+		FROM project_notification_groups
+		WHERE project_id = @projectId
+		AND generation = (SELECT active_generation FROM projects WHERE id = @projectId)
+		ORDER BY url_count DESC
+	`
+	args := pgx.NamedArgs{
+		"projectId": projectID,
+	}
+
+	rows, err := r.db.Query(ctx, query, args)
+	if err != nil {
+		return nil, fmt.Errorf("unable to query notification groups: %w", err)
+	}
+	defer rows.Close()
+
+	var groups []NotificationGroup
+	for rows.Next() {
+		var group NotificationGroup
+		if err := rows.Scan(
+			&group.ProjectID,
+			&group.Category,
+			&group.Subject,
+			&group.Message,
+			&group.URLCount,
+			&group.URLs,
+			&group.Timestamp,
+		); err != nil {
+			return nil, fmt.Errorf("unable to scan notification group: %w", err)
+		}
+		groups = append(groups, group)
+	}
+
+	if err := rows.Err(); err != nil {
+		return nil, fmt.Errorf("error iterating notification groups: %w", err)
+	}
+
+	return groups, nil
+}
+
 // DeleteByProjectID deletes all notifications for a specific project
 func (r *Repository) DeleteByProjectID(ctx context.Context, projectID int) error {
 	query := `
@@ -100,9 +156,42 @@ func NewService(repo *Repository) *Service {
 	}
 }
 
-// GetByProjectID gets notifications for a project
+// GetByProjectID gets notifications for a project, with each aggregated group
+// returned as a single notification on the first affected page
 func (s *Service) GetByProjectID(ctx context.Context, projectID int) ([]Notification, error) {
-	return s.repo.GetByProjectID(ctx, projectID)
+	notifications, err := s.repo.GetByProjectID(ctx, projectID)
+	if err != nil {
+		return nil, err
+	}
+
+	groups, err := s.repo.GetGroupsByProjectID(ctx, projectID)
+	if err != nil {
+		return nil, err
+	}
+
+	for _, group := range groups {
+		if len(group.URLs) == 0 {
+			continue
+		}
+		message := group.Message
+		if group.URLCount > 1 {
+			message = fmt.Sprintf("%s (found on %d pages)", group.Message, group.URLCount)
+		}
+		notifications = append(notifications, Notification{
+			ProjectID: group.ProjectID,
+			URL:       group.URLs[0],
+			Category:  group.Category,
+			Message:   message,
+			Timestamp: group.Timestamp,
+		})
+	}
+
+	return notifications, nil
+}
+
+// GetGroupsByProjectID gets the aggregated notification groups for a project
+func (s *Service) GetGroupsByProjectID(ctx context.Context, projectID int) ([]NotificationGroup, error) {
+	return s.repo.GetGroupsByProjectID(ctx, projectID)
 }
 
 // DeleteByProjectID deletes all notifications for a project
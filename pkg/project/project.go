@@ -8,12 +8,29 @@ import (
 	"github.com/jackc/pgx/v5"
 )
 
+// CrawlSettings holds the per-project crawl rules read by the crawler.
+// Patterns match the full URL and are globs or regexes prefixed with "re:".
+// Scope is "domain" (all hosts of the registrable domain) or "host";
+// AllowedHosts adds hosts, with "*.example.org" for all subdomains.
+// PageWait is "dom", "network_idle" or "load", PageLoadTimeout in seconds.
+type CrawlSettings struct {
+	IncludePatterns  []string `json:"include_patterns,omitempty"`
+	ExcludePatterns  []string `json:"exclude_patterns,omitempty"`
+	Scope            string   `json:"scope,omitempty"`
+	AllowedHosts     []string `json:"allowed_hosts,omitempty"`
+	Distributed      *bool    `json:"distributed,omitempty"`
+	PageWait         string   `json:"page_wait,omitempty"`
+	PageLoadTimeout  float64  `json:"page_load_timeout,omitempty"`
+	PageWaitEscalate *bool    `json:"page_wait_escalate,omitempty"`
+}
+
 // Project represents a project entity
 type Project struct {
-	ID        int        `json:"id"`
-	UserID    string     `json:"userid"`
-	URL       string     `json:"url"`
-	LastCrawl *time.Time `json:"lastcrawl,omitempty"`
+	ID            int           `json:"id"`
+	UserID        string        `json:"userid"`
+	URL           string        `json:"url"`
+	LastCrawl     *time.Time    `json:"lastcrawl,omitempty"`
+	CrawlSettings CrawlSettings `json:"crawlsettings"`
 }
 
 // Repository handles database operations for projects
@@ -31,7 +48,7 @@ func NewRepository(db *pgx.Conn) *Repository {
 // GetByID retrieves a project by ID
 func (r *Repository) GetByID(ctx context.Context, id int) (*Project, error) {
 	query := `
-		SELECT id, user_id, url, last_crawl
+		SELECT id, user_id, url, last_crawl, COALESCE(crawl_settings, '{}')
 		FROM projects 
 		WHERE id = @id
 	`
@@ -45,6 +62,7 @@ func (r *Repository) GetByID(ctx context.Context, id int) (*Project, error) {
 		&project.UserID,
 		&project.URL,
 		&project.LastCrawl,
+		&project.CrawlSettings,
 	)
 	if err != nil {
 		return nil, fmt.Errorf("unable to get project: %w", err)
@@ -56,7 +74,7 @@ func (r *Repository) GetByID(ctx context.Context, id int) (*Project, error) {
 // GetByUserID retrieves all projects for a user
 func (r *Repository) GetByUserID(ctx context.Context, userID string) ([]Project, error) {
 	query := `
-		SELECT id, user_id, url, last_crawl
+		SELECT id, user_id, url, last_crawl, COALESCE(crawl_settings, '{}')
 		FROM projects 
 		WHERE user_id = @userID
 		ORDER BY id DESC
@@ -79,6 +97,7 @@ func (r *Repository) GetByUserID(ctx context.Context, userID string) ([]Project,
 			&project.UserID,
 			&project.URL,
 			&project.LastCrawl,
+			&project.CrawlSettings,
 		); err != nil {
 			return nil, fmt.Errorf("unable to scan project: %w", err)
 		}
@@ -131,6 +150,26 @@ func (r *Repository) Update(ctx context.Context, id int, url string) error {
 	return nil
 }
 
+// UpdateCrawlSettings replaces the crawl rules of a project
+func (r *Repository) UpdateCrawlSettings(ctx context.Context, id int, settings CrawlSettings) error {
+	query := `
+		UPDATE projects
+		SET crawl_settings = @settings
+		WHERE id = @id
+	`
+	args := pgx.NamedArgs{
+		"id":       id,
+		"settings": settings,
+	}
+
+	_, err := r.db.Exec(ctx, query, args)
+	if err != nil {
+		return fmt.Errorf("unable to update crawl settings: %w", err)
+	}
+
+	return nil
+}
+
 // Delete removes a project
 func (r *Repository) Delete(ctx context.Context, id int) error {
 	query := `
@@ -181,6 +220,11 @@ func (s *Service) Update(ctx context.Context, id int, url string) error {
 	return s.repo.Update(ctx, id, url)
 }
 
+// UpdateCrawlSettings replaces the crawl rules of a project
+func (s *Service) UpdateCrawlSettings(ctx context.Context, id int, settings CrawlSettings) error {
+	return s.repo.UpdateCrawlSettings(ctx, id, settings)
+}
+
 // Delete removes a project
 func (s *Service) Delete(ctx context.Context, id int) error {
 	return s.repo.Delete(ctx, id)